@@ -1,19 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, make_response
+from flask.cli import AppGroup
+import click
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
 import os
 import math
 import uuid
 from markupsafe import escape, Markup
 import threading
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
 import io
 import secrets
 import time
+import atexit
+import json
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
 from functools import wraps
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
@@ -25,22 +30,90 @@ CONTACT_EMAIL = "fees@annauniv.edu"
 CONTACT_PHONE = "+91-44-2235-8000"
 WEBSITE_URL = "www.annauniv.edu"
 
+RECEIPT_LETTERHEAD = {
+    'name': UNIVERSITY_NAME,
+    'subtitle': UNIVERSITY_SUBTITLE,
+    'address': UNIVERSITY_ADDRESS,
+    'email': CONTACT_EMAIL,
+    'phone': CONTACT_PHONE,
+    'website': WEBSITE_URL
+}
+
 # Email configuration
 EMAIL_CONFIG = {
     'smtp_server': 'smtp.gmail.com',
     'smtp_port': 587,
     'email': 'edupay.system@gmail.com',  # Replace with your email
-    'password': 'your_app_password'      # Replace with your app password
+    'password': 'your_app_password',     # Replace with your app password
+    'use_tls': True,
+    # Background delivery (see mailer.py)
+    'workers': 2,
+    'queue_size': 1000,
+    'max_attempts': 4,
+    'retry_backoff': 2.0
+}
+# Point at a local debugging server, e.g. `python -m aiosmtpd -n -l localhost:1025`
+if os.getenv('SMTP_SERVER'):
+    EMAIL_CONFIG.update({
+        'smtp_server': os.getenv('SMTP_SERVER'),
+        'smtp_port': int(os.getenv('SMTP_PORT', '25')),
+        'use_tls': os.getenv('SMTP_USE_TLS', 'False').lower() == 'true',
+        'password': os.getenv('SMTP_PASSWORD', '')
+    })
+
+# Bulk reminders: 'outbox' keeps messages locally, 'smtp' sends email with EMAIL_CONFIG
+REMINDER_CONFIG = {
+    'email_delivery': os.getenv('REMINDER_EMAIL_DELIVERY', 'outbox'),
+    'rates': {'email': 20, 'sms': 10},  # messages per second per channel
+    'batch_size': 200
 }
 
-def send_receipt_email(student_email, student_name, receipt_pdf, transaction_id, amount):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_CONFIG['email']
-        msg['To'] = student_email
-        msg['Subject'] = f'Payment Receipt - Transaction #{transaction_id}'
-        
-        body = f"""
+# Invoice due dates: due soon within due_soon_days, overdue the day after
+SCHEDULER_CONFIG = {
+    'due_soon_days': 7,
+    'tick_seconds': 60,
+    'auto_reminders': os.getenv('AUTO_REMINDERS', 'on').lower() == 'on'
+}
+
+# Payment gateways: calls give up after deadline seconds; a provider with
+# max_in_flight calls outstanding is reported busy instead of queueing more
+GATEWAY_CONFIG = {
+    'gateways': {
+        'razorpay': {
+            'key_id': os.getenv('RAZORPAY_KEY_ID', ''),
+            'key_secret': os.getenv('RAZORPAY_KEY_SECRET', ''),
+            'base_url': os.getenv('RAZORPAY_BASE_URL')
+        },
+        'stripe': {
+            'secret_key': os.getenv('STRIPE_SECRET_KEY', ''),
+            'publishable_key': os.getenv('STRIPE_PUBLISHABLE_KEY', ''),
+            'base_url': os.getenv('STRIPE_BASE_URL')
+        },
+        'paypal': {
+            'client_id': os.getenv('PAYPAL_CLIENT_ID', ''),
+            'client_secret': os.getenv('PAYPAL_CLIENT_SECRET', ''),
+            'base_url': os.getenv('PAYPAL_BASE_URL')
+        }
+    },
+    'deadline': float(os.getenv('GATEWAY_DEADLINE', '8')),
+    'max_in_flight': 32
+}
+
+# Password/passcode hashing (calibrate with `python hashing.py --target-ms 250`)
+HASHING_CONFIG = {
+    'method': os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+    'workers': 4,
+    'max_queue': 64,
+    'timeout': 10
+}
+
+def build_receipt_email(student_email, student_name, receipt_pdf, transaction_id, amount):
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_CONFIG['email']
+    msg['To'] = student_email
+    msg['Subject'] = f'Payment Receipt - Transaction #{transaction_id}'
+    
+    body = f"""
 Dear {student_name},
 
 Thank you for your payment! Your transaction has been processed successfully.
@@ -55,26 +128,43 @@ Please find your official receipt attached to this email.
 Best regards,
 Anna University Payment System
 """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Attach PDF receipt
-        pdf_attachment = MIMEApplication(receipt_pdf, _subtype='pdf')
-        pdf_attachment.add_header('Content-Disposition', 'attachment', filename=f'Receipt_{transaction_id}.pdf')
-        msg.attach(pdf_attachment)
-        
-        # Send email
-        server = smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'])
-        server.starttls()
-        server.login(EMAIL_CONFIG['email'], EMAIL_CONFIG['password'])
-        server.send_message(msg)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        print(f"Email sending failed: {e}")
-        return False
-from pymongo import MongoClient
+    
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Attach PDF receipt
+    pdf_attachment = MIMEApplication(receipt_pdf, _subtype='pdf')
+    pdf_attachment.add_header('Content-Disposition', 'attachment', filename=f'Receipt_{transaction_id}.pdf')
+    msg.attach(pdf_attachment)
+    
+    return msg
+
+from ledger import TransactionLedger
+from user_store import UserStore
+from repository import InMemoryRepository, MongoRepository
+from mailer import ReceiptMailer
+from receipts import ReceiptEngine
+from receipt_cache import ReceiptCache, receipt_key
+from receipt_export import get_pool, shutdown_pool, stream_receipts_zip
+from exports import EXPORT_FORMATS, INVOICE_FIELDS, TRANSACTION_FIELDS, encode_rows
+from hashing import HashingBusy, PasswordHasher
+from rate_limit import RateLimiter
+from locks import LockStripes
+from user_directory import UserDirectory
+from student_summary import StudentSummary
+from student_index import InvalidCursor, SORT_FIELDS, StudentIndex
+from rollups import RollupCube
+from reminders import OutboxChannel, ReminderDispatcher, SMTPEmailChannel
+from reminder_log import ReminderLog
+from scheduler import DUE_SOON, OVERDUE, InvoiceScheduler
+from fee_structure import FEE_COMPONENTS, FeeStructure
+from page_cache import PageCache
+from payment_service import GatewayBusy, PaymentGateway
+
+# Receipt render workers re-run the main script as __mp_main__ before they
+# start (`python app.py`). They only need the receipt code, so the startup
+# that connects to storage, seeds demo accounts and starts the scheduler is
+# skipped there.
+RENDER_WORKER = __name__ == '__mp_main__'
 
 app = Flask(__name__)
 # Use a fixed secret key from environment or generate once and persist
@@ -89,14 +179,34 @@ else:
     app.secret_key = secret_key
 
 # MongoDB connection
-try:
-    mongo_client = MongoClient('mongodb://localhost:27017/')
-    db = mongo_client['edupay']
-    payments_collection = db['payments']
-except:
-    mongo_client = None
-    db = None
-    payments_collection = None
+MONGO_CONFIG = {
+    'enabled': os.getenv('EDUPAY_STORAGE', 'memory').lower() == 'mongo',
+    'uri': os.getenv('MONGO_URI', 'mongodb://localhost:27017/'),
+    'database': 'edupay',
+    'max_pool_size': 50,
+    'min_pool_size': 5,
+    'batch_size': 500,
+    'flush_interval': 0.5,
+    # Writes queued during an outage beyond max_pending are spilled here
+    'max_pending': 50000,
+    'spill_path': os.getenv('MONGO_SPILL_FILE', 'mongo_spill.jsonl')
+}
+
+repository = InMemoryRepository()
+if MONGO_CONFIG['enabled'] and not RENDER_WORKER:
+    try:
+        repository = MongoRepository.connect(
+            MONGO_CONFIG['uri'],
+            MONGO_CONFIG['database'],
+            max_pool_size=MONGO_CONFIG['max_pool_size'],
+            min_pool_size=MONGO_CONFIG['min_pool_size'],
+            batch_size=MONGO_CONFIG['batch_size'],
+            flush_interval=MONGO_CONFIG['flush_interval'],
+            max_pending=MONGO_CONFIG['max_pending'],
+            spill_path=MONGO_CONFIG['spill_path']
+        )
+    except Exception as e:
+        print(f"MongoDB unavailable, falling back to in-memory storage: {e}")
 app.config['SESSION_COOKIE_SECURE'] = False
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
@@ -113,18 +223,23 @@ def add_security_headers(response):
     response.headers['Content-Security-Policy'] = "default-src 'self'; style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; script-src 'self' https://cdn.jsdelivr.net; font-src 'self' https://fonts.gstatic.com; connect-src 'self'"
     return response
 
-# Rate limiting storage
-login_attempts = {}
+# Rate limiting: per-process memory by default, or a SQLite file shared by all workers
+RATE_LIMIT_CONFIG = {
+    'backend': os.getenv('RATE_LIMIT_BACKEND', 'memory'),
+    'path': os.getenv('RATE_LIMIT_DB', 'rate_limits.sqlite3'),
+    'max_keys': 100000
+}
+rate_limiter = RateLimiter.from_config(RATE_LIMIT_CONFIG)
+atexit.register(rate_limiter.close)
 
 def rate_limit_check(key, max_attempts=5, window=300):
-    now = time.time()
-    if key not in login_attempts:
-        login_attempts[key] = []
-    login_attempts[key] = [attempt for attempt in login_attempts[key] if now - attempt < window]
-    if len(login_attempts[key]) >= max_attempts:
-        return False
-    login_attempts[key].append(now)
-    return True
+    return rate_limiter.hit(key, max_attempts, window)
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(error):
+    # Every worker is busy hashing; ask the user to retry rather than queue
+    flash('The server is busy right now. Please try again in a moment.', 'warning')
+    return redirect(request.path)
 
 def require_auth(f):
     @wraps(f)
@@ -134,43 +249,132 @@ def require_auth(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Persistent data storage
-import json
+# Rendered pages, invalidated by tag: 'payments', 'invoices', 'students', 'fees'
+page_cache = PageCache(max_entries=256)
+
+def viewer_role():
+    """Who a page is rendered for; cached pages are only shared within a role"""
+    if session.get('user_type') == 'institution':
+        return 'institution', session.get('user_data', {}).get('name')
+    if session.get('user_type') == 'parent':
+        return 'parent', None
+    if 'username' in session:
+        user = users.get(session['username']) or {}
+        return 'admin' if user.get('is_admin') else 'student', None
+    return session.get('user_type') or 'anonymous', None
+
+def cached_page(*tags, daily=False):
+    """Serve a GET page from page_cache, with ETag/Last-Modified revalidation.
+
+    The page is re-rendered after any of tags is invalidated (and each day
+    with daily=True). Redirects, errors and pages with flash messages are
+    never cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+            key = (request.endpoint, request.full_path, viewer_role())
+            if daily:
+                key += (datetime.now().strftime('%Y-%m-%d'),)
+            page = page_cache.get(key, tags)
+            if page is None:
+                versions = page_cache.versions(tags)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or session.get('_flashes'):
+                    return response
+                page = page_cache.put(key, versions, response.get_data(), response.mimetype)
+            response = Response(page.body, mimetype=page.mimetype)
+            response.set_etag(page.etag)
+            response.last_modified = page.last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return decorated_function
+    return decorator
 
+# Persistent data storage
 USER_DATA_FILE = 'user_data.json'
-
-def save_user_data():
-    try:
-        with open(USER_DATA_FILE, 'w') as f:
-            json.dump(users, f, indent=2)
-    except Exception as e:
-        print(f"Error saving user data: {e}")
-
-def load_user_data():
-    try:
-        if os.path.exists(USER_DATA_FILE):
-            with open(USER_DATA_FILE, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading user data: {e}")
-    return {}
+user_store = UserStore(USER_DATA_FILE)
+atexit.register(user_store.close)
+atexit.register(repository.close)
+
+receipt_engine = ReceiptEngine(RECEIPT_LETTERHEAD)
+receipt_cache = ReceiptCache(
+    max_bytes=32 * 1024 * 1024,
+    spill_dir=os.getenv('RECEIPT_CACHE_DIR', 'receipt_cache'),
+    max_disk_bytes=512 * 1024 * 1024
+)
+RECEIPT_EXPORT_CONFIG = {
+    'workers': os.cpu_count(),
+    'batch_size': 25,
+    'max_in_flight': 2 * (os.cpu_count() or 1)
+}
+atexit.register(shutdown_pool)
+receipt_mailer = ReceiptMailer(EMAIL_CONFIG)
+password_hasher = PasswordHasher(**HASHING_CONFIG)
+atexit.register(password_hasher.shutdown)
+# Recent reminders stay in memory; older ones are archived to disk in segments
+reminder_log = ReminderLog(
+    capacity=1000,
+    segment_size=500,
+    archive_dir=os.getenv('REMINDER_ARCHIVE_DIR', 'reminder_archive'),
+    per_student=50
+)
+atexit.register(reminder_log.close)
+reminder_channels = {
+    'email': SMTPEmailChannel(EMAIL_CONFIG) if REMINDER_CONFIG['email_delivery'] == 'smtp' else OutboxChannel('email'),
+    'sms': OutboxChannel('sms')
+}
+reminder_dispatcher = ReminderDispatcher(reminder_channels, REMINDER_CONFIG['rates'], REMINDER_CONFIG['batch_size'])
+atexit.register(reminder_dispatcher.stop, 5)
+atexit.register(receipt_mailer.stop, 5)
 
 # In-memory data stores with thread safety
-users = load_user_data()
-next_user_id = 1
-transactions_data = {}
-invoices_data = {}
-due_reminders = {}
+users = UserDirectory(user_store.load())
+users.update(repository.load_users())
+# Persisted records keep their ids; new accounts are numbered after them
+next_user_id = max((u.get('id', 0) for u in users.values()), default=0) + 1
+def student_profile(user_id):
+    """(course, year) a user's payments are rolled up under"""
+    found = users.by_id(user_id)
+    user = found[1] if found else {}
+    return user.get('course', 'N/A'), user.get('year', 'N/A')
+
+ledger = TransactionLedger()
+for _user_id, _transaction in repository.load_transactions():
+    ledger.append(_user_id, _transaction)
+rollups = RollupCube.rebuild(ledger, student_profile)
+invoices_data = repository.load_invoices()
+student_summary = StudentSummary()
+for _username, _user in users.students():
+    student_summary.open_account(_user['id'])
+for _user_id, _invoices in invoices_data.items():
+    for _invoice in _invoices:
+        if _invoice['status'] == 'Pending':
+            student_summary.invoice_added(_user_id, _invoice['amount'])
+invoice_scheduler = InvoiceScheduler(SCHEDULER_CONFIG['due_soon_days'])
+invoice_events = deque(maxlen=100)
+student_index = StudentIndex(users, student_summary)
+for _username, _user in users.students():
+    student_index.refresh(_user['id'])
 support_messages = []
 notification_templates = {
     'due_reminder': 'Dear {name}, your fee payment of ₹{amount} is due on {due_date}. Please pay at your earliest convenience.',
     'overdue_notice': 'URGENT: Dear {name}, your fee payment of ₹{amount} is overdue. Please pay immediately to avoid penalties.',
     'payment_confirmation': 'Dear {name}, your payment of ₹{amount} has been received and processed successfully.'
 }
+# data_lock guards shared non-account state (support messages);
+# balances, invoices and user records are guarded per account
 data_lock = threading.Lock()
+account_locks = LockStripes(64)
+# rollup_lock keeps each ledger append and its rollup record together,
+# so a rebuild or check never sees one without the other
+rollup_lock = threading.Lock()
 
-# Fee structure storage
-fee_structure_data = {
+# Fee structure storage; every update bumps its version
+fee_structures = FeeStructure({
     'B.E Computer Science': {
         '1st Year': {'tuition': 150000, 'lab': 25000, 'library': 5000, 'activity': 10000},
         '2nd Year': {'tuition': 150000, 'lab': 30000, 'library': 5000, 'activity': 12000},
@@ -183,9 +387,9 @@ fee_structure_data = {
         '3rd Year': {'tuition': 150000, 'lab': 30000, 'library': 5000, 'activity': 15000},
         '4th Year': {'tuition': 150000, 'lab': 35000, 'library': 5000, 'activity': 18000}
     }
-}
+})
 
-# Simple payment gateway mock (replaces payment_service.py)
+# Demo payment gateway for providers without credentials
 class SimplePaymentGateway:
     def get_supported_gateways(self):
         return [
@@ -207,6 +411,11 @@ class SimplePaymentGateway:
         return {'success': True}
 
 payment_gateway = SimplePaymentGateway()
+# Gateways with credentials are called for real; the others keep the demo mock
+gateway_client = PaymentGateway(GATEWAY_CONFIG['gateways'], repository,
+                                deadline=GATEWAY_CONFIG['deadline'],
+                                max_in_flight=GATEWAY_CONFIG['max_in_flight'])
+atexit.register(gateway_client.close)
 
 # Demo accounts
 DEMO_ACCOUNTS = [
@@ -223,7 +432,7 @@ DEMO_ACCOUNTS = [
         'course': 'B.E Computer Science',
         'year': '2nd Year',
         'balance': 150000.00,
-        'passcode_hash': generate_password_hash('1234')
+        'passcode_hash': generate_password_hash('1234', HASHING_CONFIG['method'])
     },
     {
         'username': 'student2',
@@ -238,7 +447,7 @@ DEMO_ACCOUNTS = [
         'course': 'B.E Mechanical Engineering',
         'year': '3rd Year',
         'balance': 200000.00,
-        'passcode_hash': generate_password_hash('1234')
+        'passcode_hash': generate_password_hash('1234', HASHING_CONFIG['method'])
     },
     {
         'username': 'admin',
@@ -254,7 +463,7 @@ DEMO_ACCOUNTS = [
         'year': 'N/A',
         'balance': 500000.00,
         'is_admin': True,
-        'passcode_hash': generate_password_hash('1234')
+        'passcode_hash': generate_password_hash('1234', HASHING_CONFIG['method'])
     }
 ]
 
@@ -289,6 +498,66 @@ def get_current_user():
         return users[session['username']]
     return None
 
+def record_transaction(user_id, transaction):
+    """Append a transaction to the ledger, roll it up and persist it"""
+    with rollup_lock:
+        ledger.append(user_id, transaction)
+        rollups.record(transaction, *student_profile(user_id))
+    repository.append_transaction(user_id, transaction)
+    page_cache.invalidate('payments')
+    return transaction
+
+def save_user(username):
+    """Persist a changed user record"""
+    users.reindex(username)
+    student_index.refresh(users[username]['id'])
+    user_store.mark_dirty(username)
+    repository.save_user(username, users[username])
+    page_cache.invalidate('students')
+
+def apply_invoice_state(invoice, state):
+    invoice['due_soon'] = state in (DUE_SOON, OVERDUE)
+    invoice['overdue'] = state == OVERDUE
+
+def schedule_invoice(user_id, invoice):
+    """Track a pending invoice's due date and set its due_soon/overdue flags"""
+    apply_invoice_state(invoice, invoice_scheduler.track(user_id, invoice['id'], invoice['due_date']))
+
+def on_invoice_transitions(events):
+    """Scheduler listener: flag invoices that became due soon or overdue and remind their students"""
+    invoice_events.extend(events)
+    changed = {}
+    for event in events:
+        user_id = event['user_id']
+        with account_locks.for_key(user_id):
+            invoice = next((inv for inv in invoices_data.get(user_id, []) if inv['id'] == event['invoice_id']), None)
+            if invoice is None or invoice['status'] != 'Pending':
+                continue
+            apply_invoice_state(invoice, event['type'])
+            repository.update_invoice(user_id, invoice)
+        changed.setdefault(event['type'], {})[user_id] = None
+    if not SCHEDULER_CONFIG['auto_reminders']:
+        return
+    for state, user_ids in changed.items():
+        message_type = 'overdue_notice' if state == OVERDUE else 'due_reminder'
+        recipients = []
+        for user_id in user_ids:
+            found = users.by_id(user_id)
+            if found and found[1].get('email'):
+                recipients.append({'user_id': user_id, 'name': found[1]['name'], 'channel': 'email', 'address': found[1]['email']})
+        if not recipients:
+            continue
+        job = reminder_dispatcher.submit(
+            recipients,
+            lambda batch, message_type=message_type: render_reminders(batch, message_type, ''),
+            type='automatic',
+            target='students',
+            message=notification_templates[message_type],
+            message_type=message_type,
+            count=len(recipients)
+        )
+        reminder_log.add(job, student_ids=list(user_ids))
+
 def create_student_invoices(user_id):
     today = datetime.now().date()
     due_date_1 = today + timedelta(days=15)
@@ -303,7 +572,7 @@ def create_student_invoices(user_id):
             'amount': 150000.00,
             'status': 'Pending',
             'paid_date': None,
-            'due_soon': (due_date_1 - today).days <= 7
+            'due_soon': False
         },
         {
             'id': str(uuid.uuid4()),
@@ -313,10 +582,18 @@ def create_student_invoices(user_id):
             'amount': 12050.00,
             'status': 'Pending',
             'paid_date': None,
-            'due_soon': (due_date_2 - today).days <= 7
+            'due_soon': False
         }
     ]
-    invoices_data[user_id] = invoices
+    with account_locks.for_key(user_id):
+        for invoice in invoices:
+            schedule_invoice(user_id, invoice)
+        invoices_data[user_id] = invoices
+        repository.add_invoices(user_id, invoices)
+        for invoice in invoices:
+            student_summary.invoice_added(user_id, invoice['amount'])
+        student_index.refresh(user_id)
+    page_cache.invalidate('invoices')
 
 def initialize_demo_accounts():
     global next_user_id
@@ -324,7 +601,7 @@ def initialize_demo_accounts():
         for account in DEMO_ACCOUNTS:
             if account['username'] not in users:
                 users[account['username']] = {
-                    'password_hash': generate_password_hash(account['password']),
+                    'password_hash': generate_password_hash(account['password'], HASHING_CONFIG['method']),
                     'name': account['name'],
                     'email': account['email'],
                     'phone': account.get('phone', 'N/A'),
@@ -337,16 +614,30 @@ def initialize_demo_accounts():
                     'balance': account['balance'],
                     'id': next_user_id,
                     'is_admin': account.get('is_admin', False),
-                    'passcode_hash': account.get('passcode_hash', generate_password_hash('1234'))
+                    'passcode_hash': account.get('passcode_hash') or generate_password_hash('1234', HASHING_CONFIG['method'])
                 }
-                transactions_data[next_user_id] = []
+                repository.save_user(account['username'], users[account['username']])
+                ledger.open_account(next_user_id)
+                if not account.get('is_admin', False):
+                    student_summary.open_account(next_user_id)
                 create_student_invoices(next_user_id)
                 next_user_id += 1
     except Exception as e:
         print(f"Error initializing demo accounts: {e}")
 
 # Initialize data
-initialize_demo_accounts()
+if not RENDER_WORKER:
+    for _user_id, _invoices in invoices_data.items():
+        for _invoice in _invoices:
+            if _invoice['status'] == 'Pending':
+                try:
+                    schedule_invoice(_user_id, _invoice)
+                except ValueError:
+                    print(f"Invoice {_invoice['id']} has an invalid due date: {_invoice['due_date']}")
+    initialize_demo_accounts()
+    invoice_scheduler.subscribe(on_invoice_transitions)
+    invoice_scheduler.start(SCHEDULER_CONFIG['tick_seconds'])
+    atexit.register(invoice_scheduler.stop)
 
 
 
@@ -355,6 +646,7 @@ initialize_demo_accounts()
 
 
 @app.route('/')
+@cached_page()
 def home():
     return render_template('home.html')
 
@@ -428,7 +720,12 @@ def login():
 
         # Check student/admin accounts
         user = users.get(username)
-        if user and check_password_hash(user['password_hash'], password):
+        matches, new_hash = password_hasher.verify(user['password_hash'], password) if user else (False, None)
+        if matches:
+            if new_hash:
+                with account_locks.for_key(user['id']):
+                    user['password_hash'] = new_hash
+                save_user(username)
             session['username'] = username
             session['login_time'] = time.time()
             session.permanent = True
@@ -465,11 +762,7 @@ def dashboard():
         return redirect(url_for('login'))
 
     user_id = user['id']
-    transactions = sorted(
-        transactions_data.get(user_id, []),
-        key=lambda x: x['date'],
-        reverse=True
-    )[:5]
+    transactions, older_before = ledger.history(user_id, limit=5)
     
     pending_invoices = [inv for inv in invoices_data.get(user_id, []) if inv['status'] == 'Pending']
     
@@ -477,9 +770,23 @@ def dashboard():
         'dashboard.html',
         user=user,
         transactions=transactions,
+        older_before=older_before,
         invoices=pending_invoices
     )
 
+@app.route('/api/transactions')
+@require_auth
+def api_transactions():
+    """Older transactions for the logged-in student, newest first"""
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Please log in first'}), 401
+    
+    before = request.args.get('before', type=int)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    transactions, next_before = ledger.history(user['id'], before=before, limit=limit)
+    return jsonify({'transactions': transactions, 'next_before': next_before})
+
 @app.route('/make_payment', methods=['GET', 'POST'])
 @require_auth
 def make_payment():
@@ -499,21 +806,21 @@ def make_payment():
             flash('Invalid amount', 'danger')
             return redirect(url_for('make_payment'))
 
-        if user['balance'] < amount:
-            flash('Insufficient funds', 'danger')
-            return redirect(url_for('make_payment'))
-
-        # Record transaction with thread safety
+        # Check and debit the balance under the account's lock
         description = escape(request.form.get('description', 'Payment'))
-        with data_lock:
+        with account_locks.for_key(user['id']):
+            if user['balance'] < amount:
+                flash('Insufficient funds', 'danger')
+                return redirect(url_for('make_payment'))
             transaction = {
                 'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'description': description,
                 'amount': -amount,
                 'balance': user['balance'] - amount
             }
-            transactions_data[user['id']].append(transaction)
+            record_transaction(user['id'], transaction)
             user['balance'] -= amount
+            save_user(session['username'])
 
         flash('Payment successful!', 'success')
         return redirect(url_for('dashboard'))
@@ -544,25 +851,42 @@ def pay_invoice(invoice_id):
     passcode = request.form.get('passcode', '').strip()
     
     # Check against user's stored passcode hash
-    if not check_password_hash(user['passcode_hash'], passcode):
+    matches, new_hash = password_hasher.verify(user['passcode_hash'], passcode)
+    if not matches:
         flash('Invalid passcode. Please try again.', 'danger')
         return render_template('confirm_payment.html', invoice=invoice, user=user)
+    if new_hash:
+        with account_locks.for_key(user_id):
+            user['passcode_hash'] = new_hash
+        save_user(session['username'])
     
-    # Record payment
+    # Record payment; re-check under the lock in case a parallel request paid it first
     payment_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     transaction_id = str(uuid.uuid4())[:8].upper()
     
-    transaction = {
-        'date': payment_date,
-        'description': f"Invoice Payment: {invoice['description']}",
-        'amount': -invoice['amount'],
-        'balance': user['balance'] - invoice['amount'],
-        'transaction_id': transaction_id
-    }
-    transactions_data[user_id].append(transaction)
-    user['balance'] -= invoice['amount']
-    invoice['status'] = 'Paid'
-    invoice['paid_date'] = datetime.now().strftime('%Y-%m-%d')
+    with account_locks.for_key(user_id):
+        if invoice['status'] == 'Paid':
+            flash('Invoice has already been paid', 'warning')
+            return redirect(url_for('dashboard'))
+        if user['balance'] < invoice['amount']:
+            flash('Insufficient funds', 'danger')
+            return redirect(url_for('dashboard'))
+        transaction = {
+            'date': payment_date,
+            'description': f"Invoice Payment: {invoice['description']}",
+            'amount': -invoice['amount'],
+            'balance': user['balance'] - invoice['amount'],
+            'transaction_id': transaction_id
+        }
+        record_transaction(user_id, transaction)
+        user['balance'] -= invoice['amount']
+        invoice['status'] = 'Paid'
+        invoice['paid_date'] = datetime.now().strftime('%Y-%m-%d')
+        repository.update_invoice(user_id, invoice)
+        student_summary.invoice_paid(user_id, invoice['amount'])
+        save_user(session['username'])
+        invoice_scheduler.untrack(invoice['id'])
+    page_cache.invalidate('invoices')
 
     # Store payment info for PDF generation
     session['last_payment'] = {
@@ -575,126 +899,48 @@ def pay_invoice(invoice_id):
         'user_id': user['id']
     }
     
-    # Generate and email receipt
-    try:
-        receipt_pdf = generate_receipt_pdf(session['last_payment'], user)
-        email_sent = send_receipt_email(user['email'], user['name'], receipt_pdf, transaction_id, invoice['amount'])
-        if email_sent:
-            flash('Invoice paid successfully! Receipt has been emailed to you.', 'success')
-        else:
-            flash('Invoice paid successfully! Receipt email failed - you can download it from the dashboard.', 'warning')
-    except Exception as e:
-        print(f"Receipt generation/email error: {e}")
+    # Render and email the receipt in the background
+    payment = dict(session['last_payment'])
+    amount = invoice['amount']
+
+    def build_message():
+        receipt_pdf = generate_receipt_pdf(payment, user)
+        return build_receipt_email(user['email'], user['name'], receipt_pdf, transaction_id, amount)
+
+    def record_email_status(status, attempts, error):
+        changes = {'email_status': status, 'email_attempts': attempts}
+        transaction.update(changes)
+        repository.update_transaction(user_id, transaction_id, changes)
+
+    if receipt_mailer.submit(build_message, record_email_status):
+        flash('Invoice paid successfully! Your receipt will be emailed to you shortly.', 'success')
+    else:
         flash('Invoice paid successfully! Receipt email failed - you can download it from the dashboard.', 'warning')
 
     return redirect(url_for('view_receipt'))
 
 def generate_receipt_pdf(payment, user):
     """Generate PDF receipt and return as bytes"""
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    def draw_centered_text(canvas, text, y_pos, font_name, font_size):
-        canvas.setFont(font_name, font_size)
-        text_width = canvas.stringWidth(text, font_name, font_size)
-        canvas.drawString((width - text_width) / 2, y_pos, text)
-    
-    # University Letterhead
-    draw_centered_text(p, UNIVERSITY_NAME, height - 40, "Helvetica-Bold", 18)
-    draw_centered_text(p, UNIVERSITY_SUBTITLE, height - 60, "Helvetica-Bold", 14)
-    draw_centered_text(p, UNIVERSITY_ADDRESS, height - 80, "Helvetica", 12)
-    
-    # Title
-    draw_centered_text(p, "FEE PAYMENT RECEIPT", height - 120, "Helvetica-Bold", 16)
-    
-    # Receipt Box
-    p.rect(50, height - 500, width - 100, 350, stroke=1, fill=0)
-    
-    # Receipt Details
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(70, height - 160, f"Receipt No: FEE/{payment['transaction_id']}")
-    p.drawRightString(width - 70, height - 160, f"Date: {payment['date'][:10]}")
-    
-    p.line(70, height - 175, width - 70, height - 175)
-    
-    # Student Details
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(70, height - 200, "STUDENT DETAILS:")
-    p.setFont("Helvetica", 11)
-    p.drawString(70, height - 220, f"Name: {payment['user_name']}")
-    p.drawString(70, height - 240, f"Register No: {payment['user_id']}")
-    p.drawString(70, height - 260, f"Course: {user.get('course', 'B.E / B.Tech')}")
-    
-    # Payment Details
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(70, height - 290, "PAYMENT DETAILS:")
-    p.setFont("Helvetica", 11)
-    p.drawString(70, height - 310, f"Fee Type: {payment['description']}")
-    p.drawString(70, height - 330, f"Amount Paid: Rs. {payment['amount']:.2f}")
-    p.drawString(70, height - 350, f"Payment Mode: Online")
-    p.drawString(70, height - 370, f"Transaction ID: {payment['transaction_id']}")
-    p.drawString(70, height - 390, f"Status: PAID")
-    
-    # Amount in words box
-    p.rect(70, height - 440, width - 140, 40, stroke=1, fill=0)
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(75, height - 420, "Amount in Words:")
-    p.setFont("Helvetica", 10)
-    amount_words = number_to_words(int(payment['amount']))
-    p.drawString(75, height - 435, amount_words)
-    
-    # Signature section
-    p.setFont("Helvetica", 10)
-    p.drawString(70, height - 470, "Received the above amount towards fee payment.")
-    p.drawRightString(width - 70, height - 520, "Authorized Signatory")
-    p.drawRightString(width - 70, height - 535, "Accounts Section")
-    
-    # Footer
-    p.line(50, 80, width - 50, 80)
-    draw_centered_text(p, "This is a computer generated receipt and does not require signature.", 65, "Helvetica-Oblique", 9)
-    draw_centered_text(p, f"For any queries, contact: {CONTACT_EMAIL} | Ph: {CONTACT_PHONE}", 50, "Helvetica-Oblique", 9)
-    draw_centered_text(p, f"Visit: {WEBSITE_URL}", 35, "Helvetica-Oblique", 9)
-    
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    return buffer.getvalue()
-
-def number_to_words(num):
-    """Convert number to words for Indian currency"""
-    if num == 0:
-        return "Zero Rupees Only"
-    
-    ones = ["", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine",
-            "Ten", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen",
-            "Seventeen", "Eighteen", "Nineteen"]
-    
-    tens = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
-    
-    def convert_hundreds(n):
-        result = ""
-        if n >= 100:
-            result += ones[n // 100] + " Hundred "
-            n %= 100
-        if n >= 20:
-            result += tens[n // 10] + " "
-            n %= 10
-        if n > 0:
-            result += ones[n] + " "
-        return result
-    
-    if num < 1000:
-        return convert_hundreds(num).strip() + " Rupees Only"
-    elif num < 100000:
-        thousands = num // 1000
-        remainder = num % 1000
-        result = convert_hundreds(thousands).strip() + " Thousand "
-        if remainder > 0:
-            result += convert_hundreds(remainder).strip() + " "
-        return result.strip() + " Rupees Only"
+    return receipt_engine.render('student', payment, user)
+
+def send_receipt(kind, payment, download_name, user=None):
+    """Serve a receipt from the cache, answering revalidations with 304"""
+    course = user.get('course') if user else None
+    key, etag = receipt_key(kind, payment, course)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
     else:
-        return f"Rupees {num} Only"
+        pdf = receipt_cache.get_or_render(key, lambda: receipt_engine.render(kind, payment, user))
+        response = send_file(
+            io.BytesIO(pdf),
+            as_attachment=True,
+            download_name=download_name,
+            mimetype='application/pdf'
+        )
+    response.set_etag(etag)
+    # The URL always serves the latest payment, so browsers must revalidate
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/view_receipt')
 @require_auth
@@ -717,90 +963,7 @@ def download_receipt():
     
     try:
         payment = session['last_payment']
-        
-        # Create PDF
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        
-        # Helper function for centered text
-        def draw_centered_text(canvas, text, y_pos, font_name, font_size):
-            canvas.setFont(font_name, font_size)
-            text_width = canvas.stringWidth(text, font_name, font_size)
-            canvas.drawString((width - text_width) / 2, y_pos, text)
-        
-        # University Letterhead (centered)
-        draw_centered_text(p, UNIVERSITY_NAME, height - 40, "Helvetica-Bold", 18)
-        draw_centered_text(p, UNIVERSITY_SUBTITLE, height - 60, "Helvetica-Bold", 14)
-        draw_centered_text(p, UNIVERSITY_ADDRESS, height - 80, "Helvetica", 12)
-        
-        # Title (centered)
-        p.setFont("Helvetica-Bold", 16)
-        text = "FEE PAYMENT RECEIPT"
-        text_width = p.stringWidth(text, "Helvetica-Bold", 16)
-        p.drawString((width - text_width) / 2, height - 120, text)
-        
-        # Receipt Box
-        p.rect(50, height - 500, width - 100, 350, stroke=1, fill=0)
-        
-        # Receipt Number
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(70, height - 160, f"Receipt No: FEE/{payment['transaction_id']}")
-        p.drawRightString(width - 70, height - 160, f"Date: {payment['date'][:10]}")
-        
-        # Horizontal line
-        p.line(70, height - 175, width - 70, height - 175)
-        
-        # Student Details
-        p.setFont("Helvetica-Bold", 11)
-        p.drawString(70, height - 200, "STUDENT DETAILS:")
-        p.setFont("Helvetica", 11)
-        p.drawString(70, height - 220, f"Name: {payment['user_name']}")
-        p.drawString(70, height - 240, f"Register No: {payment['user_id']}")
-        p.drawString(70, height - 260, f"Course: B.E / B.Tech")
-        
-        # Payment Details
-        p.setFont("Helvetica-Bold", 11)
-        p.drawString(70, height - 290, "PAYMENT DETAILS:")
-        p.setFont("Helvetica", 11)
-        p.drawString(70, height - 310, f"Fee Type: {payment['description']}")
-        p.drawString(70, height - 330, f"Amount Paid: Rs. {payment['amount']:.2f}")
-        p.drawString(70, height - 350, f"Payment Mode: Online")
-        p.drawString(70, height - 370, f"Transaction ID: {payment['transaction_id']}")
-        p.drawString(70, height - 390, f"Status: PAID")
-        
-        # Amount in words box
-        p.rect(70, height - 440, width - 140, 40, stroke=1, fill=0)
-        p.setFont("Helvetica-Bold", 10)
-        p.drawString(75, height - 420, "Amount in Words:")
-        p.setFont("Helvetica", 10)
-        amount_words = number_to_words(int(payment['amount']))
-        p.drawString(75, height - 435, amount_words)
-        
-        # Signature section
-        p.setFont("Helvetica", 10)
-        p.drawString(70, height - 470, "Received the above amount towards fee payment.")
-        p.drawRightString(width - 70, height - 520, "Authorized Signatory")
-        p.drawRightString(width - 70, height - 535, "Accounts Section")
-        
-        # Footer (centered)
-        p.line(50, 80, width - 50, 80)
-        
-        draw_centered_text(p, "This is a computer generated receipt and does not require signature.", 65, "Helvetica-Oblique", 9)
-        draw_centered_text(p, f"For any queries, contact: {CONTACT_EMAIL} | Ph: {CONTACT_PHONE}", 50, "Helvetica-Oblique", 9)
-        draw_centered_text(p, f"Visit: {WEBSITE_URL}", 35, "Helvetica-Oblique", 9)
-        
-        p.showPage()
-        p.save()
-        
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f"Fee_Receipt_{payment['transaction_id']}.pdf",
-            mimetype='application/pdf'
-        )
+        return send_receipt('student', payment, f"Fee_Receipt_{payment['transaction_id']}.pdf", user=user)
     except Exception as e:
         # Log error details server-side, show generic message to user
         print(f"Receipt generation error: {e}")
@@ -898,89 +1061,14 @@ def parent_download_receipt():
     
     try:
         payment = session['last_payment']
-        
-        # Create PDF (same as student receipt)
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        
-        def draw_centered_text(canvas, text, y_pos, font_name, font_size):
-            canvas.setFont(font_name, font_size)
-            text_width = canvas.stringWidth(text, font_name, font_size)
-            canvas.drawString((width - text_width) / 2, y_pos, text)
-        
-        # University Letterhead
-        draw_centered_text(p, UNIVERSITY_NAME, height - 40, "Helvetica-Bold", 18)
-        draw_centered_text(p, UNIVERSITY_SUBTITLE, height - 60, "Helvetica-Bold", 14)
-        draw_centered_text(p, UNIVERSITY_ADDRESS, height - 80, "Helvetica", 12)
-        
-        # Title
-        draw_centered_text(p, "FEE PAYMENT RECEIPT", height - 120, "Helvetica-Bold", 16)
-        
-        # Receipt Box
-        p.rect(50, height - 500, width - 100, 350, stroke=1, fill=0)
-        
-        # Receipt Details
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(70, height - 160, f"Receipt No: FEE/{payment['transaction_id']}")
-        p.drawRightString(width - 70, height - 160, f"Date: {payment['date'][:10]}")
-        
-        p.line(70, height - 175, width - 70, height - 175)
-        
-        # Parent Details
-        p.setFont("Helvetica-Bold", 11)
-        p.drawString(70, height - 200, "PARENT DETAILS:")
-        p.setFont("Helvetica", 11)
-        p.drawString(70, height - 220, f"Name: {payment['user_name']}")
-        p.drawString(70, height - 240, f"Parent ID: {payment['user_id']}")
-        p.drawString(70, height - 260, f"Payment Type: Parent Payment")
-        
-        # Payment Details
-        p.setFont("Helvetica-Bold", 11)
-        p.drawString(70, height - 290, "PAYMENT DETAILS:")
-        p.setFont("Helvetica", 11)
-        p.drawString(70, height - 310, f"Description: {payment['description']}")
-        p.drawString(70, height - 330, f"Amount Paid: Rs. {payment['amount']:.2f}")
-        p.drawString(70, height - 350, f"Payment Mode: Online")
-        p.drawString(70, height - 370, f"Transaction ID: {payment['transaction_id']}")
-        p.drawString(70, height - 390, f"Status: PAID")
-        
-        # Amount in words
-        p.rect(70, height - 440, width - 140, 40, stroke=1, fill=0)
-        p.setFont("Helvetica-Bold", 10)
-        p.drawString(75, height - 420, "Amount in Words:")
-        p.setFont("Helvetica", 10)
-        amount_words = number_to_words(int(payment['amount']))
-        p.drawString(75, height - 435, amount_words)
-        
-        # Signature section
-        p.setFont("Helvetica", 10)
-        p.drawString(70, height - 470, "Received the above amount towards fee payment.")
-        p.drawRightString(width - 70, height - 520, "Authorized Signatory")
-        p.drawRightString(width - 70, height - 535, "Accounts Section")
-        
-        # Footer
-        p.line(50, 80, width - 50, 80)
-        draw_centered_text(p, "This is a computer generated receipt and does not require signature.", 65, "Helvetica-Oblique", 9)
-        draw_centered_text(p, f"For any queries, contact: {CONTACT_EMAIL} | Ph: {CONTACT_PHONE}", 50, "Helvetica-Oblique", 9)
-        draw_centered_text(p, f"Visit: {WEBSITE_URL}", 35, "Helvetica-Oblique", 9)
-        
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f"Parent_Receipt_{payment['transaction_id']}.pdf",
-            mimetype='application/pdf'
-        )
+        return send_receipt('parent', payment, f"Parent_Receipt_{payment['transaction_id']}.pdf")
     except Exception as e:
         print(f"Receipt generation error: {e}")
         flash('Error generating receipt. Please try again.', 'danger')
         return redirect(url_for('parent_dashboard'))
 
 @app.route('/institution-dashboard')
+@cached_page('payments', daily=True)
 def institution_dashboard():
     if 'user_type' not in session or session['user_type'] != 'institution':
         return redirect(url_for('institution_login'))
@@ -995,8 +1083,7 @@ def institution_dashboard():
     for i in range(6, -1, -1):
         date = today - timedelta(days=i)
         # Use base amount with some real transaction data if available
-        real_total = sum(abs(t['amount']) for user_transactions in transactions_data.values() 
-                        for t in user_transactions if t['date'].startswith(date.strftime('%Y-%m-%d')) and t['amount'] < 0)
+        real_total = rollups.daily_collections(date, date)[0][1]
         # Combine real data with base amount for demonstration
         total = base_amounts[6-i] + real_total
         daily_collections.append({'date': date.strftime('%m/%d'), 'amount': total})
@@ -1058,88 +1145,137 @@ def institution_download_receipt():
     
     try:
         payment = session['last_payment']
-        
-        # Create PDF
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        
-        def draw_centered_text(canvas, text, y_pos, font_name, font_size):
-            canvas.setFont(font_name, font_size)
-            text_width = canvas.stringWidth(text, font_name, font_size)
-            canvas.drawString((width - text_width) / 2, y_pos, text)
-        
-        # University Letterhead
-        draw_centered_text(p, UNIVERSITY_NAME, height - 40, "Helvetica-Bold", 18)
-        draw_centered_text(p, UNIVERSITY_SUBTITLE, height - 60, "Helvetica-Bold", 14)
-        draw_centered_text(p, UNIVERSITY_ADDRESS, height - 80, "Helvetica", 12)
-        
-        # Title
-        draw_centered_text(p, "PAYMENT RECEIPT", height - 120, "Helvetica-Bold", 16)
-        
-        # Receipt Box
-        p.rect(50, height - 500, width - 100, 350, stroke=1, fill=0)
-        
-        # Receipt Details
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(70, height - 160, f"Receipt No: INST/{payment['transaction_id']}")
-        p.drawRightString(width - 70, height - 160, f"Date: {payment['date'][:10]}")
-        
-        p.line(70, height - 175, width - 70, height - 175)
-        
-        # Institution Details
-        p.setFont("Helvetica-Bold", 11)
-        p.drawString(70, height - 200, "INSTITUTION DETAILS:")
-        p.setFont("Helvetica", 11)
-        p.drawString(70, height - 220, f"Name: {payment['user_name']}")
-        p.drawString(70, height - 240, f"Institution ID: {payment['user_id']}")
-        p.drawString(70, height - 260, f"Payment Type: Institution Payment")
-        
-        # Payment Details
-        p.setFont("Helvetica-Bold", 11)
-        p.drawString(70, height - 290, "PAYMENT DETAILS:")
-        p.setFont("Helvetica", 11)
-        p.drawString(70, height - 310, f"Description: {payment['description']}")
-        p.drawString(70, height - 330, f"Amount Paid: Rs. {payment['amount']:.2f}")
-        p.drawString(70, height - 350, f"Payment Mode: Online")
-        p.drawString(70, height - 370, f"Transaction ID: {payment['transaction_id']}")
-        p.drawString(70, height - 390, f"Status: PAID")
-        
-        # Amount in words
-        p.rect(70, height - 440, width - 140, 40, stroke=1, fill=0)
-        p.setFont("Helvetica-Bold", 10)
-        p.drawString(75, height - 420, "Amount in Words:")
-        p.setFont("Helvetica", 10)
-        amount_words = number_to_words(int(payment['amount']))
-        p.drawString(75, height - 435, amount_words)
-        
-        # Signature section
-        p.setFont("Helvetica", 10)
-        p.drawString(70, height - 470, "Received the above amount towards payment.")
-        p.drawRightString(width - 70, height - 520, "Authorized Signatory")
-        p.drawRightString(width - 70, height - 535, "Accounts Section")
-        
-        # Footer
-        p.line(50, 80, width - 50, 80)
-        draw_centered_text(p, "This is a computer generated receipt and does not require signature.", 65, "Helvetica-Oblique", 9)
-        draw_centered_text(p, f"For any queries, contact: {CONTACT_EMAIL} | Ph: {CONTACT_PHONE}", 50, "Helvetica-Oblique", 9)
-        draw_centered_text(p, f"Visit: {WEBSITE_URL}", 35, "Helvetica-Oblique", 9)
-        
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f"Institution_Receipt_{payment['transaction_id']}.pdf",
-            mimetype='application/pdf'
-        )
+        return send_receipt('institution', payment, f"Institution_Receipt_{payment['transaction_id']}.pdf")
     except Exception as e:
         print(f"Receipt generation error: {e}")
         flash('Error generating receipt. Please try again.', 'danger')
         return redirect(url_for('institution_dashboard'))
 
+def receipt_payment(user, transaction):
+    """Receipt fields for a recorded invoice payment"""
+    return {
+        'transaction_id': transaction['transaction_id'],
+        'description': str(transaction['description']).removeprefix('Invoice Payment: '),
+        'amount': abs(transaction['amount']),
+        'date': transaction['date'],
+        'user_name': user['name'],
+        'user_id': user['id']
+    }
+
+@app.route('/institution-export-receipts')
+def institution_export_receipts():
+    if 'user_type' not in session or session['user_type'] != 'institution':
+        return redirect(url_for('institution_login'))
+
+    start = request.args.get('start', '0000-00-00')
+    end = request.args.get('end', '9999-99-99')
+    course = request.args.get('course')
+    year = request.args.get('year')
+    try:
+        for value in (start, end):
+            if value not in ('0000-00-00', '9999-99-99'):
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    def jobs():
+        for _, user in users.students(course or None, year or None):
+            for transaction in ledger.entries(user['id']):
+                if transaction.get('transaction_id') and start <= transaction['date'][:10] <= end:
+                    payment = receipt_payment(user, transaction)
+                    name = f"{user['id']}/Fee_Receipt_{payment['transaction_id']}.pdf"
+                    yield name, 'student', payment, {'course': user.get('course')}
+
+    pool = get_pool(RECEIPT_LETTERHEAD, RECEIPT_EXPORT_CONFIG['workers'])
+    archive = stream_receipts_zip(
+        jobs(), pool,
+        batch_size=RECEIPT_EXPORT_CONFIG['batch_size'],
+        max_in_flight=RECEIPT_EXPORT_CONFIG['max_in_flight']
+    )
+    filename = f"receipts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(archive, mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+def export_students(student_id):
+    """(username, user) pairs an export covers: one student or all of them"""
+    if student_id is None:
+        return users.students()
+    found = users.by_id(student_id)
+    if found is None or found[1].get('is_admin', False):
+        return []
+    return [found]
+
+def export_response(dataset, fmt, fields, rows):
+    filename = f"{dataset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(encode_rows(fmt, fields, rows), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+def export_filters(*names):
+    """Validated export filters from the query string, or None.
+
+    names are the dataset's own equality filters, e.g. 'gateway'.
+    """
+    filters = {
+        'format': request.args.get('format', 'csv'),
+        'student_id': request.args.get('student_id', type=int),
+        'start': request.args.get('start', ''),
+        'end': request.args.get('end', '')
+    }
+    filters.update({name: request.args.get(name) for name in names})
+    if filters['format'] not in EXPORT_FORMATS:
+        return None
+    try:
+        for key in ('start', 'end'):
+            if filters[key]:
+                datetime.strptime(filters[key], '%Y-%m-%d')
+    except ValueError:
+        return None
+    filters['end'] = filters['end'] or '9999-12-31'
+    return filters
+
+@app.route('/institution-export-transactions')
+def institution_export_transactions():
+    if 'user_type' not in session or session['user_type'] != 'institution':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    filters = export_filters('gateway', 'email_status')
+    if filters is None:
+        return jsonify({'error': 'Invalid export filters'}), 400
+
+    def rows():
+        for username, user in export_students(filters['student_id']):
+            for transaction in ledger.entries(user['id']):
+                if not filters['start'] <= transaction['date'][:10] <= filters['end']:
+                    continue
+                if filters['gateway'] and transaction.get('gateway') != filters['gateway']:
+                    continue
+                if filters['email_status'] and transaction.get('email_status') != filters['email_status']:
+                    continue
+                yield dict(transaction, student_id=user['id'], username=username, name=user['name'])
+
+    return export_response('transactions', filters['format'], TRANSACTION_FIELDS, rows())
+
+@app.route('/institution-export-invoices')
+def institution_export_invoices():
+    if 'user_type' not in session or session['user_type'] != 'institution':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    filters = export_filters('status')
+    if filters is None:
+        return jsonify({'error': 'Invalid export filters'}), 400
+
+    def rows():
+        for username, user in export_students(filters['student_id']):
+            for invoice in list(invoices_data.get(user['id'], [])):
+                if not filters['start'] <= invoice['issue_date'] <= filters['end']:
+                    continue
+                if filters['status'] and invoice['status'] != filters['status']:
+                    continue
+                yield dict(invoice, invoice_id=invoice['id'], student_id=user['id'],
+                           username=username, name=user['name'])
+
+    return export_response('invoices', filters['format'], INVOICE_FIELDS, rows())
+
 @app.route('/admin-dashboard')
 @require_auth
 def admin_dashboard():
@@ -1175,7 +1311,7 @@ def change_password():
         flash('All fields are required', 'danger')
         return render_template('change_password.html', user=user)
     
-    if not check_password_hash(user['password_hash'], current_password):
+    if not password_hasher.check(user['password_hash'], current_password):
         flash('Current password is incorrect', 'danger')
         return render_template('change_password.html', user=user)
     
@@ -1187,9 +1323,10 @@ def change_password():
         flash('Password must be at least 6 characters long', 'danger')
         return render_template('change_password.html', user=user)
     
-    with data_lock:
-        user['password_hash'] = generate_password_hash(new_password)
-        save_user_data()
+    new_hash = password_hasher.hash(new_password)
+    with account_locks.for_key(user['id']):
+        user['password_hash'] = new_hash
+    save_user(session['username'])
     
     flash('Password changed successfully', 'success')
     return redirect(url_for('profile'))
@@ -1212,7 +1349,7 @@ def change_passcode():
         flash('All fields are required', 'danger')
         return render_template('change_passcode.html', user=user)
     
-    if not check_password_hash(user['passcode_hash'], current_passcode):
+    if not password_hasher.check(user['passcode_hash'], current_passcode):
         flash('Current passcode is incorrect', 'danger')
         return render_template('change_passcode.html', user=user)
     
@@ -1224,9 +1361,10 @@ def change_passcode():
         flash('Passcode must be exactly 4 digits', 'danger')
         return render_template('change_passcode.html', user=user)
     
-    with data_lock:
-        user['passcode_hash'] = generate_password_hash(new_passcode)
-        save_user_data()
+    new_hash = password_hasher.hash(new_passcode)
+    with account_locks.for_key(user['id']):
+        user['passcode_hash'] = new_hash
+    save_user(session['username'])
     
     flash('Passcode changed successfully', 'success')
     return redirect(url_for('profile'))
@@ -1262,7 +1400,11 @@ def create_payment(gateway_id):
         if amount <= 0 or math.isnan(amount) or math.isinf(amount):
             return jsonify({'error': 'Invalid amount'}), 400
         
-        if gateway_id == 'razorpay':
+        if gateway_client.configured(gateway_id):
+            result = gateway_client.create(gateway_id, amount, owner=user['id'])
+            if result.get('timeout'):
+                return jsonify({'error': result['error']}), 504
+        elif gateway_id == 'razorpay':
             result = payment_gateway.create_razorpay_order(amount)
         elif gateway_id == 'stripe':
             result = payment_gateway.create_stripe_payment_intent(amount)
@@ -1272,6 +1414,8 @@ def create_payment(gateway_id):
             return jsonify({'error': 'Invalid gateway'}), 400
         
         return jsonify(result)
+    except GatewayBusy:
+        return jsonify({'error': 'Payment gateway busy, please retry'}), 503
     except Exception as e:
         # Log error details server-side, show generic message to user
         print(f"Payment creation error: {e}")
@@ -1338,37 +1482,47 @@ def verify_payment():
         data = request.json
         gateway = data.get('gateway')
         
-        if gateway == 'razorpay':
-            result = payment_gateway.verify_razorpay_payment(
-                data.get('payment_id'),
-                data.get('order_id'),
-                data.get('signature')
-            )
+        if gateway_client.configured(gateway):
+            # Credit only orders created by this user, for the amount they were created with
+            result = gateway_client.verify(gateway, user['id'], data)
+            if result.get('timeout'):
+                return jsonify({'error': result['error']}), 504
+            amount = result.get('amount', 0)
         else:
-            result = {'success': True}  # Simplified for other gateways
+            if gateway == 'razorpay':
+                result = payment_gateway.verify_razorpay_payment(
+                    data.get('payment_id'),
+                    data.get('order_id'),
+                    data.get('signature')
+                )
+            else:
+                result = {'success': True}  # Simplified for other gateways
+            amount = float(data.get('amount', 0))
         
         if result['success']:
             # Record successful payment with validation
-            amount = float(data.get('amount', 0))
             if amount <= 0 or math.isnan(amount) or math.isinf(amount):
                 return jsonify({'error': 'Invalid amount'}), 400
                 
-            with data_lock:
+            with account_locks.for_key(user['id']):
                 transaction = {
                     'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                     'description': f'Online Payment via {escape(gateway.title())}',
                     'amount': amount,
                     'balance': user['balance'] + amount,
                     'gateway': escape(gateway),
-                    'payment_id': escape(data.get('payment_id', ''))
+                    'payment_id': escape(data.get('payment_id') or result.get('reference', ''))
                 }
-                transactions_data[user['id']].append(transaction)
+                record_transaction(user['id'], transaction)
                 user['balance'] += amount
+                save_user(session['username'])
             
             return jsonify({'success': True, 'message': 'Payment successful'})
         else:
             return jsonify({'success': False, 'error': 'Payment verification failed'})
     
+    except GatewayBusy:
+        return jsonify({'error': 'Payment gateway busy, please retry'}), 503
     except Exception as e:
         # Log error details server-side, show generic message to user
         print(f"Payment verification error: {e}")
@@ -1387,14 +1541,21 @@ def send_reminder():
     if not all([student_id, message]):
         return jsonify({'error': 'Missing required fields'}), 400
     
+    try:
+        student_id = int(student_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid student ID'}), 400
+    
     reminder_id = str(uuid.uuid4())[:8]
-    due_reminders[reminder_id] = {
+    reminder_log.add({
+        'id': reminder_id,
+        'type': 'individual',
         'student_id': student_id,
         'message': message,
         'target': target,
         'created_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'status': 'sent'
-    }
+    }, student_ids=(student_id,))
     
     return jsonify({'success': True, 'reminder_id': reminder_id})
 
@@ -1405,26 +1566,87 @@ def send_bulk_reminder():
     
     data = request.json
     target = data.get('target', 'students')
-    message = escape(data.get('message', ''))
+    message = str(data.get('message', ''))
     message_type = data.get('message_type', 'reminder')
     
     if not message:
         return jsonify({'error': 'Message is required'}), 400
     
-    count = 125 if target == 'students' else 125 if target == 'parents' else 250
+    if target not in ('students', 'parents', 'both'):
+        return jsonify({'error': 'Invalid target'}), 400
+    
+    # Rendering and sending happen on the dispatcher's worker. Email and SMS
+    # get the text as typed; only the copy kept for the history is escaped.
+    recipients = reminder_recipients(target, message_type)
+    job = reminder_dispatcher.submit(
+        recipients,
+        lambda batch: render_reminders(batch, message_type, message),
+        type='bulk',
+        target=target,
+        message=str(escape(message)),
+        message_type=message_type,
+        count=len(recipients)
+    )
+    reminder_log.add(job, student_ids=[recipient['user_id'] for recipient in recipients])
     
-    reminder_id = str(uuid.uuid4())[:8]
-    due_reminders[reminder_id] = {
-        'type': 'bulk',
-        'target': target,
-        'message': message,
-        'message_type': message_type,
-        'count': count,
-        'created_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'status': 'sent'
-    }
+    return jsonify({'success': True, 'count': len(recipients), 'reminder_id': job['id']})
+
+@app.route('/api/invoice-states')
+def api_invoice_states():
+    """Pending invoices per due state and the latest state changes, newest first"""
+    if 'user_type' not in session or session['user_type'] != 'institution':
+        return jsonify({'error': 'Unauthorized'}), 401
     
-    return jsonify({'success': True, 'count': count, 'reminder_id': reminder_id})
+    return jsonify({'counts': invoice_scheduler.counts(), 'events': list(reversed(invoice_events))})
+
+@app.route('/reminder_status/<reminder_id>')
+def reminder_status(reminder_id):
+    if 'user_type' not in session or session['user_type'] != 'institution':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = reminder_dispatcher.status(reminder_id)
+    if job is None:
+        return jsonify({'error': 'Reminder not found'}), 404
+    return jsonify({key: job[key] for key in ('id', 'status', 'total', 'sent', 'failed', 'created_date')})
+
+def reminder_recipients(target, message_type):
+    """Students and/or parents a bulk reminder goes to.
+
+    Due and overdue notices only go to students who still owe fees. Students
+    are emailed; parents, for whom only a phone number is on file, get an SMS.
+    """
+    only_owing = message_type in ('due_reminder', 'overdue_notice')
+    recipients = []
+    for username, user in users.students():
+        if only_owing and student_summary.pending_amount(user['id']) <= 0:
+            continue
+        if target in ('students', 'both') and user.get('email'):
+            recipients.append({'user_id': user['id'], 'name': user['name'], 'channel': 'email', 'address': user['email']})
+        parent_phone = user.get('parent_phone')
+        if target in ('parents', 'both') and parent_phone and parent_phone != 'N/A':
+            recipients.append({'user_id': user['id'], 'name': user.get('parent_name', 'Parent'), 'channel': 'sms', 'address': parent_phone})
+    return recipients
+
+def render_reminders(batch, message_type, message):
+    """Messages for one batch of recipients, from notification_templates when one applies"""
+    template = notification_templates.get(message_type)
+    messages = []
+    for recipient in batch:
+        text = message
+        if template:
+            pending = [inv for inv in invoices_data.get(recipient['user_id'], []) if inv['status'] == 'Pending']
+            text = template.format(
+                name=recipient['name'],
+                amount=f"{student_summary.pending_amount(recipient['user_id']):,.2f}",
+                due_date=min((inv['due_date'] for inv in pending), default='-')
+            )
+        messages.append({
+            'channel': recipient['channel'],
+            'address': recipient['address'],
+            'subject': 'EduPay fee reminder',
+            'text': text
+        })
+    return messages
 
 @app.route('/collection_data')
 def collection_data():
@@ -1433,10 +1655,7 @@ def collection_data():
     
     daily_collections = []
     today = datetime.now().date()
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        total = sum(abs(t['amount']) for user_transactions in transactions_data.values() 
-                   for t in user_transactions if t['date'].startswith(date.strftime('%Y-%m-%d')) and t['amount'] < 0)
+    for date, total in rollups.daily_collections(today - timedelta(days=6), today):
         daily_collections.append({'date': date.strftime('%Y-%m-%d'), 'amount': total})
     
     return jsonify(daily_collections)
@@ -1446,106 +1665,183 @@ def reminder_history():
     if 'user_type' not in session or session['user_type'] != 'institution':
         return jsonify({'error': 'Unauthorized'}), 401
     
-    recent_reminders = []
-    for reminder_id, reminder in due_reminders.items():
-        if reminder.get('status') == 'sent':
-            recent_reminders.append({
-                'id': reminder_id,
-                'target': reminder.get('target', 'student'),
-                'message': reminder.get('message', ''),
-                'date': reminder.get('created_date', ''),
-                'type': reminder.get('type', 'individual')
-            })
+    before = request.args.get('before', type=int)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    student_id = request.args.get('student_id', type=int)
+    if student_id is not None:
+        reminders, next_before = reminder_log.for_student(student_id, before=before, limit=limit)
+    else:
+        reminders, next_before = reminder_log.recent(
+            before=before,
+            limit=limit,
+            since=request.args.get('since'),
+            until=request.args.get('until')
+        )
     
-    return jsonify(recent_reminders[-10:])
+    recent_reminders = [{
+        'id': reminder['id'],
+        'target': reminder.get('target', 'student'),
+        'message': reminder.get('message', ''),
+        'date': reminder.get('created_date', ''),
+        'type': reminder.get('type', 'individual'),
+        'status': reminder.get('status', 'sent')
+    } for reminder in reminders]
+    return jsonify({'reminders': recent_reminders, 'next_before': next_before})
 
 @app.route('/student-management')
 def student_management():
     if 'user_type' not in session or session['user_type'] != 'institution':
         return redirect(url_for('institution_login'))
     
-    # Get all students from demo accounts
-    students = []
-    for username, user in users.items():
-        if not user.get('is_admin', False):
-            # Calculate pending amount from invoices
-            pending_amount = sum(inv['amount'] for inv in invoices_data.get(user['id'], []) if inv['status'] == 'Pending')
-            
-            students.append({
-                'id': user['id'],
-                'username': username,
-                'name': user['name'],
-                'email': user['email'],
-                'phone': user.get('phone', 'N/A'),
-                'course': user.get('course', 'N/A'),
-                'year': user.get('year', 'N/A'),
-                'balance': user['balance'],
-                'pending_amount': pending_amount,
-                'status': 'Overdue' if pending_amount > 0 else 'Paid',
-                'parent_name': user.get('parent_name', 'N/A'),
-                'parent_phone': user.get('parent_phone', 'N/A')
-            })
-    
-    total_students = len(students)
-    paid_students = len([s for s in students if s['status'] == 'Paid'])
-    overdue_students = len([s for s in students if s['status'] == 'Overdue'])
-    total_pending = sum(s['pending_amount'] for s in students)
-    
-    stats = {
-        'total_students': total_students,
-        'paid_students': paid_students,
-        'overdue_students': overdue_students,
-        'total_pending': total_pending
-    }
+    filters = student_filters()
+    if filters is None:
+        flash('Invalid filters', 'danger')
+        return redirect(url_for('student_management'))
+    try:
+        students, next_cursor = student_page(filters)
+    except InvalidCursor:
+        return redirect(url_for('student_management'))
+    
+    stats = student_summary.totals()
+    stats['overdue_students'] = invoice_scheduler.counts()['overdue_students']
+    cohorts = users.cohorts()
     
-    return render_template('student_management.html', students=students, stats=stats)
+    return render_template('student_management.html', students=students, stats=stats,
+                           filters=filters, next_cursor=next_cursor,
+                           courses=sorted({course for course, _ in cohorts}),
+                           years=sorted({year for _, year in cohorts}))
+
+@app.route('/api/students')
+def api_students():
+    if 'user_type' not in session or session['user_type'] != 'institution':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    filters = student_filters()
+    if filters is None:
+        return jsonify({'error': 'Invalid filters'}), 400
+    try:
+        students, next_cursor = student_page(filters)
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify({'students': students, 'next_cursor': next_cursor})
+
+def student_filters():
+    """Validated student listing filters from the query string, or None"""
+    filters = {
+        'course': request.args.get('course') or None,
+        'year': request.args.get('year') or None,
+        'status': request.args.get('status') or None,
+        'min_pending': request.args.get('min_pending', type=float),
+        'max_pending': request.args.get('max_pending', type=float),
+        'sort': request.args.get('sort', 'id'),
+        'order': request.args.get('order', 'asc'),
+        'cursor': request.args.get('cursor') or None,
+        'limit': min(max(request.args.get('limit', 50, type=int), 1), 200)
+    }
+    if filters['sort'] not in SORT_FIELDS or filters['order'] not in ('asc', 'desc'):
+        return None
+    if filters['status'] not in (None, 'Paid', 'Pending', 'Overdue'):
+        return None
+    return filters
+
+def student_status(user_id):
+    if invoice_scheduler.has_overdue(user_id):
+        return 'Overdue'
+    return 'Pending' if student_summary.pending_amount(user_id) > 0 else 'Paid'
+
+def student_page(filters):
+    """One page of student rows for the listing, and the next page's cursor"""
+    min_pending, max_pending = filters['min_pending'], filters['max_pending']
+    # Paid owes nothing; Pending and Overdue owe at least a paisa, and only
+    # Overdue has an invoice past its due date
+    status_filters = {
+        'Pending': lambda user_id: not invoice_scheduler.has_overdue(user_id),
+        'Overdue': invoice_scheduler.has_overdue
+    }
+    if filters['status'] == 'Paid':
+        max_pending = 0.0 if max_pending is None else min(max_pending, 0.0)
+    elif filters['status'] in ('Pending', 'Overdue'):
+        min_pending = 0.01 if min_pending is None else max(min_pending, 0.01)
+    user_ids, next_cursor = student_index.page(
+        course=filters['course'], year=filters['year'],
+        min_pending=min_pending, max_pending=max_pending,
+        sort=filters['sort'], descending=filters['order'] == 'desc',
+        cursor=filters['cursor'], limit=filters['limit'],
+        where=status_filters.get(filters['status'])
+    )
+    students = []
+    for user_id in user_ids:
+        found = users.by_id(user_id)
+        if found is None:
+            continue
+        username, user = found
+        students.append({
+            'id': user['id'],
+            'username': username,
+            'name': user['name'],
+            'email': user['email'],
+            'phone': user.get('phone', 'N/A'),
+            'course': user.get('course', 'N/A'),
+            'year': user.get('year', 'N/A'),
+            'balance': user['balance'],
+            'pending_amount': student_summary.pending_amount(user_id),
+            'status': student_status(user_id),
+            'parent_name': user.get('parent_name', 'N/A'),
+            'parent_phone': user.get('parent_phone', 'N/A')
+        })
+    return students, next_cursor
 
 @app.route('/student-details/<int:student_id>')
 def student_details(student_id):
     if 'user_type' not in session or session['user_type'] != 'institution':
         return redirect(url_for('institution_login'))
     
-    # Find student by ID
+    # Find student by ID; copy the record rather than tagging the shared one
+    found = users.by_id(student_id)
     student = None
-    for username, user in users.items():
-        if user['id'] == student_id and not user.get('is_admin', False):
-            student = user
-            student['username'] = username
-            break
+    if found and not found[1].get('is_admin', False):
+        username, user = found
+        student = dict(user, username=username)
     
     if not student:
         flash('Student not found', 'danger')
         return redirect(url_for('student_management'))
     
     # Get student transactions and invoices
-    student_transactions = transactions_data.get(student_id, [])
+    student_transactions = ledger.entries(student_id)
     student_invoices = invoices_data.get(student_id, [])
     
     return render_template('student_details.html', student=student, 
                          transactions=student_transactions, invoices=student_invoices)
 
 @app.route('/fee-structure')
+@cached_page('fees')
 def fee_structure():
     if 'user_type' not in session or session['user_type'] != 'institution':
         return redirect(url_for('institution_login'))
     
-    # Sample fee structure data
-    fee_structure = {
-        'B.E Computer Science': {
-            '1st Year': {'tuition': 150000, 'lab': 25000, 'library': 5000, 'activity': 10000},
-            '2nd Year': {'tuition': 150000, 'lab': 30000, 'library': 5000, 'activity': 12000},
-            '3rd Year': {'tuition': 160000, 'lab': 35000, 'library': 5000, 'activity': 15000},
-            '4th Year': {'tuition': 160000, 'lab': 40000, 'library': 5000, 'activity': 18000}
-        },
-        'B.E Mechanical Engineering': {
-            '1st Year': {'tuition': 140000, 'lab': 20000, 'library': 5000, 'activity': 10000},
-            '2nd Year': {'tuition': 140000, 'lab': 25000, 'library': 5000, 'activity': 12000},
-            '3rd Year': {'tuition': 150000, 'lab': 30000, 'library': 5000, 'activity': 15000},
-            '4th Year': {'tuition': 150000, 'lab': 35000, 'library': 5000, 'activity': 18000}
-        }
-    }
+    fee_table = fee_structures.cached('table_html', lambda fees: Markup(
+        render_template('fee_structure_table.html', fee_structure=fees)))
+    return render_template('fee_structure.html', fee_table=fee_table, courses=fee_structures.courses())
+
+@app.route('/api/fee-structure')
+def api_fee_structure():
+    """The fee table as JSON, or one cohort's fees with ?course=&year="""
+    if 'user_type' not in session and 'username' not in session:
+        return jsonify({'error': 'Please log in first'}), 401
     
-    return render_template('fee_structure.html', fee_structure=fee_structure_data)
+    course, year = request.args.get('course'), request.args.get('year')
+    if course or year:
+        fees = fee_structures.get(course, year)
+        if fees is None:
+            return jsonify({'error': 'Course or year not found'}), 404
+        response = jsonify({'course': course, 'year': year, 'fees': fees, 'total': sum(fees.values())})
+        response.add_etag()
+    else:
+        response = Response(fee_structures.as_json(), mimetype='application/json')
+        response.set_etag(fee_structures.etag())
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @app.route('/update-fee-structure', methods=['POST'])
 def update_fee_structure():
@@ -1560,14 +1856,16 @@ def update_fee_structure():
     
     if not all([course, year, fee_type]) or amount <= 0:
         return jsonify({'error': 'Invalid data'}), 400
+    if fee_type not in FEE_COMPONENTS:
+        return jsonify({'error': 'Invalid fee type'}), 400
     
     # Update the fee structure data
-    with data_lock:
-        if course in fee_structure_data and year in fee_structure_data[course]:
-            fee_structure_data[course][year][fee_type] = amount
-            return jsonify({'success': True, 'message': f'Updated {fee_type.title()} Fee for {course} - {year} to ₹{amount:,.0f}'})
-        else:
-            return jsonify({'error': 'Course or year not found'}), 400
+    try:
+        version = fee_structures.update(course, year, fee_type, amount)
+    except KeyError:
+        return jsonify({'error': 'Course or year not found'}), 400
+    page_cache.invalidate('fees')
+    return jsonify({'success': True, 'version': version, 'message': f'Updated {fee_type.title()} Fee for {course} - {year} to ₹{amount:,.0f}'})
 
 @app.route('/generate-invoice', methods=['POST'])
 def generate_invoice():
@@ -1582,6 +1880,10 @@ def generate_invoice():
     
     if not all([student_id, fee_type, amount, due_date]) or amount <= 0:
         return jsonify({'error': 'Invalid data'}), 400
+    try:
+        datetime.strptime(due_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid due date'}), 400
     
     # Create new invoice
     new_invoice = {
@@ -1595,46 +1897,140 @@ def generate_invoice():
         'due_soon': False
     }
     
-    if student_id not in invoices_data:
-        invoices_data[student_id] = []
-    
-    invoices_data[student_id].append(new_invoice)
+    with account_locks.for_key(student_id):
+        schedule_invoice(student_id, new_invoice)
+        invoices_data.setdefault(student_id, []).append(new_invoice)
+        repository.add_invoices(student_id, [new_invoice])
+        student_summary.invoice_added(student_id, amount)
+        student_index.refresh(student_id)
+    page_cache.invalidate('invoices')
     
     return jsonify({'success': True, 'message': 'Invoice generated successfully', 'invoice_id': new_invoice['id'][:8]})
 
+def bill_cohort(course, year, due_date, components=FEE_COMPONENTS):
+    """Invoice every student in a course/year for the given fee components.
+
+    Invoices are built up front, then added under one acquisition of the
+    cohort's account locks and handed to the repository as one batch.
+    Students who already have an invoice for a component with the same due
+    date are skipped for it, so re-running a billing job is harmless.
+    """
+    cohort_fees = fee_structures.get(course, year)
+    fees = {component: float(cohort_fees.get(component, 0)) for component in components
+            if cohort_fees.get(component, 0) > 0}
+    issue_date = datetime.now().strftime('%Y-%m-%d')
+    students = [user['id'] for _, user in users.students(course=course, year=year)]
+    new_invoices = {
+        user_id: [{
+            'id': str(uuid.uuid4()),
+            'issue_date': issue_date,
+            'due_date': due_date,
+            'description': f"{component.title()} Fee - {year}",
+            'amount': amount,
+            'status': 'Pending',
+            'paid_date': None,
+            'due_soon': False
+        } for component, amount in fees.items()]
+        for user_id in students
+    }
+    
+    batch = {}
+    skipped = 0
+    by_component = dict.fromkeys(fees, 0.0)
+    with account_locks.many(students):
+        for user_id, invoices in new_invoices.items():
+            existing = invoices_data.setdefault(user_id, [])
+            billed = {(inv['description'], inv['due_date']) for inv in existing}
+            added = []
+            for component, invoice in zip(fees, invoices):
+                if (invoice['description'], invoice['due_date']) in billed:
+                    skipped += 1
+                    continue
+                schedule_invoice(user_id, invoice)
+                student_summary.invoice_added(user_id, invoice['amount'])
+                by_component[component] += invoice['amount']
+                added.append(invoice)
+            if added:
+                existing.extend(added)
+                student_index.refresh(user_id)
+                batch[user_id] = added
+        repository.add_invoice_batch(batch)
+    repository.flush()
+    page_cache.invalidate('invoices')
+    
+    return {
+        'course': course,
+        'year': year,
+        'due_date': due_date,
+        'students': len(students),
+        'students_billed': len(batch),
+        'invoices': sum(len(invoices) for invoices in batch.values()),
+        'skipped': skipped,
+        'total_amount': sum(by_component.values()),
+        'by_component': by_component
+    }
+
+@app.route('/bulk-generate-invoices', methods=['POST'])
+def bulk_generate_invoices():
+    if 'user_type' not in session or session['user_type'] != 'institution':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.json or {}
+    course = data.get('course')
+    year = data.get('year')
+    due_date = data.get('due_date')
+    components = data.get('components') or list(FEE_COMPONENTS)
+    
+    if not all([course, year, due_date]):
+        return jsonify({'error': 'Invalid data'}), 400
+    try:
+        datetime.strptime(due_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid due date'}), 400
+    if not isinstance(components, list) or any(component not in FEE_COMPONENTS for component in components):
+        return jsonify({'error': 'Invalid fee components'}), 400
+    if fee_structures.get(course, year) is None:
+        return jsonify({'error': 'Course or year not found'}), 400
+    
+    summary = bill_cohort(course, year, due_date, components)
+    return jsonify(dict(summary, success=True))
+
 @app.route('/analytics')
+@cached_page('payments', 'invoices', 'students', daily=True)
 def analytics():
     if 'user_type' not in session or session['user_type'] != 'institution':
         return redirect(url_for('institution_login'))
     
-    # Generate analytics data
-    today = datetime.now().date()
+    monthly_data = rollups.monthly_collections(12)
     
-    # Monthly collection data
-    monthly_data = []
-    for i in range(11, -1, -1):
-        month_start = today.replace(day=1) - timedelta(days=i*30)
-        month_name = month_start.strftime('%b %Y')
-        amount = 2500000 + (i * 150000)  # Sample data
-        monthly_data.append({'month': month_name, 'amount': amount})
-    
-    # Course-wise collection
+    # Course-wise collection: collected from the rollups, pending from the summary
+    collected = {course: total[0] for (course,), total in rollups.totals(by=('course',)).items()}
+    courses = {}
+    for username, user in users.students():
+        course = courses.setdefault(user.get('course', 'N/A'), {'students': 0, 'pending': 0.0})
+        course['students'] += 1
+        course['pending'] += student_summary.pending_amount(user['id'])
     course_data = [
-        {'course': 'B.E Computer Science', 'students': 65, 'collected': 1250000, 'pending': 150000},
-        {'course': 'B.E Mechanical Engineering', 'students': 60, 'collected': 1100000, 'pending': 200000}
+        {'course': name, 'students': course['students'], 'collected': collected.get(name, 0.0), 'pending': course['pending']}
+        for name, course in sorted(courses.items())
     ]
     
-    # Payment method analysis
-    payment_methods = [
-        {'method': 'UPI/GPay', 'percentage': 45, 'amount': 1125000},
-        {'method': 'Credit/Debit Card', 'percentage': 35, 'amount': 875000},
-        {'method': 'Net Banking', 'percentage': 20, 'amount': 500000}
-    ]
+    payment_methods = rollups.gateway_mix()
+    
+    totals = student_summary.totals()
+    total_collected = sum(course['collected'] for course in course_data)
+    summary = {
+        'this_month': monthly_data[-1]['amount'],
+        'total_pending': totals['total_pending'],
+        'active_students': totals['total_students'],
+        'collection_rate': total_collected / (total_collected + totals['total_pending']) * 100 if total_collected + totals['total_pending'] else 0.0
+    }
     
     return render_template('analytics.html', 
                          monthly_data=monthly_data, 
                          course_data=course_data, 
-                         payment_methods=payment_methods)
+                         payment_methods=payment_methods,
+                         summary=summary)
 
 @app.route('/settings')
 def settings():
@@ -1701,6 +2097,86 @@ def admin_messages():
     
     return render_template('admin_messages.html', messages=support_messages, user=user)
 
+def check_rollups():
+    """Compare the live rollup cube with one rebuilt from the ledger"""
+    with rollup_lock:
+        return rollups.diff(RollupCube.rebuild(ledger, student_profile))
+
+@app.route('/institution-rollups', methods=['GET', 'POST'])
+def institution_rollups():
+    """GET checks the rollups against the ledger; POST rebuilds them"""
+    if 'user_type' not in session or session['user_type'] != 'institution':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if request.method == 'POST':
+        with rollup_lock:
+            previous = rollups.rebuild_from(ledger, student_profile)
+        page_cache.invalidate('payments')
+        return jsonify({'success': True, 'days': len(rollups.snapshot()),
+                        'repaired_cells': len(previous.diff(rollups))})
+    mismatches = check_rollups()
+    return jsonify({
+        'consistent': not mismatches,
+        'mismatched_cells': [[day, list(key), ours, theirs] for day, key, ours, theirs in mismatches[:100]]
+    })
+
+class StayOnLogin(urllib.request.HTTPRedirectHandler):
+    """Keep the session cookie from the login redirect without loading the dashboard"""
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+def call_rollups(url, username, password, method):
+    """Log in to a running server as an institution and call /institution-rollups"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), StayOnLogin())
+    credentials = urllib.parse.urlencode({'username': username, 'password': password}).encode('utf-8')
+    try:
+        try:
+            opener.open(f"{url}/institution-login", data=credentials, timeout=30).close()
+        except urllib.error.HTTPError as e:
+            e.close()
+            if e.code != 302:
+                raise
+        with opener.open(urllib.request.Request(f"{url}/institution-rollups", method=method), timeout=300) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        print(f"Rollups request failed: {e.code} {'check the institution login' if e.code == 401 else e.reason}")
+    except urllib.error.URLError as e:
+        print(f"Could not reach the EduPay server at {url}: {e.reason}")
+    raise SystemExit(2)
+
+rollups_cli = AppGroup('rollups', help="Maintain the running server's collection rollup cube.")
+server_options = [
+    click.option('--url', envvar='EDUPAY_URL', default='http://127.0.0.1:5000', show_default=True,
+                 help='Base URL of the running server.'),
+    click.option('--username', envvar='EDUPAY_INSTITUTION_USER', required=True, help='Institution login.'),
+    click.option('--password', envvar='EDUPAY_INSTITUTION_PASSWORD', prompt=True, hide_input=True),
+]
+
+def with_server_options(command):
+    for option in reversed(server_options):
+        command = option(command)
+    return command
+
+@rollups_cli.command('rebuild')
+@with_server_options
+def rollups_rebuild(url, username, password):
+    """Regenerate the server's rollup cube from its ledger."""
+    result = call_rollups(url.rstrip('/'), username, password, 'POST')
+    print(f"Rebuilt rollups: {result['days']} days, {result['repaired_cells']} cells repaired")
+
+@rollups_cli.command('check')
+@with_server_options
+def rollups_check(url, username, password):
+    """Check the server's rollup cube against its ledger; exits 1 on mismatch."""
+    result = call_rollups(url.rstrip('/'), username, password, 'GET')
+    for day, key, ours, theirs in result['mismatched_cells']:
+        print(f"{day} {tuple(key)}: rollup {ours} != ledger {theirs}")
+    if not result['consistent']:
+        raise SystemExit(1)
+    print("Rollups match the ledger")
+
+app.cli.add_command(rollups_cli)
+
 if __name__ == '__main__':
     debug_mode = True  # Enable debug mode to see errors
     use_ssl = os.getenv('USE_SSL', 'False').lower() == 'true'
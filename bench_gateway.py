@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark for PayPal order creation against a local stub of the PayPal API:
+the old per-order flow (fresh token request and unpooled POSTs) versus
+PaymentGateway's pooled event-loop client and cached token.
+
+The stub counts TCP connections and token requests, so the saving in
+handshakes and token round trips shows up next to the throughput. An
+optional per-request delay stands in for network latency.
+
+    python bench_gateway.py [threads] [orders_per_thread] [latency_ms]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+
+from payment_service import PaymentGateway, basic_auth
+from repository import InMemoryRepository
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.latency = latency
+        self.connections = 0
+        self.token_requests = 0
+        self.orders = 0
+        self.counter_lock = threading.Lock()
+
+    def get_request(self):
+        request = super().get_request()
+        with self.counter_lock:
+            self.connections += 1
+        return request
+
+    def reset(self):
+        with self.counter_lock:
+            self.connections = self.token_requests = self.orders = 0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API; without TCP_NODELAY the headers and body
+    # of a reply on a reused connection wait on the client's delayed ACK
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        with self.server.counter_lock:
+            if self.path == '/v1/oauth2/token':
+                self.server.token_requests += 1
+                status, body = 200, {'access_token': 'stub-token', 'expires_in': 32400}
+            elif self.path == '/v2/checkout/orders':
+                self.server.orders += 1
+                status, body = 201, {'id': f'ORDER-{self.server.orders}'}
+            else:
+                status, body = 404, {}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+async def _unpooled_order(base_url, amount):
+    # A session per order and force_close: every request opens its own connection
+    timeout = aiohttp.ClientTimeout(total=30)
+    connector = aiohttp.TCPConnector(force_close=True)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async with session.post(f'{base_url}/v1/oauth2/token', data='grant_type=client_credentials',
+                                headers={'Authorization': basic_auth('bench-client', 'bench-secret')}) as auth:
+            token = (await auth.json())['access_token']
+        async with session.post(f'{base_url}/v2/checkout/orders',
+                                headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'},
+                                data=json.dumps({'intent': 'CAPTURE', 'purchase_units': [
+                                    {'amount': {'currency_code': 'USD', 'value': str(amount)}}]})) as order:
+            return order.status == 201
+
+
+def unpooled_order(base_url, amount):
+    """The previous create_paypal_order: a token request and an order POST, each on a new connection"""
+    return asyncio.run(_unpooled_order(base_url, amount))
+
+
+def run(server, create_order, threads, orders):
+    server.reset()
+    failures = []
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        start_barrier.wait()
+        for _ in range(orders):
+            if not create_order():
+                failures.append(1)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return threads * orders / elapsed, server.connections, server.token_requests, len(failures)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    orders = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    latency = (float(sys.argv[3]) if len(sys.argv) > 3 else 2.0) / 1000
+
+    server = StubServer(latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    gateway = PaymentGateway({'paypal': {'client_id': 'bench-client', 'client_secret': 'bench-secret',
+                                         'base_url': base_url}},
+                             InMemoryRepository(), max_in_flight=threads, pool_size=threads)
+
+    print(f"{threads} threads x {orders} orders, {latency * 1000:.1f} ms stub latency")
+    print(f"{'client':<10} {'orders/s':>10} {'connections':>12} {'token calls':>12} {'failed':>7}")
+    runs = [
+        ('unpooled', lambda: unpooled_order(base_url, 100.0)),
+        ('pooled', lambda: gateway.create('paypal', 100.0)['success']),
+    ]
+    for name, create_order in runs:
+        rate, connections, token_requests, failed = run(server, create_order, threads, orders)
+        print(f"{name:<10} {rate:>10.0f} {connections:>12} {token_requests:>12} {failed:>7}")
+
+    gateway.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
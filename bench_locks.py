@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Stress benchmark for account locking: one global lock versus striped
+per-account locks, with a check that no balance update is lost.
+
+Each worker thread pays invoices for random students the way the payment
+routes do: read the balance, append to the ledger, write the balance back.
+A short sleep stands in for the storage write done under the lock.
+
+    python bench_locks.py [threads] [payments_per_thread] [students]
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ledger import TransactionLedger
+from locks import LockStripes
+
+WRITE_LATENCY = 0.0002
+AMOUNT = 10.0
+
+
+class GlobalLock:
+    """The old data_lock arrangement, behind the LockStripes interface"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def for_key(self, key):
+        return self._lock
+
+
+def run(locks, threads, payments, students):
+    accounts = {uid: {'id': uid, 'balance': 1000000.0} for uid in range(1, students + 1)}
+    ledger = TransactionLedger()
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        start_barrier.wait()
+        for _ in range(payments):
+            uid = rng.randint(1, students)
+            user = accounts[uid]
+            with locks.for_key(uid):
+                balance = user['balance']
+                ledger.append(uid, {
+                    'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'description': 'Invoice Payment',
+                    'amount': -AMOUNT,
+                    'balance': balance - AMOUNT
+                })
+                time.sleep(WRITE_LATENCY)
+                user['balance'] = balance - AMOUNT
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    lost = 0
+    for uid, user in accounts.items():
+        debits = -sum(entry['amount'] for entry in ledger.entries(uid))
+        if abs((1000000.0 - user['balance']) - debits) > 1e-6:
+            lost += 1
+    return threads * payments / elapsed, lost
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    payments = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    students = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+    before, before_lost = run(GlobalLock(), threads, payments, students)
+    after, after_lost = run(LockStripes(64), threads, payments, students)
+
+    print(f"Threads: {threads}  payments/thread: {payments}  students: {students}")
+    print(f"Before (global lock):   {before:9.1f} payments/s  accounts with lost updates: {before_lost}")
+    print(f"After  (striped locks): {after:9.1f} payments/s  accounts with lost updates: {after_lost}")
+    print(f"Speed-up: {after / before:.2f}x")
+    if before_lost or after_lost:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark receipt rendering: the per-request full redraw that the download
+routes used to do versus the ReceiptEngine, which draws the static layout
+into a form XObject and places it on the page.
+
+    python bench_receipts.py [count]
+"""
+
+import io
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from receipts import ReceiptEngine, number_to_words
+
+LETTERHEAD = {
+    'name': "Anna University",
+    'subtitle': "College of Engineering",
+    'address': "Chennai, Tamil Nadu - 600025",
+    'email': "fees@annauniv.edu",
+    'phone': "+91-44-2235-8000",
+    'website': "www.annauniv.edu",
+}
+
+PAYMENT = {
+    'transaction_id': 'A1B2C3D4',
+    'description': 'Tuition Fee - Semester 1',
+    'amount': 150000.00,
+    'date': '2024-06-15 10:30:00',
+    'user_name': 'Student1',
+    'user_id': 1,
+}
+USER = {'course': 'B.E Computer Science'}
+
+
+def legacy_receipt(payment, user):
+    """The receipt layout as every download route used to draw it"""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+
+    def draw_centered_text(canvas, text, y_pos, font_name, font_size):
+        canvas.setFont(font_name, font_size)
+        text_width = canvas.stringWidth(text, font_name, font_size)
+        canvas.drawString((width - text_width) / 2, y_pos, text)
+
+    draw_centered_text(p, LETTERHEAD['name'], height - 40, "Helvetica-Bold", 18)
+    draw_centered_text(p, LETTERHEAD['subtitle'], height - 60, "Helvetica-Bold", 14)
+    draw_centered_text(p, LETTERHEAD['address'], height - 80, "Helvetica", 12)
+    draw_centered_text(p, "FEE PAYMENT RECEIPT", height - 120, "Helvetica-Bold", 16)
+    p.rect(50, height - 500, width - 100, 350, stroke=1, fill=0)
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(70, height - 160, f"Receipt No: FEE/{payment['transaction_id']}")
+    p.drawRightString(width - 70, height - 160, f"Date: {payment['date'][:10]}")
+    p.line(70, height - 175, width - 70, height - 175)
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(70, height - 200, "STUDENT DETAILS:")
+    p.setFont("Helvetica", 11)
+    p.drawString(70, height - 220, f"Name: {payment['user_name']}")
+    p.drawString(70, height - 240, f"Register No: {payment['user_id']}")
+    p.drawString(70, height - 260, f"Course: {user.get('course', 'B.E / B.Tech')}")
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(70, height - 290, "PAYMENT DETAILS:")
+    p.setFont("Helvetica", 11)
+    p.drawString(70, height - 310, f"Fee Type: {payment['description']}")
+    p.drawString(70, height - 330, f"Amount Paid: Rs. {payment['amount']:.2f}")
+    p.drawString(70, height - 350, "Payment Mode: Online")
+    p.drawString(70, height - 370, f"Transaction ID: {payment['transaction_id']}")
+    p.drawString(70, height - 390, "Status: PAID")
+    p.rect(70, height - 440, width - 140, 40, stroke=1, fill=0)
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(75, height - 420, "Amount in Words:")
+    p.setFont("Helvetica", 10)
+    p.drawString(75, height - 435, number_to_words(int(payment['amount'])))
+    p.setFont("Helvetica", 10)
+    p.drawString(70, height - 470, "Received the above amount towards fee payment.")
+    p.drawRightString(width - 70, height - 520, "Authorized Signatory")
+    p.drawRightString(width - 70, height - 535, "Accounts Section")
+    p.line(50, 80, width - 50, 80)
+    draw_centered_text(p, "This is a computer generated receipt and does not require signature.", 65, "Helvetica-Oblique", 9)
+    draw_centered_text(p, f"For any queries, contact: {LETTERHEAD['email']} | Ph: {LETTERHEAD['phone']}", 50, "Helvetica-Oblique", 9)
+    draw_centered_text(p, f"Visit: {LETTERHEAD['website']}", 35, "Helvetica-Oblique", 9)
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def receipts_per_second(render, count):
+    render()
+    start = time.perf_counter()
+    for _ in range(count):
+        render()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    engine = ReceiptEngine(LETTERHEAD)
+
+    before = receipts_per_second(lambda: legacy_receipt(PAYMENT, USER), count)
+    after = receipts_per_second(lambda: engine.render('student', PAYMENT, USER), count)
+
+    print(f"Receipts rendered: {count}")
+    print(f"Before (full redraw):   {before:8.1f} receipts/s")
+    print(f"After  (static form):   {after:8.1f} receipts/s")
+    print(f"Speed-up: {after / before:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
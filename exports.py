@@ -0,0 +1,53 @@
+"""
+Streaming CSV and NDJSON encoders for ledger exports.
+
+Rows come from a generator and are encoded a batch at a time, so an export
+holds one batch in memory regardless of how many rows it produces.
+"""
+
+import csv
+import io
+import json
+
+TRANSACTION_FIELDS = ['student_id', 'username', 'name', 'date', 'description', 'amount', 'balance',
+                      'gateway', 'payment_id', 'transaction_id', 'email_status']
+INVOICE_FIELDS = ['student_id', 'username', 'name', 'invoice_id', 'issue_date', 'due_date',
+                  'description', 'amount', 'status', 'paid_date']
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_csv(fields, rows, batch_size=500):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(fields, rows, batch_size=500):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({field: row.get(field) for field in fields}, default=str))
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def encode_rows(fmt, fields, rows):
+    """Generator of text chunks for rows in the requested format"""
+    if fmt == 'ndjson':
+        return iter_ndjson(fields, rows)
+    return iter_csv(fields, rows)
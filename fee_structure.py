@@ -0,0 +1,70 @@
+"""
+Versioned fee structure.
+
+The fee table changes a couple of times a year but is read on every fee
+page, fee lookup and billing run. Each update bumps the version; anything
+derived from the table (the rendered fee tables, the JSON form, the ETag)
+is built once per version through cached() and reused until the next
+update.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+
+FEE_COMPONENTS = ('tuition', 'lab', 'library', 'activity')
+
+
+class FeeStructure:
+    def __init__(self, fees):
+        # course -> year -> {component: amount}
+        self._fees = copy.deepcopy(fees)
+        self.version = 1
+        # name -> (version, value)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, course, year):
+        """A copy of one cohort's fees, or None if the course/year is unknown"""
+        with self._lock:
+            fees = self._fees.get(course, {}).get(year)
+            return dict(fees) if fees is not None else None
+
+    def courses(self):
+        with self._lock:
+            return list(self._fees)
+
+    def update(self, course, year, component, amount):
+        """Set one fee and return the new version (KeyError for an unknown cohort)"""
+        with self._lock:
+            fees = self._fees[course][year]
+            if fees.get(component) == amount:
+                return self.version
+            fees[component] = amount
+            self.version += 1
+            self._cache.clear()
+            return self.version
+
+    def cached(self, name, build):
+        """build(fees) for the current version, computed once per version"""
+        with self._lock:
+            version = self.version
+            hit = self._cache.get(name)
+            if hit is not None and hit[0] == version:
+                return hit[1]
+            fees = copy.deepcopy(self._fees)
+        value = build(fees)
+        with self._lock:
+            # An update while building makes this value stale; don't keep it
+            if self.version == version:
+                self._cache[name] = (version, value)
+        return value
+
+    def as_json(self):
+        return self.cached('json', json.dumps)
+
+    def etag(self):
+        """Content hash of the current table, stable across restarts"""
+        return self.cached('etag', lambda fees: hashlib.sha256(
+            json.dumps(fees, sort_keys=True).encode('utf-8')).hexdigest()[:32])
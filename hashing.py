@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Password and passcode hashing off the request thread.
+
+PasswordHasher runs werkzeug's hashing in a small thread pool (scrypt and
+pbkdf2 release the GIL inside OpenSSL, so the pool hashes in parallel while
+request threads keep rendering pages). Requests beyond the pool plus a
+bounded backlog are refused with HashingBusy instead of piling up.
+
+Run this file to calibrate scrypt for the current machine:
+
+    python hashing.py --target-ms 250
+"""
+
+import argparse
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool and its backlog are full, or a hash times out"""
+
+
+def hash_method(pwhash):
+    """The method part of a werkzeug hash, e.g. 'scrypt:32768:8:1'"""
+    return pwhash.split('$', 1)[0]
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, workers=4, max_queue=64, timeout=10):
+        self.method = method
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hasher')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise HashingBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return hash_method(pwhash) != self.method
+
+    def verify(self, pwhash, password):
+        """Check a password; returns (matches, new_hash_or_None).
+
+        A new hash is returned when the stored one was made with outdated
+        parameters and should replace it.
+        """
+        if not self.check(pwhash, password):
+            return False, None
+        if self.needs_rehash(pwhash):
+            return True, self.hash(password)
+        return True, None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def time_method(method, rounds=5):
+    """Median seconds to hash one password with a werkzeug method string"""
+    password = secrets.token_urlsafe(12)
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash(password, method)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def calibrate(target_ms, r=8, p=1, min_log_n=12, max_log_n=20, rounds=5):
+    """Pick the largest scrypt N whose hash time stays within target_ms.
+
+    Returns (method, measured_ms) and the full list of measurements.
+    """
+    measurements = []
+    best = None
+    for log_n in range(min_log_n, max_log_n + 1):
+        method = f'scrypt:{2 ** log_n}:{r}:{p}'
+        elapsed_ms = time_method(method, rounds) * 1000
+        measurements.append((method, elapsed_ms))
+        if elapsed_ms > target_ms:
+            break
+        best = (method, elapsed_ms)
+    if best is None:
+        best = measurements[0]
+    return best, measurements
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate password hashing cost for this machine')
+    parser.add_argument('--target-ms', type=float, default=250, help='target time per hash in milliseconds')
+    parser.add_argument('--rounds', type=int, default=5, help='samples per setting')
+    args = parser.parse_args()
+
+    (method, elapsed_ms), measurements = calibrate(args.target_ms, rounds=args.rounds)
+    for candidate, candidate_ms in measurements:
+        print(f"{candidate:<22} {candidate_ms:8.1f} ms")
+    print()
+    print(f"Recommended: PASSWORD_HASH_METHOD={method}  ({elapsed_ms:.1f} ms per hash)")
+
+
+if __name__ == '__main__':
+    main()
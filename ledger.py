@@ -0,0 +1,59 @@
+"""
+Transaction ledger for EduPay.
+
+Keeps every student's transactions in a per-user list ordered by date, so
+the latest N entries are a slice off the end. Collection totals live in the
+rollup cube (rollups.py).
+"""
+
+import threading
+from bisect import insort
+
+
+def _entry_date(transaction):
+    return transaction['date']
+
+
+class TransactionLedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_user = {}
+
+    def open_account(self, user_id):
+        """Make sure a user has a (possibly empty) transaction list"""
+        with self._lock:
+            self._by_user.setdefault(user_id, [])
+
+    def append(self, user_id, transaction):
+        """Record a transaction in date order"""
+        with self._lock:
+            entries = self._by_user.setdefault(user_id, [])
+            if not entries or entries[-1]['date'] <= transaction['date']:
+                entries.append(transaction)
+            else:
+                # Replayed or back-dated entry: keep the list in date order
+                insort(entries, transaction, key=_entry_date)
+        return transaction
+
+    def entries(self, user_id):
+        """Return a copy of a user's transactions, oldest first"""
+        with self._lock:
+            return list(self._by_user.get(user_id, ()))
+
+    def history(self, user_id, before=None, limit=20):
+        """Page backwards through a user's transactions, newest first.
+
+        before is a position in the date-ordered list (None for the newest
+        end); returns the page and the position to pass for the next one,
+        or None when the oldest entry has been reached.
+        """
+        with self._lock:
+            entries = self._by_user.get(user_id, ())
+            end = len(entries) if before is None else max(0, min(before, len(entries)))
+            start = max(0, end - limit)
+            page = list(entries[start:end][::-1])
+        return page, (start if start > 0 else None)
+
+    def user_ids(self):
+        with self._lock:
+            return list(self._by_user)
@@ -0,0 +1,41 @@
+"""
+Striped locks for per-account mutations.
+
+A fixed table of locks is shared by all accounts, each account id hashing
+to one stripe. Writes to the same account always serialise on the same
+lock, while writes to different accounts usually land on different stripes
+and run side by side. The table never grows, however many accounts exist.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class LockStripes:
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _index(self, key):
+        return hash(key) % len(self._locks)
+
+    def for_key(self, key):
+        """The lock guarding key"""
+        return self._locks[self._index(key)]
+
+    @contextmanager
+    def many(self, keys):
+        """Hold the locks for several keys at once.
+
+        Stripes are taken in index order so two callers locking overlapping
+        sets of accounts cannot deadlock.
+        """
+        indexes = sorted({self._index(key) for key in keys})
+        acquired = []
+        try:
+            for index in indexes:
+                self._locks[index].acquire()
+                acquired.append(index)
+            yield
+        finally:
+            for index in reversed(acquired):
+                self._locks[index].release()
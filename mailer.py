@@ -0,0 +1,186 @@
+"""
+Background delivery of receipt emails.
+
+Payments hand a message builder to ReceiptMailer.submit() and return
+immediately. A small pool of worker threads pulls jobs off a bounded queue,
+builds the message (including the PDF) and sends it over an SMTP session
+that each worker keeps open between jobs. Failed sends are retried with
+exponential backoff and every state change is reported to the job's status
+callback.
+"""
+
+import queue
+import smtplib
+import threading
+import time
+
+
+def is_retryable(error):
+    """Connection trouble and 4xx replies are worth another attempt"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPNotSupportedError)):
+        return False
+    return isinstance(error, OSError)
+
+
+class ReceiptMailer:
+    def __init__(self, config, smtp_factory=smtplib.SMTP):
+        self.config = config
+        self.smtp_factory = smtp_factory
+        self.workers = config.get('workers', 2)
+        self.max_attempts = config.get('max_attempts', 4)
+        self.retry_backoff = config.get('retry_backoff', 2.0)
+        # Servers drop idle connections; probe with NOOP before reusing one
+        # that has been idle longer than this.
+        self.idle_check = config.get('idle_check', 30)
+        self._queue = queue.Queue(maxsize=config.get('queue_size', 1000))
+        self._stopped = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def submit(self, build_message, on_status=None):
+        """Queue a delivery; returns False when the queue is full"""
+        self.start()
+        try:
+            self._queue.put_nowait((build_message, on_status))
+        except queue.Full:
+            self._report(on_status, 'failed', 0, 'mail queue full')
+            return False
+        self._report(on_status, 'queued', 0, None)
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if not self._threads:
+                self._threads = [
+                    threading.Thread(target=self._run, name=f'receipt-mailer-{i}', daemon=True)
+                    for i in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+
+    def stop(self, timeout=None):
+        """Let the workers finish what is queued, then close their sessions.
+
+        Never blocks on a full queue: if there is no room to queue a stop for
+        every worker, the jobs still queued are reported failed instead.
+        """
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                self._stopped.set()
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+        self._stopped.set()
+        self._threads = []
+
+    def join(self):
+        """Block until every queued job has been processed"""
+        self._queue.join()
+
+    def _run(self):
+        session = _Session(self)
+        try:
+            while True:
+                try:
+                    # Once stopped, drain what is left and exit when empty
+                    job = self._queue.get(block=not self._stopped.is_set())
+                except queue.Empty:
+                    return
+                try:
+                    if job is None:
+                        return
+                    if self._stopped.is_set():
+                        self._report(job[1], 'failed', 0, 'mailer stopped')
+                        continue
+                    self._deliver(session, *job)
+                finally:
+                    self._queue.task_done()
+        finally:
+            session.close()
+
+    def _deliver(self, session, build_message, on_status):
+        try:
+            message = build_message()
+        except Exception as e:
+            print(f"Receipt email build failed: {e}")
+            self._report(on_status, 'failed', 0, str(e))
+            return
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                session.send(message)
+                self._report(on_status, 'sent', attempt, None)
+                return
+            except Exception as e:
+                session.close()
+                error = e
+                if not is_retryable(e):
+                    break
+
+            if attempt < self.max_attempts:
+                self._report(on_status, 'retrying', attempt, str(error))
+                if self._stopped.wait(self.retry_backoff * 2 ** (attempt - 1)):
+                    break
+
+        print(f"Email sending failed: {error}")
+        self._report(on_status, 'failed', attempt, str(error))
+
+    @staticmethod
+    def _report(on_status, status, attempts, error):
+        if on_status is None:
+            return
+        try:
+            on_status(status, attempts, error)
+        except Exception as e:
+            print(f"Email status callback error: {e}")
+
+
+class _Session:
+    """One worker's long-lived SMTP connection"""
+
+    def __init__(self, mailer):
+        self.mailer = mailer
+        self.server = None
+        self.last_used = 0.0
+
+    def send(self, message):
+        if self.server is not None and time.monotonic() - self.last_used > self.mailer.idle_check:
+            try:
+                self.server.noop()
+            except OSError:
+                self.close()
+        if self.server is None:
+            self.server = self._connect()
+        self.server.send_message(message)
+        self.last_used = time.monotonic()
+
+    def _connect(self):
+        config = self.mailer.config
+        server = self.mailer.smtp_factory(config['smtp_server'], config['smtp_port'], timeout=config.get('timeout', 30))
+        try:
+            if config.get('use_tls', True):
+                server.starttls()
+            if config.get('password'):
+                server.login(config['email'], config['password'])
+        except BaseException:
+            server.close()
+            raise
+        return server
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
@@ -0,0 +1,71 @@
+"""
+Rendered-page cache.
+
+Pages are cached under a key that includes the viewer's role, so a page is
+only ever served to the kind of visitor it was rendered for. Each entry
+remembers the versions of the data tags it was built from ('payments',
+'fees', ...). invalidate() bumps a tag's version, which makes every entry
+built from it stale without visiting the entries. Entries carry a content
+ETag and their render time for conditional GETs, and the least recently
+used ones are dropped beyond max_entries.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+CachedPage = namedtuple('CachedPage', 'body mimetype etag last_modified tag_versions')
+
+
+class PageCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def versions(self, tags):
+        """Current versions of tags; take them before rendering and pass them to put()"""
+        with self._lock:
+            return tuple(self._tags.get(tag, 0) for tag in tags)
+
+    def get(self, key, tags):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None and page.tag_versions == tuple(self._tags.get(tag, 0) for tag in tags):
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return page
+            if page is not None:
+                del self._pages[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, tag_versions, body, mimetype):
+        """Store a rendered body; tag_versions are those read before rendering it"""
+        page = CachedPage(
+            body=body,
+            mimetype=mimetype,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            # HTTP dates have whole seconds
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+            tag_versions=tag_versions
+        )
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        return page
+
+    def invalidate(self, *tags):
+        """Mark every page built from any of tags as stale"""
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
@@ -1,193 +1,393 @@
-import razorpay
-import stripe
-import requests
-import json
+"""
+Payment gateway client for Razorpay, Stripe and PayPal.
+
+Gateway calls run as coroutines on one event loop in a dedicated thread,
+over a shared aiohttp keep-alive pool. A Flask worker hands a call to the
+loop and waits at most the call's deadline; when the deadline passes the
+coroutine is cancelled, so a slow provider holds an idle coroutine and a
+pooled connection instead of a worker blocked on a socket timeout. Each
+provider also has a cap on calls in flight: once it is reached, further
+calls fail at once with GatewayBusy rather than queueing workers behind
+the slow ones.
+
+Orders created here are kept in an order store (the app's repository) until
+they are verified, so a payment is credited once, to the user who created
+it, for the amount it was created with, whichever worker process handles
+the verification.
+"""
+
+import asyncio
+import base64
+import concurrent.futures
+import hashlib
+import hmac
+import threading
+import time
 from datetime import datetime
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+import aiohttp
+
+GATEWAY_NAMES = {'razorpay': 'Razorpay', 'stripe': 'Stripe', 'paypal': 'PayPal'}
+REQUIRED_CREDENTIALS = {
+    'razorpay': ('key_id', 'key_secret'),
+    'stripe': ('secret_key',),
+    'paypal': ('client_id', 'client_secret'),
+}
+DEFAULT_BASE_URLS = {
+    'razorpay': 'https://api.razorpay.com',
+    'stripe': 'https://api.stripe.com',
+    'paypal': 'https://api.sandbox.paypal.com',
+}
+# The key that identifies a payment in create() results and verify() requests
+REFERENCE_KEYS = {'razorpay': 'order_id', 'stripe': 'payment_intent_id', 'paypal': 'order_id'}
+# Fees are billed in rupees, so every provider is asked for INR
+CURRENCY = 'INR'
+# Refresh the PayPal token this many seconds before PayPal says it expires
+TOKEN_EXPIRY_MARGIN = 60
+# Orders not verified within this many seconds are no longer accepted
+ORDER_TTL = 24 * 3600
+
+
+def basic_auth(username, password):
+    credentials = base64.b64encode(f'{username}:{password}'.encode('utf-8')).decode('ascii')
+    return f'Basic {credentials}'
+
+
+def minor_units(amount):
+    """Paise for an amount in rupees"""
+    return int(round(amount * 100))
+
+
+class GatewayBusy(Exception):
+    """Too many calls to one provider are already in flight"""
+
 
 class PaymentGateway:
-    def __init__(self):
-        # Razorpay configuration (supports GPay, PhonePe, Paytm, etc.)
-        razorpay_key_id = os.getenv('RAZORPAY_KEY_ID')
-        razorpay_secret = os.getenv('RAZORPAY_KEY_SECRET')
-        if razorpay_key_id and razorpay_secret:
-            self.razorpay_client = razorpay.Client(auth=(razorpay_key_id, razorpay_secret))
-        else:
-            self.razorpay_client = None
-        
-        # Stripe configuration
-        stripe_secret = os.getenv('STRIPE_SECRET_KEY')
-        if stripe_secret:
-            stripe.api_key = stripe_secret
-        else:
-            stripe.api_key = None
-        
-        # PayPal configuration
-        self.paypal_client_id = os.getenv('PAYPAL_CLIENT_ID')
-        self.paypal_client_secret = os.getenv('PAYPAL_CLIENT_SECRET')
-        self.paypal_base_url = 'https://api.sandbox.paypal.com'  # Use live URL for production
-
-    def create_razorpay_order(self, amount, currency='INR', receipt=None):
-        """Create Razorpay order for UPI payments (GPay, PhonePe, etc.)"""
-        if not self.razorpay_client:
-            return {'success': False, 'error': 'Razorpay not configured'}
-        
-        try:
-            order_data = {
-                'amount': int(amount * 100),  # Amount in paise
-                'currency': currency,
-                'receipt': receipt or f'receipt_{datetime.now().strftime("%Y%m%d_%H%M%S")}',
-                'payment_capture': 1
-            }
-            order = self.razorpay_client.order.create(data=order_data)
-            return {
-                'success': True,
-                'order_id': order['id'],
-                'amount': order['amount'],
-                'currency': order['currency'],
-                'key_id': os.getenv('RAZORPAY_KEY_ID')
-            }
-        except razorpay.errors.BadRequestError as e:
-            print(f"Razorpay order creation failed: {e}")
-            return {'success': False, 'error': 'Order creation failed'}
-        except Exception as e:
-            print(f"Razorpay order creation error: {e}")
-            return {'success': False, 'error': 'Payment service unavailable'}
-
-    def verify_razorpay_payment(self, payment_id, order_id, signature):
-        """Verify Razorpay payment signature"""
-        if not self.razorpay_client:
-            print("Razorpay verification failed: client not configured")
-            return {'success': False, 'error': 'Payment verification unavailable'}
-        
+    def __init__(self, gateways, orders, deadline=8.0, max_in_flight=32, pool_size=100, order_ttl=ORDER_TTL):
+        """gateways maps a gateway id to its credentials and optional base_url;
+        orders stores pending orders (save_order/claim_order, see repository.py)"""
+        self.gateways = gateways
+        self.orders = orders
+        self.deadline = deadline
+        self.max_in_flight = max_in_flight
+        self.pool_size = pool_size
+        self.order_ttl = order_ttl
+        self._in_flight = dict.fromkeys(GATEWAY_NAMES, 0)
+        self._counter_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        # Owned by the loop thread
+        self._http = None
+        self._paypal_token = None
+        self._paypal_token_expires = 0.0
+        self._paypal_token_lock = None
+        self.paypal_token_requests = 0
+
+    def configured(self, gateway_id):
+        credentials = self.gateways.get(gateway_id) or {}
+        required = REQUIRED_CREDENTIALS.get(gateway_id)
+        return bool(required) and all(credentials.get(key) for key in required)
+
+    def in_flight(self, gateway_id):
+        with self._counter_lock:
+            return self._in_flight[gateway_id]
+
+    def create(self, gateway_id, amount, owner=None, deadline=None):
+        """Create an order (or Stripe payment intent) for amount rupees.
+
+        Returns {'success': True, ...} with what the browser needs to take the
+        payment, or {'success': False, 'error': ...}; a call that ran out of
+        time also has 'timeout': True. Raises GatewayBusy when the provider
+        already has max_in_flight calls outstanding.
+        """
+        create = {
+            'razorpay': self._create_razorpay_order,
+            'stripe': self._create_stripe_payment_intent,
+            'paypal': self._create_paypal_order,
+        }
+        result = self._run(gateway_id, deadline, create[gateway_id], amount)
+        if result.get('success'):
+            self._remember(gateway_id, result[REFERENCE_KEYS[gateway_id]], owner, amount)
+        return result
+
+    def verify(self, gateway_id, owner, payment, deadline=None):
+        """Confirm with the provider that a payment created by owner went through.
+
+        payment holds the reference create() returned, under the same key, and
+        for Razorpay the checkout's payment_id and signature. Each order is
+        confirmed at most once; the result carries the amount it was created for.
+        """
+        reference = payment.get(REFERENCE_KEYS[gateway_id]) if gateway_id in REFERENCE_KEYS else None
+        order = self._claim(gateway_id, reference, owner)
+        if order is None:
+            return {'success': False, 'error': 'Unknown payment'}
+        verify = {
+            'razorpay': self._verify_razorpay_payment,
+            'stripe': self._verify_stripe_payment_intent,
+            'paypal': self._capture_paypal_order,
+        }
+        result = {'success': False, 'error': 'Payment verification failed'}
         try:
-            params_dict = {
-                'razorpay_order_id': order_id,
-                'razorpay_payment_id': payment_id,
-                'razorpay_signature': signature
-            }
-            self.razorpay_client.utility.verify_payment_signature(params_dict)
-            print(f"Razorpay payment verified successfully: {payment_id}")
-            return {'success': True}
-        except razorpay.errors.SignatureVerificationError as e:
-            print(f"Razorpay signature verification failed: {e}")
-            return {'success': False, 'error': 'Payment verification failed'}
-        except Exception as e:
-            print(f"Razorpay verification error: {e}")
-            return {'success': False, 'error': 'Payment verification failed'}
+            result = self._run(gateway_id, deadline, verify[gateway_id], reference, payment)
+        finally:
+            if not result.get('success'):
+                # Let the user retry a payment that could not be confirmed yet
+                self._restore(gateway_id, reference, order)
+        if not result.get('success'):
+            return result
+        return {'success': True, 'amount': order['amount'], 'reference': reference}
+
+    @staticmethod
+    def _order_key(gateway_id, reference):
+        return f'{gateway_id}:{reference}'
+
+    def _remember(self, gateway_id, reference, owner, amount):
+        self.orders.save_order(self._order_key(gateway_id, reference),
+                               {'owner': owner, 'amount': amount, 'expires': time.time() + self.order_ttl})
 
-    def create_stripe_payment_intent(self, amount, currency='usd'):
-        """Create Stripe payment intent"""
-        if not stripe.api_key:
-            return {'success': False, 'error': 'Stripe not configured'}
-        
+    def _claim(self, gateway_id, reference, owner):
+        order = self.orders.claim_order(self._order_key(gateway_id, reference), owner)
+        if order is None or order['expires'] <= time.time():
+            return None
+        return order
+
+    def _restore(self, gateway_id, reference, order):
+        self.orders.save_order(self._order_key(gateway_id, reference), order)
+
+    def _run(self, gateway_id, deadline, coroutine_function, *args):
+        if not self.configured(gateway_id):
+            raise ValueError(f"Gateway {gateway_id} is not configured")
+        deadline = deadline or self.deadline
+        with self._counter_lock:
+            if self._in_flight[gateway_id] >= self.max_in_flight:
+                raise GatewayBusy(gateway_id)
+            self._in_flight[gateway_id] += 1
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=int(amount * 100),  # Amount in cents
-                currency=currency,
-                payment_method_types=['card'],
-            )
-            return {
-                'success': True,
-                'client_secret': intent.client_secret,
-                'publishable_key': os.getenv('STRIPE_PUBLISHABLE_KEY')
-            }
-        except stripe.error.StripeError as e:
-            print(f"Stripe payment intent creation failed: {e}")
-            return {'success': False, 'error': 'Payment processing failed'}
-        except Exception as e:
-            print(f"Stripe payment intent error: {e}")
-            return {'success': False, 'error': 'Payment service unavailable'}
-
-    def create_paypal_order(self, amount, currency='USD'):
-        """Create PayPal order"""
-        if not self.paypal_client_id or not self.paypal_client_secret:
-            return {'success': False, 'error': 'PayPal not configured'}
-        
+            future = asyncio.run_coroutine_threadsafe(
+                self._guarded(gateway_id, deadline, coroutine_function(*args)), self._ensure_loop())
+        except BaseException:
+            self._release(gateway_id)
+            raise
+        future.add_done_callback(lambda _: self._release(gateway_id))
         try:
-            # Get access token
-            auth_response = requests.post(
-                f'{self.paypal_base_url}/v1/oauth2/token',
-                headers={'Accept': 'application/json', 'Accept-Language': 'en_US'},
+            # The coroutine enforces the deadline itself; this is a backstop
+            return future.result(deadline + 1)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return self._timed_out(gateway_id, deadline)
+
+    def _release(self, gateway_id):
+        with self._counter_lock:
+            self._in_flight[gateway_id] -= 1
+
+    @staticmethod
+    def _timed_out(gateway_id, deadline):
+        name = GATEWAY_NAMES[gateway_id]
+        print(f"{name} call exceeded its {deadline:.1f}s deadline")
+        return {'success': False, 'error': f'{name} did not respond in time', 'timeout': True}
+
+    async def _guarded(self, gateway_id, deadline, coroutine):
+        name = GATEWAY_NAMES[gateway_id]
+        try:
+            return await asyncio.wait_for(coroutine, deadline)
+        except asyncio.TimeoutError:
+            return self._timed_out(gateway_id, deadline)
+        except (aiohttp.ClientError, ValueError, KeyError) as e:
+            print(f"{name} request error: {e}")
+            return {'success': False, 'error': f'{name} service unavailable'}
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='gateway-loop', daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def close(self):
+        """Close the connection pool and stop the loop thread"""
+        with self._start_lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        if self._http is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._http.close(), loop).result(5)
+            except (concurrent.futures.TimeoutError, RuntimeError) as e:
+                print(f"Gateway pool close error: {e}")
+            self._http = None
+        self._paypal_token_lock = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+    def _session(self):
+        if self._http is None:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30))
+        return self._http
+
+    def _base_url(self, gateway_id):
+        return self.gateways[gateway_id].get('base_url') or DEFAULT_BASE_URLS[gateway_id]
+
+    async def _create_razorpay_order(self, amount):
+        """Razorpay order for UPI payments (GPay, PhonePe, etc.)"""
+        config = self.gateways['razorpay']
+        order_data = {
+            'amount': minor_units(amount),
+            'currency': CURRENCY,
+            'receipt': f'receipt_{datetime.now().strftime("%Y%m%d_%H%M%S")}',
+            'payment_capture': 1
+        }
+        async with self._session().post(
+            f"{self._base_url('razorpay')}/v1/orders",
+            json=order_data,
+            headers={'Authorization': basic_auth(config['key_id'], config['key_secret'])}
+        ) as response:
+            if response.status != 200:
+                print(f"Razorpay order creation failed: HTTP {response.status}")
+                return {'success': False, 'error': 'Order creation failed'}
+            order = await response.json()
+        return {
+            'success': True,
+            'order_id': order['id'],
+            'amount': order['amount'],
+            'currency': order['currency'],
+            'key_id': config['key_id']
+        }
+
+    async def _verify_razorpay_payment(self, order_id, payment):
+        """Razorpay signs order_id|payment_id with the key secret"""
+        secret = self.gateways['razorpay']['key_secret']
+        message = f"{order_id}|{payment.get('payment_id', '')}"
+        expected = hmac.new(secret.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, str(payment.get('signature', ''))):
+            print(f"Razorpay signature verification failed for order {order_id}")
+            return {'success': False, 'error': 'Payment verification failed'}
+        return {'success': True}
+
+    async def _create_stripe_payment_intent(self, amount):
+        config = self.gateways['stripe']
+        async with self._session().post(
+            f"{self._base_url('stripe')}/v1/payment_intents",
+            data={
+                'amount': str(minor_units(amount)),
+                'currency': CURRENCY.lower(),
+                'payment_method_types[]': 'card'
+            },
+            headers={'Authorization': f"Bearer {config['secret_key']}"}
+        ) as response:
+            if response.status != 200:
+                print(f"Stripe payment intent creation failed: HTTP {response.status}")
+                return {'success': False, 'error': 'Payment processing failed'}
+            intent = await response.json()
+        return {
+            'success': True,
+            'payment_intent_id': intent['id'],
+            'client_secret': intent['client_secret'],
+            'publishable_key': config.get('publishable_key')
+        }
+
+    async def _verify_stripe_payment_intent(self, intent_id, payment):
+        config = self.gateways['stripe']
+        async with self._session().get(
+            f"{self._base_url('stripe')}/v1/payment_intents/{intent_id}",
+            headers={'Authorization': f"Bearer {config['secret_key']}"}
+        ) as response:
+            if response.status != 200:
+                print(f"Stripe payment intent lookup failed: HTTP {response.status}")
+                return {'success': False, 'error': 'Payment verification failed'}
+            intent = await response.json()
+        if intent.get('status') != 'succeeded':
+            return {'success': False, 'error': 'Payment not completed'}
+        return {'success': True}
+
+    async def _paypal_access_token(self):
+        """Cached PayPal access token; one coroutine refreshes it while the others wait"""
+        if self._paypal_token and time.monotonic() < self._paypal_token_expires:
+            return self._paypal_token
+        if self._paypal_token_lock is None:
+            self._paypal_token_lock = asyncio.Lock()
+        async with self._paypal_token_lock:
+            if self._paypal_token and time.monotonic() < self._paypal_token_expires:
+                return self._paypal_token
+            config = self.gateways['paypal']
+            self.paypal_token_requests += 1
+            async with self._session().post(
+                f"{self._base_url('paypal')}/v1/oauth2/token",
                 data='grant_type=client_credentials',
-                auth=(self.paypal_client_id, self.paypal_client_secret),
-                timeout=30
-            )
-            
-            if auth_response.status_code != 200:
-                return {'success': False, 'error': 'PayPal authentication failed'}
-            
-            auth_data = auth_response.json()
+                headers={
+                    'Accept': 'application/json',
+                    'Accept-Language': 'en_US',
+                    'Authorization': basic_auth(config['client_id'], config['client_secret']),
+                    'Content-Type': 'application/x-www-form-urlencoded'
+                }
+            ) as response:
+                if response.status != 200:
+                    return None
+                auth_data = await response.json()
             access_token = auth_data.get('access_token')
             if not access_token:
-                return {'success': False, 'error': 'PayPal authentication failed'}
-            
-            # Create order
-            order_data = {
-                'intent': 'CAPTURE',
-                'purchase_units': [{
-                    'amount': {
-                        'currency_code': currency,
-                        'value': str(amount)
-                    }
-                }]
-            }
-            
-            order_response = requests.post(
-                f'{self.paypal_base_url}/v2/checkout/orders',
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {access_token}'
-                },
-                data=json.dumps(order_data),
-                timeout=30
-            )
-            
-            if order_response.status_code == 201:
-                order = order_response.json()
-                return {
-                    'success': True,
-                    'order_id': order['id'],
-                    'client_id': self.paypal_client_id
+                return None
+            lifetime = max(float(auth_data.get('expires_in', 0)) - TOKEN_EXPIRY_MARGIN, 0)
+            self._paypal_token = access_token
+            self._paypal_token_expires = time.monotonic() + lifetime
+            return access_token
+
+    async def _paypal_post(self, path, body, headers=None):
+        """POST to PayPal with the cached token; returns (status, JSON body) or None without a token"""
+        for attempt in range(2):
+            access_token = await self._paypal_access_token()
+            if not access_token:
+                return None
+            async with self._session().post(
+                f"{self._base_url('paypal')}{path}",
+                json=body,
+                headers={'Authorization': f'Bearer {access_token}', **(headers or {})}
+            ) as response:
+                status = response.status
+                data = await response.json() if status in (200, 201) else None
+            if status != 401:
+                break
+            # Token revoked or expired early: fetch a new one and retry once
+            if self._paypal_token == access_token:
+                self._paypal_token = None
+        return status, data
+
+    async def _create_paypal_order(self, amount):
+        config = self.gateways['paypal']
+        order_data = {
+            'intent': 'CAPTURE',
+            'purchase_units': [{
+                'amount': {
+                    'currency_code': CURRENCY,
+                    'value': f'{amount:.2f}'
                 }
-            else:
-                return {'success': False, 'error': 'PayPal order creation failed'}
-                
-        except requests.exceptions.RequestException as e:
-            print(f"PayPal request error: {e}")
-            return {'success': False, 'error': 'PayPal service unavailable'}
-        except Exception as e:
-            print(f"PayPal order creation error: {e}")
-            return {'success': False, 'error': 'Payment service unavailable'}
-
-    def get_supported_gateways(self):
-        """Get list of supported payment gateways"""
-        return [
-            {
-                'id': 'razorpay',
-                'name': 'Razorpay (UPI/GPay/PhonePe)',
-                'description': 'Pay using UPI, GPay, PhonePe, Paytm, Cards',
-                'currency': 'INR',
-                'icon': '💳'
-            },
-            {
-                'id': 'stripe',
-                'name': 'Stripe (Cards)',
-                'description': 'Pay using Credit/Debit Cards',
-                'currency': 'USD',
-                'icon': '💳'
-            },
-            {
-                'id': 'paypal',
-                'name': 'PayPal',
-                'description': 'Pay using PayPal account',
-                'currency': 'USD',
-                'icon': '🅿️'
-            }
-        ]
-
-# Initialize payment gateway
-payment_gateway = PaymentGateway()
\ No newline at end of file
+            }]
+        }
+        response = await self._paypal_post('/v2/checkout/orders', order_data)
+        if response is None:
+            return {'success': False, 'error': 'PayPal authentication failed'}
+        status, order = response
+        if status != 201:
+            return {'success': False, 'error': 'PayPal order creation failed'}
+        return {
+            'success': True,
+            'order_id': order['id'],
+            'client_id': config['client_id']
+        }
+
+    async def _capture_paypal_order(self, order_id, payment):
+        # The request id makes a retried capture return the first capture's result
+        response = await self._paypal_post(f'/v2/checkout/orders/{order_id}/capture', {},
+                                           headers={'PayPal-Request-Id': f'capture-{order_id}'})
+        if response is None:
+            return {'success': False, 'error': 'PayPal authentication failed'}
+        status, capture = response
+        if status not in (200, 201) or capture.get('status') != 'COMPLETED':
+            print(f"PayPal capture failed for order {order_id}: HTTP {status}")
+            return {'success': False, 'error': 'Payment verification failed'}
+        return {'success': True}
@@ -0,0 +1,196 @@
+"""
+Rate limiting for login endpoints.
+
+Each key holds a sliding-window counter made of two fixed-window counts:
+the current window and the one before it, weighted by how much of the
+previous window still overlaps the sliding one. That is three numbers per
+key regardless of how many attempts arrive. Idle keys are evicted on a
+timer and the in-memory table is capped in size.
+
+SQLiteRateLimitBackend keeps the same counters in a local SQLite file so
+every worker process on the host shares one set of limits.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _slide(entry, now, window):
+    """Roll a [window_start, previous, current] entry forward to now"""
+    start, previous, current = entry
+    elapsed = now - start
+    if elapsed >= 2 * window:
+        return [now - (now % window), 0, 0]
+    if elapsed >= window:
+        return [start + window, current, 0]
+    return entry
+
+
+def _estimate(entry, now, window):
+    start, previous, current = entry
+    overlap = 1 - (now - start) / window
+    return previous * overlap + current
+
+
+class MemoryRateLimitBackend:
+    def __init__(self, max_keys=100000, evict_every=60):
+        self.max_keys = max_keys
+        self.evict_every = evict_every
+        self._entries = OrderedDict()
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._last_eviction = 0
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.pop(key, None) or [now - (now % window), 0, 0]
+            entry = _slide(entry, now, window)
+            allowed = _estimate(entry, now, window) < limit
+            if allowed:
+                entry[2] += 1
+            self._entries[key] = entry
+            self._windows[key] = window
+            while len(self._entries) > self.max_keys:
+                old_key, _ = self._entries.popitem(last=False)
+                self._windows.pop(old_key, None)
+            if now - self._last_eviction >= self.evict_every:
+                self._evict(now)
+        return allowed
+
+    def _evict(self, now):
+        for key, entry in list(self._entries.items()):
+            window = self._windows[key]
+            if now - entry[0] < 2 * window:
+                continue
+            del self._entries[key]
+            del self._windows[key]
+        self._last_eviction = now
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        pass
+
+
+class SQLiteRateLimitBackend:
+    def __init__(self, path, evict_every=60):
+        self.path = path
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._last_eviction = 0
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limits ('
+                'key TEXT PRIMARY KEY, window_start REAL, previous INTEGER, '
+                'current INTEGER, expires REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS rate_limits_expires ON rate_limits (expires)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front so two workers cannot both
+        # read the same count and both let an attempt through
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT window_start, previous, current FROM rate_limits WHERE key = ?', (key,)
+            ).fetchone()
+            entry = _slide(list(row) if row else [now - (now % window), 0, 0], now, window)
+            allowed = _estimate(entry, now, window) < limit
+            if allowed:
+                entry[2] += 1
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?)',
+                (key, entry[0], entry[1], entry[2], entry[0] + 2 * window)
+            )
+            if now - self._last_eviction >= self.evict_every:
+                conn.execute('DELETE FROM rate_limits WHERE expires <= ?', (now,))
+                self._last_eviction = now
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM rate_limits').fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+
+    @classmethod
+    def from_config(cls, config):
+        if config.get('backend') == 'sqlite':
+            try:
+                return cls(SQLiteRateLimitBackend(config['path']))
+            except sqlite3.Error as e:
+                print(f"Rate limit database unavailable, limiting per process: {e}")
+        return cls(MemoryRateLimitBackend(config.get('max_keys', 100000)))
+
+    def hit(self, key, limit, window):
+        """Record an attempt for key; False once key is over limit per window"""
+        try:
+            return self.backend.hit(key, limit, window)
+        except sqlite3.Error as e:
+            # Fail open: a broken limiter must not lock everyone out
+            print(f"Rate limit check failed: {e}")
+            return True
+
+    def close(self):
+        self.backend.close()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens per second, up to capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, tokens=1):
+        """Take tokens if available; otherwise return the seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def take(self, tokens=1):
+        """Block until tokens are available"""
+        while True:
+            wait = self.try_take(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
@@ -0,0 +1,145 @@
+"""
+Cache for generated receipt PDFs.
+
+A paid receipt never changes, so rendered PDFs are kept under a key made of
+the transaction id and a hash of everything printed on the receipt. Recently
+used receipts stay in an in-memory LRU bounded by total bytes; receipts
+evicted from memory spill to a directory on disk and are promoted back on
+their next hit. The content hash doubles as the HTTP ETag.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def receipt_digest(kind, payment, course=None):
+    """Stable hash of everything that ends up on a receipt"""
+    content = json.dumps([kind, payment, course], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def receipt_key(kind, payment, course=None):
+    """Cache key and ETag for one receipt"""
+    digest = receipt_digest(kind, payment, course)
+    return f"{payment['transaction_id']}-{digest[:32]}", digest[:32]
+
+
+class ReceiptCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, spill_dir=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._scan_disk()
+
+    def get(self, key):
+        """Receipt bytes for key, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+            on_disk = key in self._disk
+        if on_disk:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self.put(key, data)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_or_render(self, key, render):
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def put(self, key, data):
+        spilled = []
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                old_key, old_data = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old_data)
+                spilled.append((old_key, old_data))
+        for old_key, old_data in spilled:
+            self._spill(old_key, old_data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
+
+    def _path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.pdf")
+
+    def _spill(self, key, data):
+        if not self.spill_dir:
+            return
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                return
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.spill_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Receipt cache spill failed: {e}")
+            return
+        with self._lock:
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            expired = []
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                expired.append(old_key)
+        for old_key in expired:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _scan_disk(self):
+        entries = []
+        for name in os.listdir(self.spill_dir):
+            if name.endswith('.pdf'):
+                path = os.path.join(self.spill_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
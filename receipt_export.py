@@ -0,0 +1,123 @@
+"""
+Bulk receipt export.
+
+Receipts are rendered in batches across a process pool and written into a
+ZIP archive that is streamed to the client as batches complete. Only a
+bounded number of batches is in flight at once and the archive is written
+to a forward-only stream, so memory stays flat however many receipts are
+exported.
+"""
+
+import multiprocessing
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from receipts import ReceiptEngine
+
+_engine = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(letterhead):
+    global _engine
+    _engine = ReceiptEngine(letterhead)
+
+
+def _render_batch(jobs):
+    return [(name, _engine.render(kind, payment, user)) for name, kind, payment, user in jobs]
+
+
+def _worker_context():
+    """Start method for render workers.
+
+    Not fork: the web process has threads holding locks. Workers are forked
+    from a forkserver that has preloaded the receipt code; platforms without
+    forkserver fall back to spawn. Either way each worker re-imports the main
+    script, so entry points keep their startup under a __main__ guard (see
+    run.py and the __mp_main__ check in app.py).
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    worker_context = multiprocessing.get_context('forkserver')
+    worker_context.set_forkserver_preload([__name__])
+    return worker_context
+
+
+def get_pool(letterhead, workers=None):
+    """The shared render pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=_worker_context(),
+                initializer=_init_worker,
+                initargs=(letterhead,)
+            )
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+class _ChunkWriter:
+    """Forward-only file object that hands written bytes back as chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b''.join(chunks)
+
+
+def stream_receipts_zip(jobs, pool, batch_size=25, max_in_flight=8):
+    """Yield a ZIP archive of rendered receipts, chunk by chunk.
+
+    jobs is an iterable of (archive_name, kind, payment, user) tuples.
+    """
+    writer = _ChunkWriter()
+    jobs = iter(jobs)
+    pending = set()
+
+    def submit_next():
+        batch = list(islice(jobs, batch_size))
+        if batch:
+            pending.add(pool.submit(_render_batch, batch))
+        return bool(batch)
+
+    try:
+        # PDF streams are already compressed, so store them as they are
+        with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            while len(pending) < max_in_flight and submit_next():
+                pass
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    for name, pdf in future.result():
+                        archive.writestr(name, pdf)
+                    submit_next()
+                chunk = writer.drain()
+                if chunk:
+                    yield chunk
+        yield writer.drain()
+    finally:
+        # Client went away or rendering failed: drop the remaining batches
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,189 @@
+"""
+Receipt rendering engine for student, parent and institution receipts.
+
+Everything on a receipt except the payment fields (letterhead, title, boxes,
+section headings, signature block and footer) is drawn into a form XObject
+and placed on the page, and the payment fields are drawn on top of it.
+"""
+
+import io
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+STATIC_FORM = 'ReceiptStatic'
+
+RECEIPT_LAYOUTS = {
+    'student': {
+        'title': 'FEE PAYMENT RECEIPT',
+        'number_prefix': 'FEE',
+        'party_heading': 'STUDENT DETAILS:',
+        'id_label': 'Register No',
+        'description_label': 'Fee Type',
+        'acknowledgement': 'Received the above amount towards fee payment.',
+    },
+    'parent': {
+        'title': 'FEE PAYMENT RECEIPT',
+        'number_prefix': 'FEE',
+        'party_heading': 'PARENT DETAILS:',
+        'id_label': 'Parent ID',
+        'party_line': 'Payment Type: Parent Payment',
+        'description_label': 'Description',
+        'acknowledgement': 'Received the above amount towards fee payment.',
+    },
+    'institution': {
+        'title': 'PAYMENT RECEIPT',
+        'number_prefix': 'INST',
+        'party_heading': 'INSTITUTION DETAILS:',
+        'id_label': 'Institution ID',
+        'party_line': 'Payment Type: Institution Payment',
+        'description_label': 'Description',
+        'acknowledgement': 'Received the above amount towards payment.',
+    },
+}
+
+
+def number_to_words(num):
+    """Convert number to words for Indian currency"""
+    if num == 0:
+        return "Zero Rupees Only"
+
+    ones = ["", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine",
+            "Ten", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen",
+            "Seventeen", "Eighteen", "Nineteen"]
+
+    tens = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
+
+    def convert_hundreds(n):
+        result = ""
+        if n >= 100:
+            result += ones[n // 100] + " Hundred "
+            n %= 100
+        if n >= 20:
+            result += tens[n // 10] + " "
+            n %= 10
+        if n > 0:
+            result += ones[n] + " "
+        return result
+
+    if num < 1000:
+        return convert_hundreds(num).strip() + " Rupees Only"
+    elif num < 100000:
+        thousands = num // 1000
+        remainder = num % 1000
+        result = convert_hundreds(thousands).strip() + " Thousand "
+        if remainder > 0:
+            result += convert_hundreds(remainder).strip() + " "
+        return result.strip() + " Rupees Only"
+    else:
+        return f"Rupees {num} Only"
+
+
+class ReceiptRenderer:
+    """Renders one kind of receipt on top of a cached static page"""
+
+    def __init__(self, kind, letterhead):
+        self.kind = kind
+        self.layout = RECEIPT_LAYOUTS[kind]
+        self.letterhead = letterhead
+        self.width, self.height = letter
+
+    def render(self, payment, user=None):
+        """Return the receipt for one payment as PDF bytes"""
+        buffer = io.BytesIO()
+        p = canvas.Canvas(buffer, pagesize=letter)
+        p.beginForm(STATIC_FORM)
+        self.draw_static(p)
+        p.endForm()
+        p.doForm(STATIC_FORM)
+        self.draw_fields(p, payment, user)
+        p.showPage()
+        p.save()
+        return buffer.getvalue()
+
+    def _draw_centered_text(self, p, text, y_pos, font_name, font_size):
+        p.setFont(font_name, font_size)
+        text_width = p.stringWidth(text, font_name, font_size)
+        p.drawString((self.width - text_width) / 2, y_pos, text)
+
+    def draw_static(self, p):
+        """Draw the parts of the page that are the same on every receipt"""
+        width, height = self.width, self.height
+        layout, letterhead = self.layout, self.letterhead
+
+        # University Letterhead
+        self._draw_centered_text(p, letterhead['name'], height - 40, "Helvetica-Bold", 18)
+        self._draw_centered_text(p, letterhead['subtitle'], height - 60, "Helvetica-Bold", 14)
+        self._draw_centered_text(p, letterhead['address'], height - 80, "Helvetica", 12)
+
+        # Title
+        self._draw_centered_text(p, layout['title'], height - 120, "Helvetica-Bold", 16)
+
+        # Receipt Box
+        p.rect(50, height - 500, width - 100, 350, stroke=1, fill=0)
+        p.line(70, height - 175, width - 70, height - 175)
+
+        # Section headings and fixed lines
+        p.setFont("Helvetica-Bold", 11)
+        p.drawString(70, height - 200, layout['party_heading'])
+        p.drawString(70, height - 290, "PAYMENT DETAILS:")
+        p.setFont("Helvetica", 11)
+        if 'party_line' in layout:
+            p.drawString(70, height - 260, layout['party_line'])
+        p.drawString(70, height - 350, "Payment Mode: Online")
+        p.drawString(70, height - 390, "Status: PAID")
+
+        # Amount in words box
+        p.rect(70, height - 440, width - 140, 40, stroke=1, fill=0)
+        p.setFont("Helvetica-Bold", 10)
+        p.drawString(75, height - 420, "Amount in Words:")
+
+        # Signature section
+        p.setFont("Helvetica", 10)
+        p.drawString(70, height - 470, layout['acknowledgement'])
+        p.drawRightString(width - 70, height - 520, "Authorized Signatory")
+        p.drawRightString(width - 70, height - 535, "Accounts Section")
+
+        # Footer
+        p.line(50, 80, width - 50, 80)
+        self._draw_centered_text(p, "This is a computer generated receipt and does not require signature.", 65, "Helvetica-Oblique", 9)
+        self._draw_centered_text(p, f"For any queries, contact: {letterhead['email']} | Ph: {letterhead['phone']}", 50, "Helvetica-Oblique", 9)
+        self._draw_centered_text(p, f"Visit: {letterhead['website']}", 35, "Helvetica-Oblique", 9)
+
+    def draw_fields(self, p, payment, user=None):
+        """Draw the per-payment values"""
+        width, height = self.width, self.height
+        layout = self.layout
+
+        p.setFont("Helvetica-Bold", 12)
+        p.drawString(70, height - 160, f"Receipt No: {layout['number_prefix']}/{payment['transaction_id']}")
+        p.drawRightString(width - 70, height - 160, f"Date: {payment['date'][:10]}")
+
+        p.setFont("Helvetica", 11)
+        p.drawString(70, height - 220, f"Name: {payment['user_name']}")
+        p.drawString(70, height - 240, f"{layout['id_label']}: {payment['user_id']}")
+        if 'party_line' not in layout:
+            p.drawString(70, height - 260, f"Course: {(user or {}).get('course', 'B.E / B.Tech')}")
+        p.drawString(70, height - 310, f"{layout['description_label']}: {payment['description']}")
+        p.drawString(70, height - 330, f"Amount Paid: Rs. {payment['amount']:.2f}")
+        p.drawString(70, height - 370, f"Transaction ID: {payment['transaction_id']}")
+
+        p.setFont("Helvetica", 10)
+        p.drawString(75, height - 435, number_to_words(int(payment['amount'])))
+
+
+class ReceiptEngine:
+    """One cached renderer per receipt kind"""
+
+    def __init__(self, letterhead):
+        self.letterhead = letterhead
+        self._renderers = {}
+
+    def renderer(self, kind):
+        renderer = self._renderers.get(kind)
+        if renderer is None:
+            renderer = self._renderers[kind] = ReceiptRenderer(kind, self.letterhead)
+        return renderer
+
+    def render(self, kind, payment, user=None):
+        return self.renderer(kind).render(payment, user)
@@ -0,0 +1,213 @@
+"""
+Reminder history.
+
+Reminders (single and bulk jobs) are appended to a fixed-size ring buffer
+under increasing sequence numbers. Entries pushed out of the ring are
+collected into segments and written to an archive directory as JSON lines,
+so memory stays bounded however many reminders are sent. Queries page
+backwards from a sequence cursor: the latest N is N ring slots, a time
+bound is a bisect over the ring, and each student's reminders are found
+through a short per-student deque of their latest sequence numbers instead
+of a scan. Those deques are capped and never hold entries longer than the
+ring does, so a bulk job to a whole cohort costs each recipient one slot
+rather than the log a copy of the recipient list.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+
+SEGMENT_PREFIX = 'reminders-'
+
+
+class ReminderLog:
+    def __init__(self, capacity=1000, segment_size=500, archive_dir=None, per_student=50):
+        self.capacity = capacity
+        self.segment_size = segment_size
+        self.archive_dir = archive_dir
+        self.per_student = per_student
+        # slot seq % capacity -> (seq, created, entry)
+        self._ring = [None] * capacity
+        self._next = 0
+        # The ring holds seqs _oldest .. _next - 1
+        self._oldest = 0
+        self._last_created = ''
+        # student id -> that student's latest per_student seqs, ascending;
+        # seqs that have since left the ring are skipped when read
+        self._by_student = {}
+        # evicted entries not yet written out, oldest first
+        self._segment = []
+        # [(first seq, last seq, path)] of archived segments, oldest first
+        self._segments = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            self._scan_archive()
+
+    def _scan_archive(self):
+        for name in os.listdir(self.archive_dir):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith('.jsonl')):
+                continue
+            try:
+                first, last = (int(part) for part in name[len(SEGMENT_PREFIX):-len('.jsonl')].split('-'))
+            except ValueError:
+                continue
+            self._segments.append((first, last, os.path.join(self.archive_dir, name)))
+        self._segments.sort()
+        if self._segments:
+            self._next = self._oldest = self._segments[-1][1] + 1
+
+    def add(self, entry, student_ids=()):
+        """Append entry (a dict, which may keep changing) and return its sequence number"""
+        created = entry.get('created_date') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        student_ids = dict.fromkeys(student_ids)
+        with self._lock:
+            # The time index needs non-decreasing times; clock steps back are clamped
+            created = max(created, self._last_created)
+            self._last_created = created
+            seq = self._next
+            slot = seq % self.capacity
+            if self._ring[slot] is not None:
+                self._evict(self._ring[slot])
+            self._ring[slot] = (seq, created, entry)
+            self._next += 1
+            self._oldest = max(self._oldest, self._next - self.capacity)
+            for student_id in student_ids:
+                seqs = self._by_student.get(student_id)
+                if seqs is None:
+                    seqs = self._by_student[student_id] = deque(maxlen=self.per_student)
+                seqs.append(seq)
+        return seq
+
+    def _evict(self, item):
+        seq, created, entry = item
+        self._segment.append({'seq': seq, 'created': created, 'entry': dict(entry)})
+        if len(self._segment) >= self.segment_size:
+            self._flush_segment()
+
+    def _flush_segment(self):
+        segment, self._segment = self._segment, []
+        if not self.archive_dir:
+            self.dropped += len(segment)
+            return
+        first, last = segment[0]['seq'], segment[-1]['seq']
+        path = os.path.join(self.archive_dir, f"{SEGMENT_PREFIX}{first:012d}-{last:012d}.jsonl")
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.archive_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for record in segment:
+                    f.write(json.dumps(record, default=str) + '\n')
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Reminder archive error: {e}")
+            self.dropped += len(segment)
+            return
+        self._segments.append((first, last, path))
+
+    def close(self):
+        """Archive everything still in memory so a restart keeps the full history"""
+        if not self.archive_dir:
+            return
+        with self._lock:
+            for seq in range(self._oldest, self._next):
+                slot = seq % self.capacity
+                self._evict(self._ring[slot])
+                self._ring[slot] = None
+            self._oldest = self._next
+            if self._segment:
+                self._flush_segment()
+
+    def __len__(self):
+        with self._lock:
+            return self._next - self._oldest
+
+    def _created_at(self, seq):
+        return self._ring[seq % self.capacity][1]
+
+    def recent(self, before=None, limit=10, since=None, until=None):
+        """Page backwards through all reminders, newest first.
+
+        before is the cursor from the previous page; since and until bound the
+        creation time ('YYYY-MM-DD HH:MM:SS' prefixes). Returns (entries,
+        next_before), each entry carrying its 'seq'; next_before is None on the
+        last page.
+        """
+        with self._lock:
+            start = self._next if before is None else min(before, self._next)
+            oldest = self._oldest
+            if until is not None and start > oldest:
+                # Skip everything newer than until with a bisect over the ring
+                key = until + '\xff'
+                low, high = oldest, start
+                while low < high:
+                    middle = (low + high) // 2
+                    if self._created_at(middle) < key:
+                        low = middle + 1
+                    else:
+                        high = middle
+                start = low
+            records = []
+            seq = start - 1
+            while seq >= oldest and len(records) <= limit:
+                _, created, entry = self._ring[seq % self.capacity]
+                if since is not None and created < since:
+                    return self._page(records, limit)
+                records.append((seq, created, dict(entry)))
+                seq -= 1
+            if len(records) > limit or seq < 0:
+                return self._page(records, limit)
+            archived = list(reversed(self._segment)), list(self._segments)
+        # Older pages come from the unwritten segment and the archive files
+        for record in self._archived(seq + 1, *archived):
+            if len(records) > limit:
+                break
+            if until is not None and record['created'] >= until + '\xff':
+                continue
+            if since is not None and record['created'] < since:
+                break
+            records.append((record['seq'], record['created'], record['entry']))
+        return self._page(records, limit)
+
+    @staticmethod
+    def _page(records, limit):
+        entries = [dict(entry, seq=seq) for seq, _, entry in records[:limit]]
+        next_before = records[limit - 1][0] if len(records) > limit else None
+        return entries, next_before
+
+    @staticmethod
+    def _archived(before, pending, segments):
+        """Archived records with seq < before, newest first"""
+        for record in pending:
+            if record['seq'] < before:
+                yield record
+        position = bisect_left(segments, (before,))
+        for first, last, path in reversed(segments[:position]):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+            except (OSError, ValueError) as e:
+                print(f"Reminder archive error: {e}")
+                continue
+            for record in reversed(records):
+                if record['seq'] < before:
+                    yield record
+
+    def for_student(self, student_id, before=None, limit=10):
+        """Page backwards through one student's latest reminders, newest first.
+
+        Covers the student's last per_student reminders that are still in the
+        ring; older ones are only reachable through recent().
+        """
+        with self._lock:
+            oldest = self._oldest
+            end = self._next if before is None else before
+            seqs = [seq for seq in self._by_student.get(student_id, ()) if oldest <= seq < end]
+            page = seqs[-limit:]
+            entries = [dict(self._ring[seq % self.capacity][2], seq=seq) for seq in reversed(page)]
+            next_before = page[0] if len(seqs) > limit else None
+        return entries, next_before
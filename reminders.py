@@ -0,0 +1,188 @@
+"""
+Bulk reminder dispatch.
+
+A bulk reminder becomes a job: the request resolves the recipients and
+hands them to ReminderDispatcher, which renders the messages a batch at a
+time on a background worker and sends each batch through its channel
+(email, SMS, ...). Every channel has its own token bucket so a large job
+cannot exceed what the provider accepts. Job progress is kept in a plain
+dict that callers can poll.
+
+OutboxChannel is a local stand-in that records what it was asked to send;
+it is the default for SMS and for email unless SMTP delivery is enabled.
+"""
+
+import queue
+import smtplib
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from email.mime.text import MIMEText
+from itertools import islice
+
+from rate_limit import TokenBucket
+
+
+class OutboxChannel:
+    """Stand-in channel that keeps the most recent messages it was given"""
+
+    def __init__(self, name, keep=1000):
+        self.name = name
+        self.outbox = deque(maxlen=keep)
+        self.delivered = 0
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        with self._lock:
+            self.outbox.extend(messages)
+            self.delivered += len(messages)
+        return [None] * len(messages)
+
+
+class SMTPEmailChannel:
+    """Sends a batch of plain-text emails over one SMTP connection"""
+
+    name = 'email'
+
+    def __init__(self, config, smtp_factory=smtplib.SMTP):
+        self.config = config
+        self.smtp_factory = smtp_factory
+
+    def send_batch(self, messages):
+        config = self.config
+        try:
+            server = self.smtp_factory(config['smtp_server'], config['smtp_port'], timeout=config.get('timeout', 30))
+        except (smtplib.SMTPException, OSError) as e:
+            return [str(e)] * len(messages)
+        errors = []
+        try:
+            if config.get('use_tls', True):
+                server.starttls()
+            if config.get('password'):
+                server.login(config['email'], config['password'])
+            for message in messages:
+                mail = MIMEText(message['text'])
+                mail['From'] = config['email']
+                mail['To'] = message['address']
+                mail['Subject'] = message['subject']
+                try:
+                    server.send_message(mail)
+                    errors.append(None)
+                except (smtplib.SMTPException, OSError) as e:
+                    errors.append(str(e))
+        except (smtplib.SMTPException, OSError) as e:
+            errors.extend([str(e)] * (len(messages) - len(errors)))
+        finally:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+        return errors
+
+
+class ReminderDispatcher:
+    def __init__(self, channels, rates, batch_size=200, keep_jobs=500):
+        """channels maps a channel name to a channel; rates to messages per second"""
+        self.channels = channels
+        self.batch_size = batch_size
+        self.keep_jobs = keep_jobs
+        self._buckets = {name: TokenBucket(rate, max(1, int(rate))) for name, rate in rates.items()}
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, recipients, render, **details):
+        """Queue a job sending render(batch) to each batch of recipients.
+
+        Returns the job's progress dict, which is updated as it runs.
+        """
+        job = dict(
+            details,
+            id=details.get('id') or str(uuid.uuid4())[:8],
+            created_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            status='queued',
+            total=len(recipients),
+            sent=0,
+            failed=0
+        )
+        with self._lock:
+            self._jobs[job['id']] = job
+            # Forget the oldest finished jobs once there are too many to poll
+            for old_id in [key for key, old in self._jobs.items() if old['status'] in ('sent', 'failed')]:
+                if len(self._jobs) <= self.keep_jobs:
+                    break
+                del self._jobs[old_id]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='reminder-dispatch', daemon=True)
+                self._thread.start()
+        self._queue.put((job, recipients, render))
+        return job
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def join(self):
+        """Block until every queued job has been processed"""
+        self._queue.join()
+
+    def stop(self, timeout=None):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._process(*item)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job, recipients, render):
+        self._update(job, status='sending')
+        remaining = iter(recipients)
+        try:
+            while True:
+                batch = list(islice(remaining, self.batch_size))
+                if not batch:
+                    break
+                by_channel = {}
+                for message in render(batch):
+                    by_channel.setdefault(message['channel'], []).append(message)
+                for name, messages in by_channel.items():
+                    self._send(job, name, messages)
+        except Exception as e:
+            print(f"Reminder job {job['id']} failed: {e}")
+            self._update(job, status='failed', error=str(e))
+            return
+        self._update(job, status='sent' if job['sent'] or not job['failed'] else 'failed')
+
+    def _send(self, job, name, messages):
+        channel = self.channels.get(name)
+        if channel is None:
+            self._update(job, failed=job['failed'] + len(messages))
+            return
+        bucket = self._buckets.get(name)
+        # Hand the channel at most one bucket's worth at a time
+        chunk_size = int(bucket.capacity) if bucket else len(messages)
+        for start in range(0, len(messages), chunk_size):
+            chunk = messages[start:start + chunk_size]
+            if bucket is not None:
+                bucket.take(len(chunk))
+            try:
+                errors = channel.send_batch(chunk)
+            except Exception as e:
+                print(f"Reminder channel {name} error: {e}")
+                errors = [str(e)] * len(chunk)
+            failed = sum(1 for error in errors if error)
+            self._update(job, sent=job['sent'] + len(chunk) - failed, failed=job['failed'] + failed)
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
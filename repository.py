@@ -0,0 +1,369 @@
+"""
+Storage backends for users, invoices and transactions.
+
+The application keeps its working set in memory (users dict, invoices_data,
+the transaction ledger) and writes every change through a repository.
+InMemoryRepository is the default; MongoRepository persists to MongoDB with
+indexed collections and batches its writes into bulk_write calls.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from itertools import islice
+
+from pymongo import ASCENDING, InsertOne, MongoClient, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+def _plain(record):
+    """Copy a record, turning str subclasses such as Markup into plain str"""
+    return {key: (str(value) if isinstance(value, str) else value) for key, value in record.items()}
+
+
+class InMemoryRepository:
+    def __init__(self):
+        self.users = {}
+        self.invoices = {}
+        self.transactions = {}
+        # Pending gateway orders, oldest first
+        self.orders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load_users(self):
+        with self._lock:
+            return dict(self.users)
+
+    def save_user(self, username, record):
+        with self._lock:
+            self.users[username] = record
+
+    def load_invoices(self):
+        with self._lock:
+            return {user_id: list(invoices) for user_id, invoices in self.invoices.items()}
+
+    def add_invoices(self, user_id, invoices):
+        with self._lock:
+            self.invoices.setdefault(user_id, []).extend(invoices)
+
+    def add_invoice_batch(self, batch):
+        """Add new invoices for many users ({user_id: [invoice, ...]}) at once"""
+        with self._lock:
+            for user_id, invoices in batch.items():
+                self.invoices.setdefault(user_id, []).extend(invoices)
+
+    def update_invoice(self, user_id, invoice):
+        with self._lock:
+            stored = self.invoices.setdefault(user_id, [])
+            for i, existing in enumerate(stored):
+                if existing['id'] == invoice['id']:
+                    stored[i] = invoice
+                    return
+            stored.append(invoice)
+
+    def load_transactions(self):
+        """All (user_id, transaction) pairs in date order"""
+        with self._lock:
+            pairs = [(user_id, t) for user_id, entries in self.transactions.items() for t in entries]
+        pairs.sort(key=lambda pair: pair[1]['date'])
+        return pairs
+
+    def append_transaction(self, user_id, transaction):
+        with self._lock:
+            self.transactions.setdefault(user_id, []).append(transaction)
+
+    def update_transaction(self, user_id, transaction_id, changes):
+        with self._lock:
+            for transaction in self.transactions.get(user_id, ()):
+                if transaction.get('transaction_id') == transaction_id:
+                    transaction.update(changes)
+
+    def save_order(self, key, order):
+        """Keep a pending gateway order ({'owner', 'amount', 'expires'}) until it is claimed"""
+        with self._lock:
+            now = time.time()
+            while self.orders and next(iter(self.orders.values()))['expires'] <= now:
+                self.orders.popitem(last=False)
+            self.orders[key] = dict(order)
+
+    def claim_order(self, key, owner):
+        """Remove and return the order if owner created it, else None"""
+        with self._lock:
+            order = self.orders.get(key)
+            if order is None or order['owner'] != owner:
+                return None
+            del self.orders[key]
+            return order
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MongoRepository:
+    def __init__(self, db, batch_size=500, flush_interval=0.5, max_pending=50000, spill_path=None):
+        self.db = db
+        self.users = db['users']
+        self.invoices = db['invoices']
+        self.payments = db['payments']
+        self.orders = db['orders']
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Writes held in memory while MongoDB is unreachable are capped at
+        # max_pending; past that they go to spill_path (JSON lines) and are
+        # replayed in order once it is back, or are dropped without one.
+        self.max_pending = max_pending
+        self.spill_path = spill_path
+        self.client = None
+        # Writes are (kind, filter, document) specs. Replacements are keyed
+        # by _id so repeated updates to one record collapse into a single
+        # write; payment inserts and updates keep their order.
+        self._pending = self._empty_batch()
+        self._pending_count = 0
+        self._spilled = bool(spill_path) and os.path.exists(spill_path) and os.path.getsize(spill_path) > 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def connect(cls, uri, database, max_pool_size=50, min_pool_size=0,
+                wait_queue_timeout_ms=2000, server_selection_timeout_ms=3000, **kwargs):
+        """Open a pooled client and return a repository with its indexes in place"""
+        client = MongoClient(
+            uri,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            waitQueueTimeoutMS=wait_queue_timeout_ms,
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+        )
+        repository = cls(client[database], **kwargs)
+        repository.client = client
+        repository.ensure_indexes()
+        # Writes spilled before a restart land before the app loads its data
+        repository.flush()
+        repository.start()
+        return repository
+
+    def ensure_indexes(self):
+        self.users.create_index([('id', ASCENDING)], unique=True)
+        self.users.create_index([('email', ASCENDING)])
+        self.invoices.create_index([('user_id', ASCENDING)])
+        self.payments.create_index([('user_id', ASCENDING), ('date', ASCENDING)])
+        self.payments.create_index([('date', ASCENDING)])
+        self.payments.create_index([('transaction_id', ASCENDING)], sparse=True)
+        self.orders.create_index([('expires_at', ASCENDING)], expireAfterSeconds=0)
+
+    def load_users(self):
+        users = {}
+        for doc in self.users.find():
+            users[doc.pop('_id')] = doc
+        return users
+
+    def save_user(self, username, record):
+        doc = _plain(record)
+        doc['_id'] = username
+        self._queue('users', [(username, ('replace', {'_id': username}, doc))])
+
+    def load_invoices(self):
+        invoices = {}
+        for doc in self.invoices.find(sort=[('issue_date', ASCENDING)]):
+            doc.pop('_id')
+            invoices.setdefault(doc.pop('user_id'), []).append(doc)
+        return invoices
+
+    def add_invoices(self, user_id, invoices):
+        for invoice in invoices:
+            self.update_invoice(user_id, invoice)
+
+    def update_invoice(self, user_id, invoice):
+        self._queue('invoices', [self._invoice_write(user_id, invoice)])
+
+    def add_invoice_batch(self, batch):
+        """Queue new invoices for many users ({user_id: [invoice, ...]}) in one go.
+
+        They go out with the next flush; call flush() to write them now.
+        """
+        self._queue('invoices', [self._invoice_write(user_id, invoice)
+                                 for user_id, invoices in batch.items() for invoice in invoices])
+
+    @staticmethod
+    def _invoice_write(user_id, invoice):
+        doc = _plain(invoice)
+        doc['_id'] = invoice['id']
+        doc['user_id'] = user_id
+        return invoice['id'], ('replace', {'_id': invoice['id']}, doc)
+
+    def load_transactions(self):
+        cursor = self.payments.find({}, projection={'_id': False}, sort=[('date', ASCENDING)])
+        return [(doc.pop('user_id'), doc) for doc in cursor]
+
+    def append_transaction(self, user_id, transaction):
+        doc = _plain(transaction)
+        doc['user_id'] = user_id
+        self._queue('payments', [(None, ('insert', None, doc))])
+
+    def update_transaction(self, user_id, transaction_id, changes):
+        self._queue('payments', [(None, ('update', {'user_id': user_id, 'transaction_id': transaction_id},
+                                         {'$set': _plain(changes)}))])
+
+    def save_order(self, key, order):
+        # Written at once, not batched: another worker may verify it next
+        doc = dict(order, _id=key, expires_at=datetime.fromtimestamp(order['expires'], timezone.utc))
+        self.orders.replace_one({'_id': key}, doc, upsert=True)
+
+    def claim_order(self, key, owner):
+        return self.orders.find_one_and_delete({'_id': key, 'owner': owner},
+                                               projection={'_id': False, 'expires_at': False})
+
+    @staticmethod
+    def _empty_batch():
+        return {'users': {}, 'invoices': {}, 'payments': []}
+
+    @staticmethod
+    def _add(batch, collection, key, spec):
+        if key is None:
+            batch[collection].append(spec)
+        else:
+            batch[collection][key] = spec
+
+    @staticmethod
+    def _operation(kind, selector, doc):
+        if kind == 'insert':
+            # A copy, so a retried insert is not given the failed attempt's _id
+            return InsertOne(dict(doc))
+        if kind == 'replace':
+            return ReplaceOne(selector, doc, upsert=True)
+        return UpdateOne(selector, doc)
+
+    def _queue(self, collection, writes):
+        """Queue (key, spec) writes; a full batch wakes the background flusher"""
+        with self._lock:
+            if self._spilled:
+                # Keep the order: new writes go behind the spilled ones
+                self._spill((collection, key, spec) for key, spec in writes)
+                return
+            for key, spec in writes:
+                self._add(self._pending, collection, key, spec)
+            self._pending_count += len(writes)
+            if self._pending_count >= self.batch_size:
+                self._wake.set()
+
+    def _write(self, batch):
+        """One bulk_write per collection; returns the (name, queued) pairs that failed"""
+        failed = []
+        for name, queued in batch.items():
+            specs = list(queued.values()) if isinstance(queued, dict) else queued
+            if not specs:
+                continue
+            try:
+                # Payment updates must land after the insert they modify
+                self.db[name].bulk_write([self._operation(*spec) for spec in specs], ordered=(name == 'payments'))
+            except BulkWriteError as e:
+                print(f"MongoDB bulk write to {name} rejected documents: {e.details.get('writeErrors')}")
+            except PyMongoError as e:
+                # Connection trouble: keep the batch for the next flush
+                print(f"MongoDB bulk write to {name} failed: {e}")
+                failed.append((name, queued))
+        return failed
+
+    def flush(self):
+        """Send every queued write, one bulk_write per collection"""
+        with self._flush_lock:
+            if self._spilled and not self._replay_spill():
+                return
+            with self._lock:
+                pending, self._pending = self._pending, self._empty_batch()
+                self._pending_count = 0
+            for name, queued in self._write(pending):
+                self._requeue(name, queued)
+            with self._lock:
+                if self._pending_count > self.max_pending:
+                    self._overflow()
+
+    def _requeue(self, collection, queued):
+        """Put a failed batch back in front of writes queued since"""
+        with self._lock:
+            if isinstance(queued, dict):
+                # A newer replacement for the same key supersedes the failed one
+                for key, spec in queued.items():
+                    self._pending[collection].setdefault(key, spec)
+            else:
+                self._pending[collection][:0] = queued
+            self._pending_count += len(queued)
+
+    def _overflow(self):
+        """Move the queued writes out of memory (caller holds _lock)"""
+        pending, self._pending = self._pending, self._empty_batch()
+        count, self._pending_count = self._pending_count, 0
+        if not self.spill_path:
+            print(f"MongoDB unreachable: dropped {count} queued writes")
+            return
+        self._spill((name, key, spec) for name, queued in pending.items()
+                    for key, spec in (queued.items() if isinstance(queued, dict) else ((None, spec) for spec in queued)))
+        self._spilled = True
+        print(f"MongoDB unreachable: spilled {count} queued writes to {self.spill_path}")
+
+    def _spill(self, entries):
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for collection, key, spec in entries:
+                f.write(json.dumps([collection, key, *spec], default=str) + '\n')
+
+    def _replay_spill(self):
+        """Write the spill file out batch by batch; False if MongoDB is still unreachable"""
+        offset = 0
+        while True:
+            with self._lock:
+                with open(self.spill_path, 'r', encoding='utf-8') as f:
+                    f.seek(offset)
+                    lines = list(islice(iter(f.readline, ''), self.batch_size))
+                    end = f.tell()
+                if not lines:
+                    os.remove(self.spill_path)
+                    self._spilled = False
+                    return True
+            batch = self._empty_batch()
+            for line in lines:
+                collection, key, *spec = json.loads(line)
+                self._add(batch, collection, key, tuple(spec))
+            if self._write(batch):
+                with self._lock:
+                    self._drop_spilled(offset)
+                return False
+            offset = end
+
+    def _drop_spilled(self, offset):
+        """Cut the already written part off the spill file (caller holds _lock)"""
+        if not offset:
+            return
+        with open(self.spill_path, 'r', encoding='utf-8') as f, \
+                open(self.spill_path + '.tmp', 'w', encoding='utf-8') as rest:
+            f.seek(offset)
+            shutil.copyfileobj(f, rest)
+        os.replace(self.spill_path + '.tmp', self.spill_path)
+
+    def start(self):
+        """Flush queued writes every flush_interval seconds, or sooner when a batch fills"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='mongo-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
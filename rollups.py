@@ -0,0 +1,160 @@
+"""
+Pre-aggregated collection rollups.
+
+The cube keeps one cell per (day, course, year, gateway) holding the
+amount collected (debits), the amount credited and the transaction count.
+Cells are updated in the same write path that records a transaction, so
+dashboard queries such as "last 7 days", "this month by course" or
+"gateway share this semester" visit one cell per bucket in range instead
+of the transactions themselves.
+"""
+
+import threading
+from datetime import date, datetime, timedelta
+
+DIMENSIONS = ('course', 'year', 'gateway')
+NO_GATEWAY = 'N/A'
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class RollupCube:
+    def __init__(self):
+        # 'YYYY-MM-DD' -> {(course, year, gateway): [collected, credited, count]}
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def record(self, transaction, course, year):
+        """Add one ledger transaction to its cell"""
+        key = (course, year, str(transaction.get('gateway') or NO_GATEWAY))
+        amount = transaction['amount']
+        with self._lock:
+            cells = self._days.setdefault(transaction['date'][:10], {})
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = [0.0, 0.0, 0]
+            if amount < 0:
+                cell[0] += -amount
+            else:
+                cell[1] += amount
+            cell[2] += 1
+
+    @classmethod
+    def rebuild(cls, ledger, profile_of):
+        """A fresh cube from every ledger entry; profile_of maps user id -> (course, year)"""
+        cube = cls()
+        for user_id in ledger.user_ids():
+            course, year = profile_of(user_id)
+            for transaction in ledger.entries(user_id):
+                cube.record(transaction, course, year)
+        return cube
+
+    def rebuild_from(self, ledger, profile_of):
+        """Rebuild this cube from the ledger and swap the new cells in.
+
+        The caller must hold off ledger appends and record() until this
+        returns, or a transaction could be counted twice. Returns the
+        replaced cells as a cube.
+        """
+        fresh = self.rebuild(ledger, profile_of)
+        with self._lock:
+            previous = RollupCube()
+            previous._days, self._days = self._days, fresh._days
+        return previous
+
+    def _day_cells(self, start, end):
+        """(day, cells) for each day with data in [start, end]; None means unbounded"""
+        with self._lock:
+            if start is None or end is None:
+                low = start.strftime('%Y-%m-%d') if start else ''
+                high = end.strftime('%Y-%m-%d') if end else '9999-99-99'
+                return [(day, dict(cells)) for day, cells in self._days.items() if low <= day <= high]
+            result = []
+            day = _as_date(start)
+            while day <= _as_date(end):
+                cells = self._days.get(day.strftime('%Y-%m-%d'))
+                if cells:
+                    result.append((day.strftime('%Y-%m-%d'), dict(cells)))
+                day += timedelta(days=1)
+            return result
+
+    def totals(self, start=None, end=None, by=(), **filters):
+        """[collected, credited, count] grouped by some of course/year/gateway.
+
+        filters narrow the cells, e.g. course='B.E Computer Science'.
+        """
+        positions = [DIMENSIONS.index(dimension) for dimension in by]
+        wanted = [(DIMENSIONS.index(dimension), value) for dimension, value in filters.items()]
+        grouped = {}
+        for _, cells in self._day_cells(start, end):
+            for key, (collected, credited, count) in cells.items():
+                if any(key[position] != value for position, value in wanted):
+                    continue
+                group = tuple(key[position] for position in positions)
+                total = grouped.get(group)
+                if total is None:
+                    total = grouped[group] = [0.0, 0.0, 0]
+                total[0] += collected
+                total[1] += credited
+                total[2] += count
+        return grouped
+
+    def daily_collections(self, start, end, **filters):
+        """List of (date, collected) for every day in [start, end]"""
+        wanted = [(DIMENSIONS.index(dimension), value) for dimension, value in filters.items()]
+        by_day = {}
+        for day, cells in self._day_cells(start, end):
+            by_day[day] = sum(cell[0] for key, cell in cells.items()
+                              if all(key[position] == value for position, value in wanted))
+        result = []
+        day = _as_date(start)
+        while day <= _as_date(end):
+            result.append((day, by_day.get(day.strftime('%Y-%m-%d'), 0.0)))
+            day += timedelta(days=1)
+        return result
+
+    def monthly_collections(self, months=12, today=None):
+        """Collections for each of the last `months` calendar months, oldest first"""
+        today = _as_date(today or date.today())
+        first = today.replace(day=1)
+        for _ in range(months - 1):
+            first = (first - timedelta(days=1)).replace(day=1)
+        totals = {}
+        for day, cells in self._day_cells(first, today):
+            month = day[:7]
+            totals[month] = totals.get(month, 0.0) + sum(cell[0] for cell in cells.values())
+        result = []
+        month = first
+        for _ in range(months):
+            result.append({'month': month.strftime('%b %Y'), 'amount': totals.get(month.strftime('%Y-%m'), 0.0)})
+            month = (month + timedelta(days=32)).replace(day=1)
+        return result
+
+    def gateway_mix(self, start=None, end=None):
+        """Online payments per gateway with each gateway's share, largest first"""
+        credited = {gateway: total[1] for (gateway,), total in self.totals(start, end, by=('gateway',)).items()
+                    if gateway != NO_GATEWAY and total[1] > 0}
+        grand_total = sum(credited.values())
+        mix = [{'method': gateway, 'amount': amount, 'percentage': round(amount / grand_total * 100, 1)}
+               for gateway, amount in credited.items()]
+        return sorted(mix, key=lambda row: row['amount'], reverse=True)
+
+    def snapshot(self):
+        with self._lock:
+            return {day: {key: list(cell) for key, cell in cells.items()} for day, cells in self._days.items()}
+
+    def diff(self, other, tolerance=0.005):
+        """Cells where this cube and other disagree, as (day, key, ours, theirs)"""
+        ours, theirs = self.snapshot(), other.snapshot()
+        mismatches = []
+        for day in sorted(set(ours) | set(theirs)):
+            our_cells, their_cells = ours.get(day, {}), theirs.get(day, {})
+            for key in sorted(set(our_cells) | set(their_cells)):
+                mine = our_cells.get(key, [0.0, 0.0, 0])
+                other_cell = their_cells.get(key, [0.0, 0.0, 0])
+                if (abs(mine[0] - other_cell[0]) > tolerance or abs(mine[1] - other_cell[1]) > tolerance
+                        or mine[2] != other_cell[2]):
+                    mismatches.append((day, key, mine, other_cell))
+        return mismatches
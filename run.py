@@ -6,9 +6,12 @@ Run this file to start the EduPay Flask application
 
 import os
 import sys
-from app import app
 
 def main():
+    # Imported here, not at module level: receipt render workers re-import
+    # this script and must not start a copy of the app
+    from app import app
+    
     print("=" * 50)
     print("EduPay - Student Payment System")
     print("=" * 50)
@@ -0,0 +1,172 @@
+"""
+Due-date scheduler for pending invoices.
+
+Every pending invoice is 'upcoming', 'due_soon' (within due_soon_days of
+its due date) or 'overdue' (past its due date). The scheduler keeps one
+heap entry per invoice for its next transition, so a tick pops only the
+invoices whose state changes today and leaves the rest of the book alone.
+Paid invoices are untracked; their heap entries are skipped when they
+surface and compacted away once they outnumber the live ones.
+
+Listeners receive the list of transition events from each tick, e.g. to
+update the invoices' flags and queue reminders.
+"""
+
+import heapq
+import itertools
+import threading
+from datetime import date, datetime, timedelta
+
+UPCOMING = 'upcoming'
+DUE_SOON = 'due_soon'
+OVERDUE = 'overdue'
+
+
+def parse_due_date(value):
+    """date for a 'YYYY-MM-DD' due date (raises ValueError)"""
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class InvoiceScheduler:
+    def __init__(self, due_soon_days=7):
+        self.due_soon = timedelta(days=due_soon_days)
+        # (transition day, entry seq, invoice id)
+        self._heap = []
+        self._stale = 0
+        # invoice id -> [user id, due date, state, seq of its live heap entry]
+        self._invoices = {}
+        self._overdue_by_user = {}
+        self._counts = {UPCOMING: 0, DUE_SOON: 0, OVERDUE: 0}
+        self._seq = itertools.count()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def subscribe(self, listener):
+        """Call listener(events) with the transitions of every tick that has some"""
+        self._listeners.append(listener)
+
+    def state_on(self, due, day):
+        if day > due:
+            return OVERDUE
+        if day >= due - self.due_soon:
+            return DUE_SOON
+        return UPCOMING
+
+    def track(self, user_id, invoice_id, due_date, today=None):
+        """Start watching a pending invoice and return its current state"""
+        due = parse_due_date(due_date)
+        state = self.state_on(due, today or date.today())
+        with self._lock:
+            if invoice_id in self._invoices:
+                self._forget(invoice_id)
+            record = self._invoices[invoice_id] = [user_id, due, state, None]
+            self._enter(record, state)
+            self._schedule(invoice_id, record)
+        return state
+
+    def untrack(self, invoice_id):
+        """Stop watching an invoice, e.g. once it is paid"""
+        with self._lock:
+            if invoice_id in self._invoices:
+                self._forget(invoice_id)
+
+    def _forget(self, invoice_id):
+        record = self._invoices.pop(invoice_id)
+        self._leave(record)
+        if record[3] is not None:
+            self._stale += 1
+        if self._stale > 64 and self._stale > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap
+                          if self._invoices.get(entry[2], (None,) * 4)[3] == entry[1]]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def _enter(self, record, state):
+        record[2] = state
+        self._counts[state] += 1
+        if state == OVERDUE:
+            self._overdue_by_user[record[0]] = self._overdue_by_user.get(record[0], 0) + 1
+
+    def _leave(self, record):
+        self._counts[record[2]] -= 1
+        if record[2] == OVERDUE:
+            remaining = self._overdue_by_user[record[0]] - 1
+            if remaining:
+                self._overdue_by_user[record[0]] = remaining
+            else:
+                del self._overdue_by_user[record[0]]
+
+    def _schedule(self, invoice_id, record):
+        due, state = record[1], record[2]
+        if state == UPCOMING:
+            when = due - self.due_soon
+        elif state == DUE_SOON:
+            when = due + timedelta(days=1)
+        else:
+            record[3] = None
+            return
+        record[3] = next(self._seq)
+        heapq.heappush(self._heap, (when, record[3], invoice_id))
+
+    def tick(self, today=None):
+        """Apply every transition due by today; returns the events it emitted"""
+        today = today or date.today()
+        events = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= today:
+                _, seq, invoice_id = heapq.heappop(self._heap)
+                record = self._invoices.get(invoice_id)
+                if record is None or record[3] != seq:
+                    self._stale -= 1
+                    continue
+                # A late tick can skip due_soon and land straight on overdue
+                state = self.state_on(record[1], today)
+                self._leave(record)
+                self._enter(record, state)
+                self._schedule(invoice_id, record)
+                events.append({
+                    'type': state,
+                    'user_id': record[0],
+                    'invoice_id': invoice_id,
+                    'due_date': record[1].strftime('%Y-%m-%d'),
+                    'date': today.strftime('%Y-%m-%d')
+                })
+        if events:
+            for listener in self._listeners:
+                try:
+                    listener(events)
+                except Exception as e:
+                    print(f"Invoice scheduler listener error: {e}")
+        return events
+
+    def state(self, invoice_id):
+        with self._lock:
+            record = self._invoices.get(invoice_id)
+            return record[2] if record else None
+
+    def has_overdue(self, user_id):
+        return user_id in self._overdue_by_user
+
+    def counts(self):
+        """Pending invoices per state, and how many students have something overdue"""
+        with self._lock:
+            return dict(self._counts, overdue_students=len(self._overdue_by_user))
+
+    def start(self, interval=60):
+        """Tick every interval seconds on a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='invoice-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, interval):
+        while not self._stopped.wait(interval):
+            self.tick()
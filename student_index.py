@@ -0,0 +1,152 @@
+"""
+Sorted indexes for the paginated student listing.
+
+For every (course, year) cohort the index keeps one sorted list of
+(value, user id) per sortable column. A page is read by bisecting to the
+cursor in each cohort list the filters select and merging forward, so the
+work per page depends on the page size and number of cohorts, not on how
+many students there are. Filtering on the pending amount while sorting by
+it is a bisect too; with other sort columns it filters rows as they are
+read.
+
+Cursors are the (value, user id) of the last row served, so pages stay
+stable while students are added or paid up in between requests.
+"""
+
+import base64
+import binascii
+import heapq
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+SORT_FIELDS = ('id', 'name', 'balance', 'pending_amount')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, user_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(user_id, int) or not isinstance(value, (int, float, str)):
+        raise InvalidCursor(cursor)
+    return value, user_id
+
+
+def _ascending(entries, start_key, low, high):
+    position = bisect_right(entries, start_key) if start_key else 0
+    if low is not None:
+        position = max(position, bisect_left(entries, (low,)))
+    for index in range(position, len(entries)):
+        entry = entries[index]
+        if high is not None and entry[0] > high:
+            return
+        yield entry
+
+
+def _descending(entries, start_key, low, high):
+    position = bisect_left(entries, start_key) if start_key else len(entries)
+    if high is not None:
+        position = min(position, bisect_right(entries, (high, float('inf'))))
+    for index in range(position - 1, -1, -1):
+        entry = entries[index]
+        if low is not None and entry[0] < low:
+            return
+        yield entry
+
+
+class StudentIndex:
+    def __init__(self, users, summary):
+        self._users = users
+        self._summary = summary
+        # cohort -> field -> sorted [(value, user id)]
+        self._sorted = {}
+        # user id -> (cohort, {field: value}) as last indexed
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def _values(self, user_id, user):
+        return {
+            'id': user_id,
+            'name': user.get('name', '').lower(),
+            'balance': user.get('balance', 0.0),
+            'pending_amount': self._summary.pending_amount(user_id),
+        }
+
+    def refresh(self, user_id):
+        """Re-sort one student after their record, balance or invoices changed"""
+        found = self._users.by_id(user_id)
+        with self._lock:
+            previous = self._rows.get(user_id)
+            if found is None or found[1].get('is_admin', False):
+                if previous:
+                    self._remove(user_id, *previous)
+                return
+            user = found[1]
+            cohort = (user.get('course', 'N/A'), user.get('year', 'N/A'))
+            values = self._values(user_id, user)
+            if previous == (cohort, values):
+                return
+            if previous:
+                self._remove(user_id, *previous)
+            columns = self._sorted.setdefault(cohort, {field: [] for field in SORT_FIELDS})
+            for field in SORT_FIELDS:
+                insort(columns[field], (values[field], user_id))
+            self._rows[user_id] = (cohort, values)
+
+    def _remove(self, user_id, cohort, values):
+        columns = self._sorted[cohort]
+        for field in SORT_FIELDS:
+            entries = columns[field]
+            position = bisect_left(entries, (values[field], user_id))
+            if position < len(entries) and entries[position] == (values[field], user_id):
+                del entries[position]
+        if not columns['id']:
+            del self._sorted[cohort]
+        del self._rows[user_id]
+
+    def page(self, course=None, year=None, min_pending=None, max_pending=None,
+             sort='id', descending=False, cursor=None, limit=50, where=None):
+        """One page of student ids in sort order, and the cursor for the next page.
+
+        where, if given, is a further predicate on the user id.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort by {sort}")
+        start_key = decode_cursor(cursor) if cursor else None
+        if start_key and isinstance(start_key[0], str) != (sort == 'name'):
+            raise InvalidCursor(cursor)
+        # Bisect on the pending range only when the list is sorted by it
+        low, high = (min_pending, max_pending) if sort == 'pending_amount' else (None, None)
+        walk = _descending if descending else _ascending
+        with self._lock:
+            sources = [
+                walk(columns[sort], start_key, low, high)
+                for (cohort_course, cohort_year), columns in self._sorted.items()
+                if (course is None or cohort_course == course) and (year is None or cohort_year == year)
+            ]
+            user_ids = []
+            last = None
+            for entry in heapq.merge(*sources, reverse=descending):
+                last = entry
+                pending = self._rows[entry[1]][1]['pending_amount']
+                if min_pending is not None and pending < min_pending:
+                    continue
+                if max_pending is not None and pending > max_pending:
+                    continue
+                if where is not None and not where(entry[1]):
+                    continue
+                user_ids.append(entry[1])
+                if len(user_ids) == limit:
+                    break
+        next_cursor = encode_cursor(last) if len(user_ids) == limit else None
+        return user_ids, next_cursor
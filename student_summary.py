@@ -0,0 +1,63 @@
+"""
+Running fee summary per student and for the whole institution.
+
+Pending invoice totals are adjusted as invoices are issued and paid, so
+the student management page reads them instead of adding up every
+invoice on each request. Amounts are kept in paise to avoid float drift.
+"""
+
+import threading
+
+
+def _paise(amount):
+    return int(round(amount * 100))
+
+
+class StudentSummary:
+    def __init__(self):
+        # user id -> [pending paise, pending invoice count]
+        self._pending = {}
+        self._students = set()
+        self._total_pending = 0
+        self._with_pending = 0
+        self._lock = threading.Lock()
+
+    def open_account(self, user_id):
+        """Count user_id as a student in the institution totals"""
+        with self._lock:
+            if user_id in self._students:
+                return
+            self._students.add(user_id)
+            pending = self._pending.setdefault(user_id, [0, 0])
+            self._total_pending += pending[0]
+            if pending[0] > 0:
+                self._with_pending += 1
+
+    def invoice_added(self, user_id, amount):
+        self._adjust(user_id, _paise(amount), 1)
+
+    def invoice_paid(self, user_id, amount):
+        self._adjust(user_id, -_paise(amount), -1)
+
+    def _adjust(self, user_id, paise, count):
+        with self._lock:
+            pending = self._pending.setdefault(user_id, [0, 0])
+            had_pending = pending[0] > 0
+            pending[0] += paise
+            pending[1] += count
+            if user_id in self._students:
+                self._total_pending += paise
+                self._with_pending += (pending[0] > 0) - had_pending
+
+    def pending_amount(self, user_id):
+        pending = self._pending.get(user_id)
+        return pending[0] / 100 if pending else 0.0
+
+    def totals(self):
+        with self._lock:
+            return {
+                'total_students': len(self._students),
+                'paid_students': len(self._students) - self._with_pending,
+                'students_with_pending': self._with_pending,
+                'total_pending': self._total_pending / 100
+            }
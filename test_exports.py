@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for the institution transaction and invoice export routes
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import csv
+import io
+import json
+
+import pytest
+
+from exports import INVOICE_FIELDS, TRANSACTION_FIELDS
+
+
+@pytest.fixture(scope='module')
+def edupay(tmp_path_factory):
+    # The app writes its secret key and archives next to the working directory
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('edupay'))
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    try:
+        import app as edupay
+    finally:
+        os.chdir(cwd)
+
+    username, student = next(iter(edupay.users.students()))
+    # Far-future dates keep these rows apart from the demo data
+    for day, amount, gateway, status in [
+        ('2031-01-05', -500.0, None, 'sent'),
+        ('2031-01-10', 1000.0, 'razorpay', 'failed'),
+        ('2031-02-01', 2000.0, 'stripe', 'sent'),
+    ]:
+        transaction = {'date': f'{day} 10:00:00', 'description': 'Export test', 'amount': amount,
+                       'balance': 0.0, 'email_status': status}
+        if gateway:
+            transaction['gateway'] = gateway
+        edupay.ledger.append(student['id'], transaction)
+    edupay.invoices_data.setdefault(student['id'], []).extend([
+        {'id': 'EXP-1', 'issue_date': '2031-01-01', 'due_date': '2031-01-31', 'description': 'Tuition',
+         'amount': 100.0, 'status': 'Pending'},
+        {'id': 'EXP-2', 'issue_date': '2031-01-02', 'due_date': '2031-02-28', 'description': 'Lab',
+         'amount': 50.0, 'status': 'Paid', 'paid_date': '2031-01-20'},
+    ])
+    return edupay, student
+
+
+@pytest.fixture
+def client(edupay):
+    client = edupay[0].app.test_client()
+    with client.session_transaction() as session:
+        session['user_type'] = 'institution'
+        session['user_data'] = {'name': 'Test Institution'}
+    return client
+
+
+def query(student, **filters):
+    return dict({'student_id': student['id'], 'start': '2031-01-01'}, **filters)
+
+
+def test_transactions_csv_filtered_by_date_and_gateway(edupay, client):
+    _, student = edupay
+    response = client.get('/institution-export-transactions',
+                          query_string=query(student, end='2031-01-31', gateway='razorpay'))
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'attachment; filename=transactions_' in response.headers['Content-Disposition']
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['date'], row['amount'], row['gateway']) for row in rows] == [
+        ('2031-01-10 10:00:00', '1000.0', 'razorpay')]
+    assert rows[0]['student_id'] == str(student['id'])
+
+
+def test_transactions_ndjson_filtered_by_email_status(edupay, client):
+    _, student = edupay
+    response = client.get('/institution-export-transactions',
+                          query_string=query(student, format='ndjson', email_status='sent'))
+    assert response.mimetype == 'application/x-ndjson'
+
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['date'][:10] for row in rows] == ['2031-01-05', '2031-02-01']
+    assert list(rows[0]) == TRANSACTION_FIELDS
+
+
+def test_invoices_in_both_formats(edupay, client):
+    _, student = edupay
+    response = client.get('/institution-export-invoices', query_string=query(student, status='Pending'))
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['invoice_id'], row['status']) for row in rows] == [('EXP-1', 'Pending')]
+
+    response = client.get('/institution-export-invoices', query_string=query(student, format='ndjson'))
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['invoice_id'] for row in rows] == ['EXP-1', 'EXP-2']
+    assert rows[1]['paid_date'] == '2031-01-20' and list(rows[1]) == INVOICE_FIELDS
+
+
+def test_empty_result(edupay, client):
+    _, student = edupay
+    response = client.get('/institution-export-invoices', query_string=query(student, start='2032-01-01'))
+    assert response.get_data(as_text=True).strip() == ','.join(INVOICE_FIELDS)
+
+    response = client.get('/institution-export-transactions',
+                          query_string=query(student, start='2032-01-01', format='ndjson'))
+    assert response.status_code == 200 and response.get_data() == b''
+
+
+def test_large_export_is_streamed_in_chunks(edupay, client):
+    edupay_app, student = edupay
+    for second in range(1200):
+        edupay_app.ledger.append(student['id'], {'date': f'2033-01-01 10:{second // 60:02d}:{second % 60:02d}',
+                                                 'description': 'Bulk', 'amount': 1.0, 'balance': 0.0})
+    response = client.get('/institution-export-transactions', buffered=False,
+                          query_string=query(student, start='2033-01-01', format='ndjson'))
+    assert response.is_streamed
+    chunks = list(response.response)
+    assert len(chunks) == 3
+    assert sum(chunk.count(b'\n') for chunk in chunks) == 1200
+    response.close()
+
+
+def test_rejects_bad_filters_and_other_users(edupay, client):
+    assert client.get('/institution-export-transactions', query_string={'format': 'xml'}).status_code == 400
+    assert client.get('/institution-export-invoices', query_string={'start': '01/01/2031'}).status_code == 400
+    assert edupay[0].app.test_client().get('/institution-export-invoices').status_code == 401
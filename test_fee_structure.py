@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the versioned fee structure
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import json
+
+import pytest
+
+from fee_structure import FeeStructure
+
+FEES = {'CSE': {'1st Year': {'tuition': 100, 'lab': 20, 'library': 5, 'activity': 10}}}
+
+
+def test_derived_values_are_built_once_per_version():
+    fees = FeeStructure(FEES)
+    builds = []
+
+    def build(table):
+        builds.append(table)
+        return f"rendered v{len(builds)}"
+
+    assert fees.cached('table', build) == 'rendered v1'
+    assert fees.cached('table', build) == 'rendered v1'
+    assert fees.update('CSE', '1st Year', 'lab', 25) == 2
+    assert fees.cached('table', build) == 'rendered v2'
+    assert builds[1]['CSE']['1st Year']['lab'] == 25
+    assert len(builds) == 2
+
+
+def test_etag_and_json_follow_updates():
+    fees = FeeStructure(FEES)
+    etag = fees.etag()
+    assert json.loads(fees.as_json()) == FEES
+
+    # Setting a fee to its current value is not a new version
+    assert fees.update('CSE', '1st Year', 'lab', 20) == 1
+    assert fees.etag() == etag
+
+    fees.update('CSE', '1st Year', 'lab', 30)
+    assert fees.etag() != etag
+    assert json.loads(fees.as_json())['CSE']['1st Year']['lab'] == 30
+    assert FeeStructure(FEES).etag() == etag
+
+
+def test_lookups_return_copies():
+    fees = FeeStructure(FEES)
+    cohort = fees.get('CSE', '1st Year')
+    cohort['lab'] = 0
+    assert fees.get('CSE', '1st Year')['lab'] == 20
+    assert fees.get('CSE', '2nd Year') is None
+    with pytest.raises(KeyError):
+        fees.update('ECE', '1st Year', 'lab', 1)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the pooled password hasher
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from hashing import HashingBusy, PasswordHasher, hash_method
+
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+def test_verify_upgrades_outdated_hashes():
+    """A correct password stored with old parameters gets a fresh hash"""
+    hasher = PasswordHasher(FAST_METHOD, workers=2)
+    try:
+        old_hash = generate_password_hash('secret', 'pbkdf2:sha256:500')
+        assert hasher.verify(old_hash, 'wrong') == (False, None)
+
+        matches, new_hash = hasher.verify(old_hash, 'secret')
+        assert matches
+        assert hash_method(new_hash) == FAST_METHOD
+        assert hasher.verify(new_hash, 'secret') == (True, None)
+    finally:
+        hasher.shutdown()
+
+
+def test_full_pool_refuses_new_work():
+    """Work beyond the pool and its backlog is refused, not queued"""
+    hasher = PasswordHasher(FAST_METHOD, workers=1, max_queue=0)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_hash(*args):
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    try:
+        worker = threading.Thread(target=hasher._run, args=(blocking_hash,))
+        worker.start()
+        started.wait(5)
+        with pytest.raises(HashingBusy):
+            hasher.hash('secret')
+        release.set()
+        worker.join(5)
+        assert hasher.check(hasher.hash('secret'), 'secret')
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests for the date-indexed transaction ledger
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ledger import TransactionLedger
+
+
+def make_transaction(when, amount):
+    return {'date': when, 'description': 'Test', 'amount': amount, 'balance': 0}
+
+
+def test_entries_are_per_user_and_copied():
+    ledger = TransactionLedger()
+    ledger.open_account(3)
+    assert ledger.entries(3) == []
+    ledger.append(3, make_transaction('2024-03-01 09:15:00', -100.0))
+
+    entries = ledger.entries(3)
+    entries.clear()
+    assert len(ledger.entries(3)) == 1
+    assert ledger.entries(4) == []
+
+
+if __name__ == "__main__":
+    test_entries_are_per_user_and_copied()
+    print("✅ Ledger tests passed")
+
+
+def test_history_pages_backwards_in_date_order():
+    """Back-dated entries are slotted into place; pages read newest first"""
+    ledger = TransactionLedger()
+    for day in (1, 2, 4, 5):
+        ledger.append(1, make_transaction(f'2024-03-0{day} 10:00:00', -day))
+    ledger.append(1, make_transaction('2024-03-03 10:00:00', -3))
+
+    page, before = ledger.history(1, limit=2)
+    assert [t['amount'] for t in page] == [-5, -4]
+    page, before = ledger.history(1, before=before, limit=2)
+    assert [t['amount'] for t in page] == [-3, -2]
+    page, before = ledger.history(1, before=before, limit=2)
+    assert [t['amount'] for t in page] == [-1] and before is None
+    assert ledger.history(2) == ([], None)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for striped account locks
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+import time
+
+from locks import LockStripes
+
+
+def test_same_key_serialises_updates():
+    """Read-modify-write on one account under its stripe loses nothing"""
+    locks = LockStripes(8)
+    account = {'balance': 0}
+
+    def deposit():
+        for _ in range(200):
+            with locks.for_key(42):
+                balance = account['balance']
+                time.sleep(0)
+                account['balance'] = balance + 1
+
+    threads = [threading.Thread(target=deposit) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert account['balance'] == 1600
+
+
+def test_many_locks_overlapping_sets_without_deadlock():
+    locks = LockStripes(4)
+    done = []
+
+    def transfer(keys):
+        for _ in range(500):
+            with locks.many(keys):
+                pass
+        done.append(keys)
+
+    threads = [threading.Thread(target=transfer, args=(keys,)) for keys in ([1, 2, 3], [3, 2, 1], [2, 5, 1, 6])]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert len(done) == 3
+    assert not any(lock.locked() for lock in locks._locks)
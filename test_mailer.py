@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for background receipt delivery
+"""
+
+import sys
+import os
+import smtplib
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from email.mime.text import MIMEText
+
+from mailer import ReceiptMailer
+
+CONFIG = {'smtp_server': 'localhost', 'smtp_port': 1025, 'email': 'edupay@localhost',
+          'password': '', 'use_tls': False, 'workers': 1, 'retry_backoff': 0.01}
+
+
+class FakeSMTP:
+    """Records connections and messages; fails the first `failures` sends"""
+    connections = 0
+    sent = []
+    failures = 0
+
+    def __init__(self, host, port, timeout=None):
+        FakeSMTP.connections += 1
+
+    def send_message(self, message):
+        if FakeSMTP.failures:
+            FakeSMTP.failures -= 1
+            raise smtplib.SMTPServerDisconnected('connection dropped')
+        FakeSMTP.sent.append(message['Subject'])
+
+    def noop(self):
+        return (250, b'OK')
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def reset_fake(failures=0):
+    FakeSMTP.connections = 0
+    FakeSMTP.sent = []
+    FakeSMTP.failures = failures
+
+
+def message(subject):
+    msg = MIMEText('receipt')
+    msg['Subject'] = subject
+    return msg
+
+
+def test_one_session_is_reused_for_many_receipts():
+    reset_fake()
+    mailer = ReceiptMailer(CONFIG, smtp_factory=FakeSMTP)
+    statuses = []
+    for i in range(5):
+        assert mailer.submit(lambda i=i: message(f'Receipt {i}'), lambda status, *_: statuses.append(status))
+    mailer.join()
+    mailer.stop()
+
+    assert FakeSMTP.sent == [f'Receipt {i}' for i in range(5)]
+    assert FakeSMTP.connections == 1
+    assert statuses.count('sent') == 5
+
+
+def test_retries_with_reconnect_then_succeeds():
+    reset_fake(failures=2)
+    mailer = ReceiptMailer(CONFIG, smtp_factory=FakeSMTP)
+    history = []
+    mailer.submit(lambda: message('Receipt'), lambda status, attempts, error: history.append((status, attempts)))
+    mailer.join()
+    mailer.stop()
+
+    assert history == [('queued', 0), ('retrying', 1), ('retrying', 2), ('sent', 3)]
+    assert FakeSMTP.connections == 3
+
+
+def test_full_queue_is_rejected():
+    reset_fake()
+    mailer = ReceiptMailer(dict(CONFIG, queue_size=1, workers=0), smtp_factory=FakeSMTP)
+    assert mailer.submit(lambda: message('first'))
+    statuses = []
+    assert not mailer.submit(lambda: message('second'), lambda status, *_: statuses.append(status))
+    assert statuses == ['failed']
+
+
+def test_stop_does_not_block_on_a_full_queue():
+    reset_fake()
+    mailer = ReceiptMailer(dict(CONFIG, queue_size=1), smtp_factory=FakeSMTP)
+    building = threading.Event()
+    release = threading.Event()
+
+    def slow_message():
+        building.set()
+        release.wait(5)
+        return message('first')
+
+    mailer.submit(slow_message)
+    building.wait(5)
+    statuses = []
+    assert mailer.submit(lambda: message('second'), lambda status, *_: statuses.append(status))
+
+    # The only worker is busy and the queue is full: stop still honours its timeout
+    started = time.monotonic()
+    worker = mailer._threads[0]
+    mailer.stop(0.2)
+    assert time.monotonic() - started < 1.0
+
+    release.set()
+    worker.join(5)
+    assert FakeSMTP.sent == ['first']
+    assert statuses == ['queued', 'failed']
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the rendered-page cache
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from page_cache import PageCache
+
+
+def test_pages_are_reused_until_a_tag_is_invalidated():
+    cache = PageCache()
+    key = ('analytics', '/analytics?', ('institution', 'X'))
+    assert cache.get(key, ('payments',)) is None
+
+    page = cache.put(key, cache.versions(('payments',)), b'<html>1</html>', 'text/html')
+    assert cache.get(key, ('payments',)) is page
+    cache.invalidate('fees')
+    assert cache.get(key, ('payments',)) is page
+
+    cache.invalidate('payments')
+    assert cache.get(key, ('payments',)) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_invalidation_during_render_is_not_lost():
+    cache = PageCache()
+    versions = cache.versions(('payments',))
+    cache.invalidate('payments')
+    cache.put('page', versions, b'stale', 'text/html')
+    assert cache.get('page', ('payments',)) is None
+
+
+def test_etag_follows_content_and_entries_are_bounded():
+    cache = PageCache(max_entries=2)
+    first = cache.put('a', (), b'same', 'text/html')
+    second = cache.put('b', (), b'same', 'text/html')
+    third = cache.put('c', (), b'other', 'text/html')
+    assert first.etag == second.etag != third.etag
+    assert cache.get('a', ()) is None
+    assert cache.get('c', ()) is third
+
+
+def test_parent_pages_are_not_shared_with_students(tmp_path, monkeypatch):
+    # The app writes its secret key next to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    edupay = pytest.importorskip('app')
+    student = next(iter(edupay.users.keys()))
+    parent = edupay.PARENT_ACCOUNTS[0]
+
+    roles = []
+    for session in ({'username': student},
+                    {'username': parent['username'], 'user_type': 'parent', 'user_data': parent}):
+        with edupay.app.test_request_context():
+            edupay.session.update(session)
+            roles.append(edupay.viewer_role())
+    assert roles == [('student', None), ('parent', None)]
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Tests for the payment gateway client against a local stub of the provider
+APIs that can inject latency
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from payment_service import GatewayBusy, PaymentGateway
+from repository import InMemoryRepository
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if self.path.startswith('/v1/payment_intents/'):
+            self.reply(200, {'id': self.path.rsplit('/', 1)[1], 'status': self.server.intent_status})
+        else:
+            self.reply(404, {})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        server = self.server
+        if self.path == '/v1/oauth2/token':
+            time.sleep(server.token_latency)
+            with server.lock:
+                server.token_requests += 1
+                token = f'token-{server.token_requests}'
+            return self.reply(200, {'access_token': token, 'expires_in': server.expires_in})
+        if self.path.startswith('/v2/') and self.headers['Authorization'].split()[1] in server.revoked:
+            return self.reply(401, {})
+        server.hits.append((self.path, body))
+        if self.path == '/v1/orders':
+            self.reply(200, {'id': 'order_1', 'amount': json.loads(body)['amount'], 'currency': 'INR'})
+        elif self.path == '/v1/payment_intents':
+            self.reply(200, {'id': 'pi_1', 'client_secret': 'pi_1_secret'})
+        elif self.path == '/v2/checkout/orders':
+            self.reply(201, {'id': 'PAYPAL-1'})
+        elif self.path == '/v2/checkout/orders/PAYPAL-1/capture':
+            self.reply(201, {'id': 'PAYPAL-1', 'status': 'COMPLETED'})
+        else:
+            self.reply(404, {})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except OSError:
+            # The client gave up on this call
+            pass
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(latency=0.0, token_latency=0.0, expires_in=32400):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        server.daemon_threads = True
+        server.latency = latency
+        server.token_latency = token_latency
+        server.expires_in = expires_in
+        server.token_requests = 0
+        server.revoked = set()
+        server.intent_status = 'succeeded'
+        server.hits = []
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}', server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def clients():
+    made = []
+
+    def make(url, paypal_url=None, orders=None, **kwargs):
+        client = PaymentGateway({
+            'razorpay': {'key_id': 'rzp', 'key_secret': 'secret', 'base_url': url},
+            'stripe': {'secret_key': 'sk', 'publishable_key': 'pk', 'base_url': url},
+            'paypal': {'client_id': 'pp', 'client_secret': 'secret', 'base_url': paypal_url or url},
+        }, orders or InMemoryRepository(), **kwargs)
+        made.append(client)
+        return client
+
+    yield make
+    for client in made:
+        client.close()
+
+
+def razorpay_signature(order_id, payment_id):
+    return hmac.new(b'secret', f'{order_id}|{payment_id}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def test_orders_are_created_in_rupees(stub, clients):
+    url, server = stub()
+    client = clients(url)
+    assert client.create('razorpay', 100.29) == {'success': True, 'order_id': 'order_1', 'amount': 10029,
+                                                 'currency': 'INR', 'key_id': 'rzp'}
+    assert client.create('stripe', 100.0)['client_secret'] == 'pi_1_secret'
+    assert client.create('paypal', 50000)['order_id'] == 'PAYPAL-1'
+
+    bodies = dict(server.hits)
+    assert b'currency=inr' in bodies['/v1/payment_intents']
+    assert json.loads(bodies['/v2/checkout/orders'])['purchase_units'][0]['amount'] == {
+        'currency_code': 'INR', 'value': '50000.00'}
+
+
+def test_razorpay_payment_needs_a_valid_signature_and_is_credited_once(stub, clients):
+    url, _ = stub()
+    client = clients(url)
+    client.create('razorpay', 250.0, owner=1)
+    forged = {'order_id': 'order_1', 'payment_id': 'pay_1', 'signature': 'forged'}
+    signed = dict(forged, signature=razorpay_signature('order_1', 'pay_1'))
+
+    assert not client.verify('razorpay', 1, forged)['success']
+    assert not client.verify('razorpay', 2, signed)['success']
+    assert client.verify('razorpay', 1, signed) == {'success': True, 'amount': 250.0, 'reference': 'order_1'}
+    assert client.verify('razorpay', 1, signed) == {'success': False, 'error': 'Unknown payment'}
+
+
+def test_stripe_and_paypal_payments_are_confirmed_with_the_provider(stub, clients):
+    url, server = stub()
+    client = clients(url)
+    client.create('stripe', 10.0, owner=1)
+    server.intent_status = 'requires_payment_method'
+    assert not client.verify('stripe', 1, {'payment_intent_id': 'pi_1'})['success']
+    server.intent_status = 'succeeded'
+    assert client.verify('stripe', 1, {'payment_intent_id': 'pi_1'})['amount'] == 10.0
+
+    client.create('paypal', 20.0, owner=1)
+    assert client.verify('paypal', 1, {'order_id': 'PAYPAL-1'})['amount'] == 20.0
+    assert not client.verify('razorpay', 1, {'order_id': 'never-created'})['success']
+
+
+def test_order_is_verified_by_any_worker_sharing_the_store(stub, clients):
+    url, _ = stub()
+    orders = InMemoryRepository()
+    created_by, verified_by = clients(url, orders=orders), clients(url, orders=orders)
+    created_by.create('paypal', 30.0, owner=1)
+
+    assert not verified_by.verify('paypal', 2, {'order_id': 'PAYPAL-1'})['success']
+    assert verified_by.verify('paypal', 1, {'order_id': 'PAYPAL-1'})['amount'] == 30.0
+    assert not created_by.verify('paypal', 1, {'order_id': 'PAYPAL-1'})['success']
+
+
+def test_expired_order_is_rejected(stub, clients):
+    url, _ = stub()
+    client = clients(url, order_ttl=0)
+    client.create('paypal', 30.0, owner=1)
+    assert client.verify('paypal', 1, {'order_id': 'PAYPAL-1'}) == {'success': False, 'error': 'Unknown payment'}
+
+
+def test_slow_provider_is_cut_off_at_the_deadline(stub, clients):
+    url, _ = stub(latency=2.0)
+    client = clients(url)
+    started = time.monotonic()
+    result = client.create('razorpay', 100.0, deadline=0.2)
+    assert time.monotonic() - started < 1.0
+    assert result['success'] is False and result['timeout'] is True
+    assert client.in_flight('razorpay') == 0
+
+
+def test_slow_provider_does_not_hold_up_others(stub, clients):
+    slow_url, _ = stub(latency=1.0)
+    fast_url, _ = stub()
+    client = clients(fast_url, paypal_url=slow_url, max_in_flight=2)
+    results = []
+    waiting = [threading.Thread(target=lambda: results.append(client.create('paypal', 1.0, deadline=3.0)))
+               for _ in range(2)]
+    for t in waiting:
+        t.start()
+    while client.in_flight('paypal') < 2:
+        time.sleep(0.01)
+
+    # The slow provider is at its cap: more calls fail fast...
+    with pytest.raises(GatewayBusy):
+        client.create('paypal', 1.0)
+    # ...while the other providers answer straight away
+    started = time.monotonic()
+    assert client.create('razorpay', 1.0)['success']
+    assert time.monotonic() - started < 0.5
+
+    for t in waiting:
+        t.join()
+    assert [result['success'] for result in results] == [True, True]
+
+
+def test_paypal_token_is_fetched_once_by_concurrent_orders(stub, clients):
+    url, server = stub(token_latency=0.05)
+    client = clients(url)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.create('paypal', 10.0)))
+               for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(result['success'] for result in results) and len(results) == 16
+    assert server.token_requests == 1
+
+
+def test_paypal_token_is_refreshed_before_it_expires(stub, clients):
+    # PayPal lifetimes under the safety margin are treated as already expired
+    url, server = stub(expires_in=30)
+    client = clients(url)
+    client.create('paypal', 10.0)
+    client.create('paypal', 10.0)
+    assert server.token_requests == 2
+
+
+def test_rejected_paypal_token_is_replaced_once(stub, clients):
+    url, server = stub()
+    client = clients(url)
+    assert client.create('paypal', 10.0)['success']
+    server.revoked.add('token-1')
+
+    assert client.create('paypal', 10.0)['success']
+    assert server.token_requests == 2
+
+
+def test_unconfigured_gateway_is_rejected():
+    client = PaymentGateway({'stripe': {'secret_key': ''}}, InMemoryRepository())
+    assert not client.configured('stripe')
+    assert not client.configured('bitcoin')
+    with pytest.raises(ValueError):
+        client.create('stripe', 1.0)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for the sliding-window login rate limiter
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from rate_limit import MemoryRateLimitBackend, SQLiteRateLimitBackend, TokenBucket
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        backend = SQLiteRateLimitBackend(str(tmp_path / 'limits.sqlite3'))
+    else:
+        backend = MemoryRateLimitBackend()
+    yield backend
+    backend.close()
+
+
+def test_limit_blocks_then_slides_open(backend):
+    """Attempts over the limit are refused until the window slides past them"""
+    start = 1000.0
+    assert all(backend.hit('login_1.2.3.4', 5, 300, now=start + i) for i in range(5))
+    assert not backend.hit('login_1.2.3.4', 5, 300, now=start + 10)
+    assert backend.hit('login_5.6.7.8', 5, 300, now=start + 10)
+
+    # Half of the previous window still overlaps: 5 * 0.5 = 2.5 counted
+    assert backend.hit('login_1.2.3.4', 5, 300, now=start + 450)
+    assert backend.hit('login_1.2.3.4', 5, 300, now=2000.0)
+
+
+def test_sqlite_limits_are_shared(tmp_path):
+    """Two backends on one file see each other's attempts, as workers would"""
+    path = str(tmp_path / 'limits.sqlite3')
+    first, second = SQLiteRateLimitBackend(path), SQLiteRateLimitBackend(path)
+    try:
+        assert first.hit('login_x', 2, 300, now=1000.0)
+        assert second.hit('login_x', 2, 300, now=1001.0)
+        assert not first.hit('login_x', 2, 300, now=1002.0)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_idle_keys_are_evicted_and_table_is_capped(backend):
+    backend.evict_every = 0
+    for i in range(50):
+        backend.hit(f'ip_{i}', 5, 60, now=1000.0)
+    backend.hit('recent', 5, 60, now=1200.0)
+    assert len(backend) == 1
+
+    capped = MemoryRateLimitBackend(max_keys=10)
+    for i in range(100):
+        capped.hit(f'ip_{i}', 5, 60, now=1000.0)
+    assert len(capped) == 10
+
+
+def test_token_bucket_reports_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == 0
+    assert 0 < bucket.try_take() <= 0.1
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the receipt PDF cache
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from receipt_cache import ReceiptCache, receipt_key
+
+PAYMENT = {'transaction_id': 'AB12CD34', 'description': 'Tuition', 'amount': 100.0,
+           'date': '2024-01-01 10:00:00', 'user_name': 'Student1', 'user_id': 1}
+
+
+def test_key_changes_with_receipt_content():
+    key, etag = receipt_key('student', PAYMENT, 'B.E Computer Science')
+    assert key.startswith('AB12CD34-') and key.endswith(etag)
+    assert receipt_key('student', dict(PAYMENT), 'B.E Computer Science') == (key, etag)
+    assert receipt_key('student', dict(PAYMENT, amount=200.0), 'B.E Computer Science')[1] != etag
+    assert receipt_key('parent', PAYMENT)[1] != etag
+
+
+def test_lru_spills_to_disk_and_promotes_back(tmp_path):
+    cache = ReceiptCache(max_bytes=10, spill_dir=str(tmp_path))
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    assert cache.get('a') == b'12345'
+    cache.put('c', b'12345')
+
+    # 'b' was least recently used and went to disk
+    assert cache.stats()['memory_entries'] == 2
+    assert os.listdir(tmp_path) == ['b.pdf']
+    assert cache.get('b') == b'12345'
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_get_or_render_renders_once():
+    cache = ReceiptCache()
+    calls = []
+
+    def render():
+        calls.append(1)
+        return b'%PDF'
+
+    assert cache.get_or_render('k', render) == b'%PDF'
+    assert cache.get_or_render('k', render) == b'%PDF'
+    assert len(calls) == 1
+
+
+def test_disk_limit_removes_oldest_files(tmp_path):
+    cache = ReceiptCache(max_bytes=1, spill_dir=str(tmp_path), max_disk_bytes=10)
+    for key in 'abcd':
+        cache.put(key, b'12345')
+    assert sorted(os.listdir(tmp_path)) == ['b.pdf', 'c.pdf']
+    # A fresh cache picks up what is already on disk
+    assert ReceiptCache(spill_dir=str(tmp_path)).get('c') == b'12345'
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the streamed bulk receipt export
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import io
+import subprocess
+import textwrap
+import zipfile
+
+import pytest
+
+pytest.importorskip('reportlab')
+
+from receipt_export import get_pool, shutdown_pool, stream_receipts_zip
+
+LETTERHEAD = {
+    'name': 'Test University',
+    'subtitle': 'College of Engineering',
+    'address': 'Chennai',
+    'email': 'fees@example.edu',
+    'phone': '000',
+    'website': 'example.edu'
+}
+
+
+@pytest.fixture
+def pool():
+    yield get_pool(LETTERHEAD, 2)
+    shutdown_pool()
+
+
+def payment(n):
+    return {
+        'transaction_id': f'TX{n:04d}',
+        'date': '2026-01-15 10:00:00',
+        'user_name': f'Student {n}',
+        'user_id': n,
+        'description': 'Tuition Fee',
+        'amount': 1000.0 + n
+    }
+
+
+def test_archive_holds_one_pdf_per_job(pool):
+    jobs = [(f'{n}/Fee_Receipt_TX{n:04d}.pdf', 'student', payment(n), {'course': 'CSE'}) for n in range(7)]
+    chunks = list(stream_receipts_zip(iter(jobs), pool, batch_size=3, max_in_flight=2))
+
+    assert len(chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert sorted(archive.namelist()) == sorted(name for name, _, _, _ in jobs)
+        for name in archive.namelist():
+            assert archive.read(name).startswith(b'%PDF')
+
+
+def test_empty_export_is_a_valid_archive(pool):
+    data = b''.join(stream_receipts_zip(iter([]), pool))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == []
+
+
+def test_render_workers_skip_the_app_startup(tmp_path):
+    # What a worker does with `python app.py`: re-run it as __mp_main__
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = textwrap.dedent(f"""
+        import runpy, sys, threading
+        sys.path.insert(0, {here!r})
+        app = runpy.run_path({os.path.join(here, 'app.py')!r}, run_name='__mp_main__')
+        print(len(app['users']), [t.name for t in threading.enumerate() if t.name == 'invoice-scheduler'])
+    """)
+    env = dict(os.environ, PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=120,
+                            cwd=str(tmp_path), env=env)
+    assert output.returncode == 0, output.stderr
+    assert output.stdout.split('\n')[-2] == '0 []'
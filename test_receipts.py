@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for the receipt engine's static form
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import io
+
+import pytest
+
+pytest.importorskip('reportlab')
+pypdf = pytest.importorskip('pypdf')
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from receipts import RECEIPT_LAYOUTS, ReceiptRenderer
+
+LETTERHEAD = {
+    'name': 'Test University',
+    'subtitle': 'College of Engineering',
+    'address': 'Chennai',
+    'email': 'fees@example.edu',
+    'phone': '000',
+    'website': 'example.edu'
+}
+PAYMENT = {
+    'transaction_id': 'A1B2C3D4',
+    'date': '2024-06-15 10:30:00',
+    'user_name': 'Student1',
+    'user_id': 1,
+    'description': 'Tuition Fee',
+    'amount': 150000.0
+}
+
+
+def full_redraw(renderer):
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    renderer.draw_static(p)
+    renderer.draw_fields(p, PAYMENT, {'course': 'CSE'})
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def page_text_and_fonts(pdf):
+    """The page's text, and each string with the font and size it is drawn in"""
+    runs = []
+
+    def visit(text, cm, tm, font, size):
+        if text.strip():
+            runs.append((text, font['/BaseFont'] if font else None, size))
+
+    page = pypdf.PdfReader(io.BytesIO(pdf)).pages[0]
+    return page.extract_text(visitor_text=visit), runs
+
+
+@pytest.mark.parametrize('kind', sorted(RECEIPT_LAYOUTS))
+def test_page_through_the_form_matches_a_full_redraw(kind):
+    renderer = ReceiptRenderer(kind, LETTERHEAD)
+    expected = page_text_and_fonts(full_redraw(renderer))
+    assert LETTERHEAD['name'] in expected[0] and 'A1B2C3D4' in expected[0]
+    assert page_text_and_fonts(renderer.render(PAYMENT, {'course': 'CSE'})) == expected
+
+
+def test_static_layout_is_one_form_xobject():
+    pdf = ReceiptRenderer('student', LETTERHEAD).render(PAYMENT, {'course': 'CSE'})
+    page = pypdf.PdfReader(io.BytesIO(pdf)).pages[0]
+    forms = page['/Resources']['/XObject']
+    assert [forms[name]['/Subtype'] for name in forms] == ['/Form']
+    assert LETTERHEAD['website'].encode() in forms[list(forms)[0]].get_data()
+    assert LETTERHEAD['website'].encode() not in page.get_contents().get_data()
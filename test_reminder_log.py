@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded reminder history
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from reminder_log import ReminderLog
+
+
+def reminder(number, day=1):
+    return {'id': f'r{number}', 'message': f'Reminder {number}', 'created_date': f'2024-01-{day:02d} 10:00:00'}
+
+
+def test_recent_pages_newest_first():
+    log = ReminderLog(capacity=50)
+    for number in range(25):
+        log.add(reminder(number))
+
+    page, before = log.recent(limit=10)
+    assert [entry['id'] for entry in page] == [f'r{n}' for n in range(24, 14, -1)]
+    page, before = log.recent(before=before, limit=10)
+    assert page[0]['id'] == 'r14'
+    page, before = log.recent(before=before, limit=10)
+    assert [entry['id'] for entry in page] == [f'r{n}' for n in range(4, -1, -1)]
+    assert before is None
+
+
+def test_memory_is_bounded_and_old_pages_come_from_archive(tmp_path):
+    log = ReminderLog(capacity=10, segment_size=5, archive_dir=str(tmp_path))
+    for number in range(33):
+        log.add(reminder(number))
+
+    assert len(log) == 10
+    assert len(log._segment) < 5
+    assert len(os.listdir(tmp_path)) == 4
+
+    ids = []
+    before = None
+    while True:
+        page, before = log.recent(before=before, limit=7)
+        ids.extend(entry['id'] for entry in page)
+        if before is None:
+            break
+    assert ids == [f'r{n}' for n in range(32, -1, -1)]
+
+    # Closing archives the rest; a restarted log continues the sequence
+    log.close()
+    reopened = ReminderLog(capacity=10, segment_size=5, archive_dir=str(tmp_path))
+    assert reopened.add(reminder(99)) == 33
+    page, before = reopened.recent(limit=3)
+    assert [entry['id'] for entry in page] == ['r99', 'r32', 'r31']
+    # The ring only spans what was added since, not its empty slots
+    assert (reopened._oldest, reopened._next, len(reopened)) == (33, 34, 1)
+    reopened.close()
+    assert len(reopened) == 0 and reopened.recent(limit=1)[0][0]['id'] == 'r99'
+
+
+def test_without_archive_evicted_entries_are_dropped():
+    log = ReminderLog(capacity=4, segment_size=2)
+    for number in range(10):
+        log.add(reminder(number))
+
+    assert log.dropped == 6
+    page, before = log.recent(limit=100)
+    assert [entry['id'] for entry in page] == ['r9', 'r8', 'r7', 'r6']
+
+
+def test_time_bounds():
+    log = ReminderLog(capacity=100)
+    for number in range(30):
+        log.add(reminder(number, day=number // 3 + 1))
+
+    page, _ = log.recent(limit=100, since='2024-01-03', until='2024-01-05')
+    assert [entry['id'] for entry in page] == [f'r{n}' for n in range(14, 5, -1)]
+
+
+def test_per_student_history_follows_eviction():
+    log = ReminderLog(capacity=6)
+    for number in range(10):
+        log.add(reminder(number), student_ids=[number % 2, 7])
+
+    page, before = log.for_student(1, limit=2)
+    assert [entry['id'] for entry in page] == ['r9', 'r7']
+    page, before = log.for_student(1, before=before, limit=2)
+    assert [entry['id'] for entry in page] == ['r5']
+    assert before is None
+    assert len(log.for_student(7, limit=100)[0]) == 6
+    assert log.for_student(3) == ([], None)
+
+
+def test_bulk_jobs_cost_recipients_a_capped_slot(tmp_path):
+    log = ReminderLog(capacity=4, segment_size=2, archive_dir=str(tmp_path), per_student=3)
+    cohort = range(1000)
+    for number in range(10):
+        log.add(reminder(number), student_ids=cohort)
+
+    assert all(len(seqs) == 3 for seqs in log._by_student.values())
+    page, before = log.for_student(500, limit=2)
+    assert [entry['id'] for entry in page] == ['r9', 'r8']
+    page, before = log.for_student(500, before=before, limit=2)
+    assert [entry['id'] for entry in page] == ['r7'] and before is None
+
+    # Archived records keep the entry, not the recipient list
+    with open(os.path.join(tmp_path, sorted(os.listdir(tmp_path))[0]), encoding='utf-8') as f:
+        assert 'student_ids' not in f.readline()
+
+
+def test_entries_reflect_later_updates():
+    log = ReminderLog()
+    job = {'id': 'bulk', 'status': 'queued', 'created_date': '2024-01-01 10:00:00'}
+    log.add(job)
+    job['status'] = 'sent'
+
+    assert log.recent()[0][0]['status'] == 'sent'
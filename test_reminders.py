@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for bulk reminder dispatch
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import time
+
+import pytest
+
+from reminders import OutboxChannel, ReminderDispatcher
+
+
+class FailingChannel:
+    name = 'sms'
+
+    def send_batch(self, messages):
+        return ['rejected'] * len(messages)
+
+
+def render(batch):
+    return [{'channel': r['channel'], 'address': r['address'], 'subject': 'Fees', 'text': f"Hi {r['name']}"}
+            for r in batch]
+
+
+def recipients(count, channel='email'):
+    return [{'name': f'S{i}', 'channel': channel, 'address': f's{i}@example.com'} for i in range(count)]
+
+
+def test_job_sends_every_message_in_batches():
+    email = OutboxChannel('email')
+    dispatcher = ReminderDispatcher({'email': email}, {'email': 1000}, batch_size=7)
+    job = dispatcher.submit(recipients(30), render, target='students')
+    dispatcher.join()
+
+    status = dispatcher.status(job['id'])
+    assert status['status'] == 'sent'
+    assert (status['total'], status['sent'], status['failed']) == (30, 30, 0)
+    assert status['target'] == 'students'
+    assert email.delivered == 30
+    assert email.outbox[-1]['text'] == 'Hi S29'
+    dispatcher.stop(1)
+
+
+def test_failures_are_counted_per_channel():
+    email = OutboxChannel('email')
+    dispatcher = ReminderDispatcher({'email': email, 'sms': FailingChannel()}, {'email': 1000, 'sms': 1000})
+    job = dispatcher.submit(recipients(5) + recipients(3, 'sms') + recipients(2, 'fax'), render)
+    dispatcher.join()
+
+    status = dispatcher.status(job['id'])
+    assert (status['sent'], status['failed']) == (5, 5)
+    assert status['status'] == 'sent'
+    dispatcher.stop(1)
+
+
+def test_channel_rate_is_respected():
+    email = OutboxChannel('email')
+    dispatcher = ReminderDispatcher({'email': email}, {'email': 50})
+    started = time.monotonic()
+    dispatcher.submit(recipients(75), render)
+    dispatcher.join()
+
+    # 50 messages fit in the initial burst; the other 25 take about half a second
+    assert time.monotonic() - started >= 0.4
+    assert email.delivered == 75
+    dispatcher.stop(1)
+
+
+def test_render_error_fails_job():
+    def broken(batch):
+        raise KeyError('name')
+
+    dispatcher = ReminderDispatcher({'email': OutboxChannel('email')}, {'email': 1000})
+    job = dispatcher.submit(recipients(3), broken)
+    dispatcher.join()
+
+    assert dispatcher.status(job['id'])['status'] == 'failed'
+    assert dispatcher.status('missing') is None
+    dispatcher.stop(1)
+
+
+def test_bulk_reminder_text_is_sent_unescaped(tmp_path, monkeypatch):
+    # The app writes its secret key next to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    edupay = pytest.importorskip('app')
+    client = edupay.app.test_client()
+    with client.session_transaction() as session:
+        session['user_type'] = 'institution'
+        session['user_data'] = {'name': 'Test Institution'}
+
+    text = "Fees due & payable, don't <wait>"
+    response = client.post('/send_bulk_reminder', json={'target': 'both', 'message': text, 'message_type': 'custom'})
+    reminder_id = response.get_json()['reminder_id']
+    edupay.reminder_dispatcher.join()
+
+    sent = [message['text'] for channel in edupay.reminder_channels.values() for message in channel.outbox]
+    assert sent and set(sent) == {text}
+    entries, _ = edupay.reminder_log.recent(limit=100)
+    stored = next(entry for entry in entries if entry['id'] == reminder_id)
+    assert stored['message'] == 'Fees due &amp; payable, don&#39;t &lt;wait&gt;'
+
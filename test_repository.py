@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for the storage repositories; the MongoDB backend runs against mongomock
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import time
+
+import pytest
+from markupsafe import escape
+from pymongo.errors import AutoReconnect
+
+from repository import InMemoryRepository, MongoRepository
+
+
+def mongo_repository():
+    mongomock = pytest.importorskip('mongomock')
+    repository = MongoRepository(mongomock.MongoClient()['edupay_test'], batch_size=3)
+    repository.ensure_indexes()
+    return repository
+
+
+@pytest.fixture(params=['memory', 'mongo'])
+def repository(request):
+    if request.param == 'memory':
+        return InMemoryRepository()
+    return mongo_repository()
+
+
+def test_round_trip(repository):
+    invoice = {'id': 'inv-1', 'issue_date': '2024-01-01', 'due_date': '2024-02-01',
+               'description': 'Tuition', 'amount': 100.0, 'status': 'Pending', 'paid_date': None}
+    repository.save_user('student1', {'id': 1, 'name': 'Student1', 'email': 's1@school.edu'})
+    repository.add_invoices(1, [invoice])
+    repository.append_transaction(1, {'date': '2024-01-05 10:00:00', 'description': escape('<b>Fee</b>'),
+                                      'amount': -100.0, 'balance': 0.0})
+    repository.append_transaction(1, {'date': '2024-01-03 10:00:00', 'description': 'Top up',
+                                      'amount': 100.0, 'balance': 100.0})
+    repository.update_invoice(1, dict(invoice, status='Paid', paid_date='2024-01-05'))
+    repository.flush()
+
+    assert repository.load_users()['student1']['name'] == 'Student1'
+    assert [inv['status'] for inv in repository.load_invoices()[1]] == ['Paid']
+    assert [t['date'] for _, t in repository.load_transactions()] == ['2024-01-03 10:00:00', '2024-01-05 10:00:00']
+
+
+def test_pending_order_is_claimed_once_by_its_owner(repository):
+    order = {'owner': 1, 'amount': 50.0, 'expires': time.time() + 60}
+    repository.save_order('paypal:PAYPAL-1', order)
+
+    assert repository.claim_order('paypal:PAYPAL-1', 2) is None
+    assert repository.claim_order('paypal:PAYPAL-1', 1) == order
+    assert repository.claim_order('paypal:PAYPAL-1', 1) is None
+
+
+def test_full_batch_is_written_by_the_background_flusher():
+    repository = mongo_repository()
+    repository.flush_interval = 60
+    repository.start()
+    try:
+        repository.append_transaction(1, {'date': '2024-01-01 00:00:00', 'amount': 1.0})
+        repository.append_transaction(1, {'date': '2024-01-01 00:00:01', 'amount': 2.0})
+        assert repository.payments.count_documents({}) == 0
+        repository.append_transaction(1, {'date': '2024-01-01 00:00:02', 'amount': 3.0})
+        deadline = time.monotonic() + 5
+        while repository.payments.count_documents({}) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert repository.payments.count_documents({}) == 3
+    finally:
+        repository.close()
+
+
+class Unreachable:
+    def __getitem__(self, name):
+        return self
+
+    def bulk_write(self, operations, ordered=True):
+        raise AutoReconnect('connection refused')
+
+
+def test_failed_flush_is_requeued_behind_newer_writes():
+    repository = mongo_repository()
+    db = repository.db
+
+    repository.save_user('alice', {'id': 1, 'balance': 10.0})
+    repository.save_user('bob', {'id': 2, 'balance': 5.0})
+    repository.db = Unreachable()
+    repository.flush()
+    repository.db = db
+    repository.save_user('alice', {'id': 1, 'balance': 20.0})
+    repository.flush()
+
+    assert repository.load_users() == {'alice': {'id': 1, 'balance': 20.0}, 'bob': {'id': 2, 'balance': 5.0}}
+
+
+def test_invoice_batch(repository):
+    batch = {user_id: [{'id': f'inv-{user_id}-{n}', 'issue_date': '2024-01-01', 'due_date': '2024-02-01',
+                        'amount': 10.0, 'status': 'Pending'} for n in range(2)]
+             for user_id in range(1, 6)}
+    repository.add_invoice_batch(batch)
+    repository.flush()
+
+    invoices = repository.load_invoices()
+    assert sorted(invoices) == [1, 2, 3, 4, 5]
+    assert [inv['id'] for inv in invoices[3]] == ['inv-3-0', 'inv-3-1']
+
+
+def test_outage_spills_to_disk_and_replays_in_order(tmp_path):
+    repository = mongo_repository()
+    repository.max_pending = 2
+    repository.spill_path = str(tmp_path / 'spill.jsonl')
+    db = repository.db
+    repository.db = Unreachable()
+
+    repository.save_user('alice', {'id': 1, 'balance': 10.0})
+    repository.append_transaction(1, {'date': '2024-01-01 00:00:00', 'transaction_id': 'T1', 'amount': 1.0})
+    repository.update_transaction(1, 'T1', {'email_status': 'sent'})
+    repository.flush()
+    assert repository._pending_count == 0 and os.path.exists(repository.spill_path)
+
+    # Writes made while spilled queue up behind the spilled ones
+    repository.save_user('alice', {'id': 1, 'balance': 20.0})
+    repository.append_transaction(1, {'date': '2024-01-02 00:00:00', 'amount': 2.0})
+    repository.flush()
+    assert repository._pending_count == 0
+
+    repository.db = db
+    repository.flush()
+    assert not os.path.exists(repository.spill_path)
+    assert repository.load_users() == {'alice': {'id': 1, 'balance': 20.0}}
+    assert [t.get('email_status') for _, t in repository.load_transactions()] == ['sent', None]
+
+
+def test_outage_without_a_spill_file_is_capped():
+    repository = mongo_repository()
+    repository.max_pending = 2
+    repository.db = Unreachable()
+    for n in range(5):
+        repository.append_transaction(1, {'date': f'2024-01-01 00:00:0{n}', 'amount': 1.0})
+    repository.flush()
+    assert repository._pending_count == 0 and repository._pending['payments'] == []
+
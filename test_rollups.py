@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the collection rollup cube
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+from datetime import date
+
+import pytest
+from jinja2 import FileSystemLoader
+from werkzeug.serving import make_server
+
+from ledger import TransactionLedger
+from rollups import RollupCube
+
+PROFILES = {1: ('CSE', '1st Year'), 2: ('MECH', '2nd Year')}
+
+
+def make_transaction(when, amount, gateway=None):
+    transaction = {'date': when, 'description': 'Test', 'amount': amount, 'balance': 0}
+    if gateway:
+        transaction['gateway'] = gateway
+    return transaction
+
+
+def build():
+    ledger = TransactionLedger()
+    cube = RollupCube()
+    for user_id, transaction in [
+        (1, make_transaction('2024-02-28 10:00:00', -1000.0)),
+        (2, make_transaction('2024-03-01 09:00:00', -250.0)),
+        (1, make_transaction('2024-03-01 18:00:00', -50.0)),
+        (1, make_transaction('2024-03-02 10:00:00', 3000.0, 'razorpay')),
+        (2, make_transaction('2024-03-03 10:00:00', 1000.0, 'stripe')),
+    ]:
+        ledger.append(user_id, transaction)
+        cube.record(transaction, *PROFILES[user_id])
+    return ledger, cube
+
+
+def test_queries_group_by_dimension():
+    _, cube = build()
+    assert cube.daily_collections(date(2024, 2, 29), date(2024, 3, 2)) == [
+        (date(2024, 2, 29), 0.0), (date(2024, 3, 1), 300.0), (date(2024, 3, 2), 0.0)
+    ]
+    assert cube.daily_collections(date(2024, 3, 1), date(2024, 3, 1), course='CSE') == [(date(2024, 3, 1), 50.0)]
+    assert cube.totals(date(2024, 3, 1), date(2024, 3, 31), by=('course',)) == {
+        ('CSE',): [50.0, 3000.0, 2], ('MECH',): [250.0, 1000.0, 2]
+    }
+    assert cube.monthly_collections(2, today=date(2024, 3, 15)) == [
+        {'month': 'Feb 2024', 'amount': 1000.0}, {'month': 'Mar 2024', 'amount': 300.0}
+    ]
+    assert [row['method'] for row in cube.gateway_mix()] == ['razorpay', 'stripe']
+    assert cube.gateway_mix()[0]['percentage'] == 75.0
+
+
+def test_rebuild_matches_and_diff_finds_drift():
+    ledger, cube = build()
+    fresh = RollupCube.rebuild(ledger, PROFILES.get)
+    assert cube.diff(fresh) == []
+
+    cube.record(make_transaction('2024-03-05 10:00:00', -10.0), 'CSE', '1st Year')
+    assert [day for day, _, _, _ in cube.diff(fresh)] == ['2024-03-05']
+
+
+def test_rebuild_from_swaps_in_the_ledger_cells():
+    ledger, cube = build()
+    cube.record(make_transaction('2024-03-05 10:00:00', -10.0), 'CSE', '1st Year')
+
+    previous = cube.rebuild_from(ledger, PROFILES.get)
+    assert cube.diff(RollupCube.rebuild(ledger, PROFILES.get)) == []
+    assert [day for day, _, _, _ in previous.diff(cube)] == ['2024-03-05']
+
+
+def test_cli_checks_and_repairs_the_running_server(tmp_path, monkeypatch):
+    # The app writes its secret key next to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    edupay = pytest.importorskip('app')
+    monkeypatch.setattr(edupay.app, 'jinja_loader', FileSystemLoader(os.path.dirname(os.path.abspath(__file__))))
+    server = make_server('127.0.0.1', 0, edupay.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    runner = edupay.app.test_cli_runner()
+    login = ['--url', f'http://127.0.0.1:{server.server_port}', '--username', 'institution1',
+             '--password', edupay.INSTITUTION_ACCOUNTS[0]['password']]
+    try:
+        assert runner.invoke(args=['rollups', 'rebuild'] + login).exit_code == 0
+        edupay.rollups.record(make_transaction('2031-03-05 10:00:00', -10.0), 'CSE', '1st Year')
+        result = runner.invoke(args=['rollups', 'check'] + login)
+        assert result.exit_code == 1 and "2031-03-05 ('CSE', '1st Year', 'N/A')" in result.output
+
+        result = runner.invoke(args=['rollups', 'rebuild'] + login)
+        assert result.exit_code == 0 and '1 cells repaired' in result.output
+        result = runner.invoke(args=['rollups', 'check'] + login)
+        assert result.exit_code == 0 and 'Rollups match the ledger' in result.output
+
+        result = runner.invoke(args=['rollups', 'check'] + login[:-1] + ['wrong'])
+        assert result.exit_code == 2 and '401' in result.output
+    finally:
+        server.shutdown()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the invoice due-date scheduler
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, timedelta
+
+from scheduler import DUE_SOON, OVERDUE, UPCOMING, InvoiceScheduler
+
+TODAY = date(2024, 3, 1)
+
+
+def test_track_reports_current_state():
+    scheduler = InvoiceScheduler(due_soon_days=7)
+    assert scheduler.track(1, 'a', '2024-03-20', today=TODAY) == UPCOMING
+    assert scheduler.track(1, 'b', '2024-03-08', today=TODAY) == DUE_SOON
+    assert scheduler.track(2, 'c', '2024-02-29', today=TODAY) == OVERDUE
+    assert scheduler.counts() == {UPCOMING: 1, DUE_SOON: 1, OVERDUE: 1, 'overdue_students': 1}
+    assert scheduler.has_overdue(2) and not scheduler.has_overdue(1)
+
+
+def test_tick_emits_transitions_on_their_day():
+    scheduler = InvoiceScheduler(due_soon_days=7)
+    received = []
+    scheduler.subscribe(received.append)
+    scheduler.track(1, 'a', '2024-03-10', today=TODAY)
+
+    assert scheduler.tick(TODAY) == []
+    events = scheduler.tick(date(2024, 3, 3))
+    assert [(e['type'], e['invoice_id']) for e in events] == [(DUE_SOON, 'a')]
+    assert scheduler.tick(date(2024, 3, 10)) == []
+    events = scheduler.tick(date(2024, 3, 11))
+    assert [(e['type'], e['user_id']) for e in events] == [(OVERDUE, 1)]
+    assert len(received) == 2
+    assert scheduler.tick(date(2024, 4, 1)) == []
+
+
+def test_late_tick_goes_straight_to_overdue():
+    scheduler = InvoiceScheduler(due_soon_days=7)
+    scheduler.track(1, 'a', '2024-03-10', today=TODAY)
+    events = scheduler.tick(date(2024, 3, 20))
+    assert [e['type'] for e in events] == [OVERDUE]
+    assert scheduler.state('a') == OVERDUE
+
+
+def test_untracked_invoices_do_not_fire_and_are_compacted():
+    scheduler = InvoiceScheduler(due_soon_days=7)
+    for number in range(200):
+        scheduler.track(number, f'inv{number}', TODAY + timedelta(days=30), today=TODAY)
+    for number in range(150):
+        scheduler.untrack(f'inv{number}')
+
+    assert len(scheduler._heap) < 200
+    events = scheduler.tick(TODAY + timedelta(days=31))
+    assert sorted(e['invoice_id'] for e in events) == sorted(f'inv{n}' for n in range(150, 200))
+    assert scheduler.counts()['overdue_students'] == 50
+
+
+def test_retracking_replaces_the_due_date():
+    scheduler = InvoiceScheduler(due_soon_days=7)
+    scheduler.track(1, 'a', '2024-03-05', today=TODAY)
+    scheduler.track(1, 'a', '2024-04-30', today=TODAY)
+    assert scheduler.tick(date(2024, 3, 10)) == []
+    assert scheduler.state('a') == UPCOMING
+    assert scheduler.counts()[UPCOMING] == 1
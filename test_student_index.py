@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the cursor-paginated student index
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import random
+
+import pytest
+
+from student_index import InvalidCursor, StudentIndex
+from student_summary import StudentSummary
+from user_directory import UserDirectory
+
+COURSES = ['CSE', 'ECE', 'MECH']
+YEARS = ['1st Year', '2nd Year']
+
+
+@pytest.fixture
+def index():
+    rng = random.Random(7)
+    users = UserDirectory()
+    summary = StudentSummary()
+    for user_id in range(1, 301):
+        users[f'student{user_id}'] = {
+            'id': user_id, 'name': f'Student {rng.randint(1, 50)}', 'email': f's{user_id}@example.com',
+            'course': rng.choice(COURSES), 'year': rng.choice(YEARS), 'balance': float(rng.randint(0, 20) * 1000)
+        }
+        summary.open_account(user_id)
+        if rng.random() < 0.6:
+            summary.invoice_added(user_id, rng.choice([500.0, 1200.0, 15000.0]))
+    index = StudentIndex(users, summary)
+    for user_id in range(1, 301):
+        index.refresh(user_id)
+    index.users, index.summary = users, summary
+    return index
+
+
+def read_all(index, **query):
+    ids, cursor = index.page(limit=7, **query)
+    while cursor:
+        more, cursor = index.page(limit=7, cursor=cursor, **query)
+        ids += more
+    return ids
+
+
+def expected(index, sort, descending=False, course=None, min_pending=None, max_pending=None):
+    rows = []
+    for _, user in index.users.students(course=course):
+        pending = index.summary.pending_amount(user['id'])
+        if min_pending is not None and pending < min_pending or max_pending is not None and pending > max_pending:
+            continue
+        value = {'id': user['id'], 'name': user['name'].lower(), 'balance': user['balance'],
+                 'pending_amount': pending}[sort]
+        rows.append((value, user['id']))
+    return [user_id for _, user_id in sorted(rows, reverse=descending)]
+
+
+@pytest.mark.parametrize('sort', ['id', 'name', 'balance', 'pending_amount'])
+@pytest.mark.parametrize('descending', [False, True])
+def test_pages_match_a_full_sort(index, sort, descending):
+    assert read_all(index, sort=sort, descending=descending) == expected(index, sort, descending)
+    assert read_all(index, sort=sort, descending=descending, course='ECE', min_pending=1000) == \
+        expected(index, sort, descending, course='ECE', min_pending=1000)
+    assert read_all(index, sort=sort, descending=descending, max_pending=0) == \
+        expected(index, sort, descending, max_pending=0)
+
+
+def test_changes_move_students_between_pages(index):
+    index.summary.invoice_added(5, 99999.0)
+    index.users['student5']['year'] = '4th Year'
+    index.users.reindex('student5')
+    index.refresh(5)
+
+    assert index.page(sort='pending_amount', descending=True, limit=1)[0] == [5]
+    assert index.page(year='4th Year')[0] == [5]
+    assert 5 not in read_all(index, year='1st Year') + read_all(index, year='2nd Year')
+
+
+def test_bad_cursors_are_rejected(index):
+    _, cursor = index.page(sort='name', limit=1)
+    with pytest.raises(InvalidCursor):
+        index.page(sort='balance', cursor=cursor)
+    with pytest.raises(InvalidCursor):
+        index.page(cursor='not-a-cursor')
+
+
+def test_where_predicate_filters_rows(index):
+    ids = read_all(index, sort='balance', where=lambda user_id: user_id % 3 == 0)
+    assert ids == [user_id for user_id in expected(index, 'balance') if user_id % 3 == 0]
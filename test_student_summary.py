@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Tests for the running student fee summary
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from student_summary import StudentSummary
+
+
+def test_totals_follow_invoices():
+    summary = StudentSummary()
+    summary.open_account(1)
+    summary.open_account(2)
+    summary.invoice_added(1, 150000.10)
+    summary.invoice_added(1, 12050.20)
+    summary.invoice_added(99, 500.0)  # not a student, e.g. the admin account
+
+    assert summary.pending_amount(1) == 162050.30
+    assert summary.totals() == {'total_students': 2, 'paid_students': 1,
+                                'students_with_pending': 1, 'total_pending': 162050.30}
+
+    summary.invoice_paid(1, 150000.10)
+    summary.invoice_paid(1, 12050.20)
+    assert summary.totals()['students_with_pending'] == 0
+    assert summary.totals()['total_pending'] == 0.0
+
+
+def test_opening_an_account_counts_existing_invoices():
+    summary = StudentSummary()
+    summary.invoice_added(3, 100.0)
+    summary.open_account(3)
+    summary.open_account(3)
+    assert summary.totals() == {'total_students': 1, 'paid_students': 0,
+                                'students_with_pending': 1, 'total_pending': 100.0}
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the indexed users directory
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from user_directory import UserDirectory
+
+
+def make_user(user_id, course, year, **extra):
+    return dict({'id': user_id, 'name': f'User {user_id}', 'email': f'user{user_id}@example.com',
+                 'course': course, 'year': year}, **extra)
+
+
+def test_indexes_follow_writes():
+    backing = {'student1': make_user(1, 'CSE', '1st Year')}
+    users = UserDirectory(backing)
+    users['student2'] = make_user(2, 'CSE', '2nd Year')
+    users['admin'] = make_user(3, 'N/A', 'N/A', is_admin=True)
+
+    assert backing is users._users and 'student2' in backing
+    assert users.by_id(2) == ('student2', backing['student2'])
+    assert users.by_email('USER1@example.com')[0] == 'student1'
+    assert [name for name, _ in users.students()] == ['student1', 'student2']
+    assert [name for name, _ in users.students('CSE', '2nd Year')] == ['student2']
+    assert [name for name, _ in users.students(year='1st Year')] == ['student1']
+
+
+def test_reindex_moves_changed_users():
+    users = UserDirectory({'student1': make_user(1, 'CSE', '1st Year')})
+    users['student1']['year'] = '2nd Year'
+    users['student1']['email'] = 'new@example.com'
+    users.reindex('student1')
+
+    assert users.students('CSE', '1st Year') == []
+    assert users.cohorts() == [('CSE', '2nd Year')]
+    assert users.by_email('user1@example.com') is None
+    assert users.by_email('new@example.com')[0] == 'student1'
+
+    del users['student1']
+    assert users.by_id(1) is None
+    assert users.cohorts() == []
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for the journaled users store
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from user_store import UserStore
+
+
+def test_flush_journals_only_dirty_records(tmp_path):
+    """Only records marked dirty are written, and they survive a reload"""
+    path = str(tmp_path / 'user_data.json')
+    store = UserStore(path, flush_delay=0)
+    users = store.load()
+    users['student1'] = {'id': 1, 'name': 'Student1'}
+    users['student2'] = {'id': 2, 'name': 'Student2'}
+    store.mark_dirty('student1')
+    store.close()
+
+    with open(store.journal_path) as f:
+        lines = f.read().splitlines()
+    assert lines == ['["student1",{"id":1,"name":"Student1"}]']
+
+    reloaded = UserStore(path).load()
+    assert reloaded == {'student1': {'id': 1, 'name': 'Student1'}}
+
+
+def test_snapshot_is_compact_and_replaces_journal(tmp_path):
+    path = str(tmp_path / 'user_data.json')
+    store = UserStore(path, compact_after=2)
+    users = store.load()
+    for i in range(3):
+        users[f'student{i}'] = {'id': i}
+        store.mark_dirty(f'student{i}')
+    store.flush()
+
+    assert not os.path.exists(store.journal_path)
+    with open(path) as f:
+        raw = f.read()
+    assert '\n' not in raw and ': ' not in raw
+    assert json.loads(raw) == users
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp')] == []
+
+
+def test_loads_legacy_pretty_printed_file(tmp_path):
+    path = str(tmp_path / 'user_data.json')
+    with open(path, 'w') as f:
+        json.dump({'admin': {'id': 3}}, f, indent=2)
+    assert UserStore(path).load() == {'admin': {'id': 3}}
@@ -0,0 +1,130 @@
+"""
+The users directory.
+
+UserDirectory is the username -> user record mapping the app has always
+used, with secondary indexes kept in step with every write: user id and
+email to username, and students grouped by (course, year). Id and email
+lookups are O(1), and cohort queries only touch the cohort they ask for.
+
+The directory wraps the dict it is given in place, so a UserStore that
+holds the same dict keeps seeing every change.
+"""
+
+import threading
+from collections.abc import MutableMapping
+
+
+def _cohort(user):
+    return user.get('course', 'N/A'), user.get('year', 'N/A')
+
+
+class UserDirectory(MutableMapping):
+    def __init__(self, users=None):
+        self._users = users if users is not None else {}
+        self._by_id = {}
+        self._by_email = {}
+        # (course, year) -> usernames in insertion order; students only
+        self._cohorts = {}
+        # username -> (id, email, cohort) as last indexed, to undo on change
+        self._indexed = {}
+        self._lock = threading.RLock()
+        for username in list(self._users):
+            self._index(username)
+
+    def __getitem__(self, username):
+        return self._users[username]
+
+    def __setitem__(self, username, user):
+        with self._lock:
+            self._users[username] = user
+            self._index(username)
+
+    def __delitem__(self, username):
+        with self._lock:
+            del self._users[username]
+            self._unindex(username)
+
+    def __iter__(self):
+        # Iterate over a snapshot so writers never break a reader's loop
+        with self._lock:
+            return iter(list(self._users))
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, username):
+        return username in self._users
+
+    def reindex(self, username):
+        """Refresh the indexes after a user's fields changed in place"""
+        with self._lock:
+            if username in self._users:
+                self._index(username)
+
+    def _index(self, username):
+        user = self._users[username]
+        entry = (user.get('id'), (user.get('email') or '').lower(), None if user.get('is_admin') else _cohort(user))
+        if self._indexed.get(username) == entry:
+            return
+        self._unindex(username)
+        user_id, email, cohort = entry
+        if user_id is not None:
+            self._by_id[user_id] = username
+        if email:
+            self._by_email[email] = username
+        if cohort is not None:
+            self._cohorts.setdefault(cohort, {})[username] = None
+        self._indexed[username] = entry
+
+    def _unindex(self, username):
+        entry = self._indexed.pop(username, None)
+        if entry is None:
+            return
+        user_id, email, cohort = entry
+        if self._by_id.get(user_id) == username:
+            del self._by_id[user_id]
+        if self._by_email.get(email) == username:
+            del self._by_email[email]
+        if cohort is not None:
+            members = self._cohorts.get(cohort, {})
+            members.pop(username, None)
+            if not members:
+                self._cohorts.pop(cohort, None)
+
+    def username_for_id(self, user_id):
+        return self._by_id.get(user_id)
+
+    def by_id(self, user_id):
+        """(username, user) for a user id, or None"""
+        with self._lock:
+            username = self._by_id.get(user_id)
+            if username is None:
+                return None
+            return username, self._users[username]
+
+    def by_email(self, email):
+        """(username, user) for an email address, or None"""
+        with self._lock:
+            username = self._by_email.get((email or '').lower())
+            if username is None:
+                return None
+            return username, self._users[username]
+
+    def cohorts(self):
+        """The (course, year) pairs that have students"""
+        with self._lock:
+            return sorted(self._cohorts)
+
+    def students(self, course=None, year=None):
+        """(username, user) pairs for students, optionally one course and/or year"""
+        with self._lock:
+            if course is not None and year is not None:
+                usernames = list(self._cohorts.get((course, year), ()))
+            else:
+                usernames = [
+                    username
+                    for (cohort_course, cohort_year), members in self._cohorts.items()
+                    if (course is None or cohort_course == course) and (year is None or cohort_year == year)
+                    for username in members
+                ]
+            return [(username, self._users[username]) for username in usernames]
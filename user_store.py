@@ -0,0 +1,137 @@
+"""
+Persistence for the EduPay users store.
+
+Changed records are marked dirty and flushed together by a background
+thread. Each flush appends only the dirty records to a compact journal; once
+the journal grows past a threshold the full store is written as a compact
+snapshot through a temp file and an atomic rename.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+COMPACT = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+class UserStore:
+    def __init__(self, path, flush_delay=0.5, compact_after=500):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.flush_delay = flush_delay
+        self.compact_after = compact_after
+        self.users = {}
+        self._dirty = set()
+        self._journal_entries = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def load(self):
+        """Load the snapshot, replay the journal and return the users dict"""
+        users = {}
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    users = json.load(f)
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            username, record = json.loads(line)
+                        except ValueError:
+                            # A torn final line from a crash mid-append
+                            break
+                        if record is None:
+                            users.pop(username, None)
+                        else:
+                            users[username] = record
+                        self._journal_entries += 1
+        except Exception as e:
+            print(f"Error loading user data: {e}")
+        self.users = users
+        return users
+
+    def mark_dirty(self, username):
+        """Queue a user record for the next background flush"""
+        with self._lock:
+            self._dirty.add(username)
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def flush(self):
+        """Write pending changes now, on the calling thread"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        entries = []
+        for username in dirty:
+            record = self.users.get(username)
+            entries.append(json.dumps([username, record], **COMPACT))
+        with self._io_lock:
+            try:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(entries) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._journal_entries += len(entries)
+                if self._journal_entries >= self.compact_after:
+                    self._write_snapshot()
+            except Exception as e:
+                print(f"Error saving user data: {e}")
+                with self._lock:
+                    self._dirty.update(dirty)
+
+    def snapshot(self):
+        """Write the full store atomically and reset the journal"""
+        with self._io_lock:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.users-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(dict(self.users), f, **COMPACT)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        # The snapshot now contains everything the journal recorded
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+
+    def close(self):
+        """Stop the flush thread and persist anything still pending"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='user-store-flush', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            # Let a burst of changes pile up so they go out in one write
+            time.sleep(self.flush_delay)
+            self.flush()